@@ -0,0 +1,83 @@
+"""
+Startup benchmark for the container registry.
+
+Each measurement runs in a fresh interpreter, so module imports aren't
+cached between them.  Reports the time to import the containers module
+(which only indexes the container files), to load the first container
+(which parses one file), to load every container, which is what
+importing the module used to cost, and to load the legacy containers
+file.  The definition cache is kept in a temporary file for the runs;
+pass --no-cache to parse every file each time instead.
+
+    python benchmarks/container_registry.py --repeat 5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = """
+import json, time
+start = time.perf_counter()
+from labsuite.labware import containers
+imported = time.perf_counter()
+containers.load_container('microplate.96')
+first = time.perf_counter()
+for name in containers.list_containers():
+    containers.load_container(name)
+every = time.perf_counter()
+containers.load_legacy_containers_file()
+legacy = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - start,
+    'first_load_seconds': first - imported,
+    'all_loaded_seconds': every - imported,
+    'legacy_seconds': legacy - every,
+    'containers': len(containers.list_containers())
+}))
+"""
+
+
+def measure(cache_file=None):
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    env = dict(os.environ)
+    env['LABSUITE_CACHE'] = cache_file or ''
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p]
+    )
+    out = subprocess.check_output([sys.executable, '-c', SCRIPT], env=env)
+    return json.loads(out.decode('utf-8'))
+
+
+def run(repeat, cache=True):
+    """ Returns the best of `repeat` runs for each measurement. """
+    folder = tempfile.mkdtemp()
+    cache_file = os.path.join(folder, 'containers.json') if cache else None
+    try:
+        results = [measure(cache_file) for _ in range(repeat)]
+    finally:
+        shutil.rmtree(folder)
+    best = {k: min(r[k] for r in results) for k in results[0]}
+    best['repeat'] = repeat
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-cache', dest='cache', action='store_false')
+    args = parser.parse_args()
+    result = run(args.repeat, cache=args.cache)
+    print("Containers:        {containers}".format(**result))
+    print("Import:            {:.1f}ms".format(
+        result['import_seconds'] * 1000))
+    print("First load:        {:.1f}ms".format(
+        result['first_load_seconds'] * 1000))
+    print("Load everything:   {:.1f}ms".format(
+        result['all_loaded_seconds'] * 1000))
+    print("Legacy file:       {:.1f}ms".format(
+        result['legacy_seconds'] * 1000))
@@ -0,0 +1,76 @@
+"""
+Repeatable throughput benchmark for the motor drivers.
+
+Runs a synthetic plate-to-plate protocol through the MotorControlHandler
+with a FirmwareSimulator on the other end of the connection, and reports
+both the simulated robot time and the wall-clock time spent planning in
+Python.  Compare the output before and after a driver change.
+
+    python benchmarks/driver.py --transfers 96
+"""
+
+import argparse
+import time
+
+from labsuite.protocol import Protocol
+from labsuite.drivers.simulator import FirmwareSimulator
+from labsuite.labware.grid import humanize_position
+
+
+def build_protocol(transfers):
+    protocol = Protocol()
+    protocol.add_instrument('B', 'p200')
+    protocol.add_container('A1', 'microplate.96')
+    protocol.add_container('B1', 'microplate.96')
+    protocol.add_container('C1', 'tiprack.p200')
+    protocol.add_container('C2', 'tiprack.p200')
+    protocol.add_container('D1', 'point.trash')
+    protocol.calibrate('A1', x=10, y=10, top=40, bottom=50)
+    protocol.calibrate('B1', x=150, y=10, top=40, bottom=50)
+    protocol.calibrate('C1', x=290, y=10, top=30)
+    protocol.calibrate('C2', x=290, y=110, top=30)
+    protocol.calibrate('D1', x=400, y=200, top=10)
+    protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+    for n in range(transfers):
+        well = humanize_position((n % 8, (n // 8) % 12))
+        # Send the liquid back every other pass so the wells never fill up.
+        if (n // 96) % 2 == 0:
+            protocol.transfer('A1:' + well, 'B1:' + well, ul=100)
+        else:
+            protocol.transfer('B1:' + well, 'A1:' + well, ul=100)
+    return protocol
+
+
+def run(transfers, clearance=False, **model):
+    protocol = build_protocol(transfers)
+    simulator = FirmwareSimulator(**model)
+    motor = protocol.attach_motor()
+    motor.simulate(simulator)
+    motor.plan_clearance(clearance)
+    start = time.perf_counter()
+    protocol.run_all()
+    wall = time.perf_counter() - start
+    return {
+        'transfers': transfers,
+        'lines': simulator.count,
+        'simulated_seconds': simulator.clock,
+        'planning_seconds': wall
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--transfers', type=int, default=96)
+    parser.add_argument('--latency', type=float, default=None)
+    parser.add_argument(
+        '--clearance', action='store_true',
+        help="Only retract as far as needed between moves."
+    )
+    args = parser.parse_args()
+    result = run(
+        args.transfers, clearance=args.clearance, latency=args.latency
+    )
+    print("Transfers:         {transfers}".format(**result))
+    print("G-code lines:      {lines}".format(**result))
+    print("Simulated time:    {simulated_seconds:.2f}s".format(**result))
+    print("Planning time:     {planning_seconds:.3f}s".format(**result))
@@ -0,0 +1,41 @@
+"""
+Benchmark for Protocol.estimate_duration.
+
+Builds the same synthetic plate-to-plate protocol as the driver benchmark
+and reports the estimated robot time along with how long the estimate
+took to compute.
+
+    python benchmarks/duration.py --transfers 50000
+"""
+
+import argparse
+import time
+
+from driver import build_protocol
+
+
+def run(transfers, **model):
+    protocol = build_protocol(transfers)
+    start = time.perf_counter()
+    estimate = protocol.estimate_duration(**model)
+    wall = time.perf_counter() - start
+    return {
+        'transfers': transfers,
+        'moves': estimate.moves,
+        'refills': estimate.refills,
+        'estimated_seconds': estimate.total,
+        'wall_seconds': wall
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--transfers', type=int, default=96)
+    parser.add_argument('--latency', type=float, default=None)
+    args = parser.parse_args()
+    result = run(args.transfers, latency=args.latency)
+    print("Transfers:         {transfers}".format(**result))
+    print("Moves:             {moves}".format(**result))
+    print("Tiprack refills:   {refills}".format(**result))
+    print("Estimated time:    {estimated_seconds:.0f}s".format(**result))
+    print("Estimate took:     {wall_seconds:.3f}s".format(**result))
@@ -0,0 +1,64 @@
+"""
+Benchmark for converting a legacy containers.json library to YAML.
+
+Builds a synthetic library by repeating the containers in the bundled
+legacy_containers.json under new names, then times
+containers.convert_legacy_library with a single process and with a
+process pool.
+
+    python benchmarks/legacy_conversion.py --copies 20 --workers 4
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from labsuite.labware import containers
+
+
+def build_library(folder, copies):
+    with open(containers._legacy_containers_path()) as f:
+        stock = json.load(f)['containers']
+    library = {}
+    for n in range(copies):
+        for name, container in stock.items():
+            library['{}-{}'.format(name, n)] = container
+    path = os.path.join(folder, 'containers.json')
+    with open(path, 'w') as f:
+        json.dump({'containers': library}, f)
+    return path, len(library)
+
+
+def run(copies, workers):
+    folder = tempfile.mkdtemp()
+    try:
+        path, size = build_library(folder, copies)
+        timings = {'containers': size}
+        for label, count in [('serial', 1), ('pool', workers)]:
+            out = os.path.join(folder, label)
+            start = time.perf_counter()
+            report = containers.convert_legacy_library(
+                out, path=path, workers=count
+            )
+            timings[label + '_seconds'] = time.perf_counter() - start
+            timings['failed'] = len(report.failed)
+        return timings
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--copies', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    result = run(args.copies, args.workers)
+    print("Containers:        {containers} ({failed} failed)".format(
+        **result))
+    print("One process:       {:.1f}ms".format(
+        result['serial_seconds'] * 1000))
+    print("Process pool:      {:.1f}ms".format(
+        result['pool_seconds'] * 1000))
@@ -0,0 +1,49 @@
+"""
+Benchmark for the static lint pass.
+
+Builds the same synthetic plate-to-plate protocol as the driver benchmark
+and times Protocol.lint, lint_json on its JSON export, and (to compare)
+estimate_duration, which simulates the whole protocol.
+
+    python benchmarks/lint.py --transfers 50000
+"""
+
+import argparse
+import time
+
+from driver import build_protocol
+from labsuite.protocol.formatters import JSONFormatter
+from labsuite.protocol.lint import lint_json
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(transfers):
+    protocol = build_protocol(transfers)
+    text = protocol.export(JSONFormatter)
+    problems, lint_seconds = timed(protocol.lint)
+    json_problems, json_seconds = timed(lint_json, text)
+    _, simulate_seconds = timed(protocol.estimate_duration)
+    return {
+        'transfers': transfers,
+        'problems': len(problems) + len(json_problems),
+        'lint_seconds': lint_seconds,
+        'json_seconds': json_seconds,
+        'simulate_seconds': simulate_seconds
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--transfers', type=int, default=10000)
+    args = parser.parse_args()
+    result = run(args.transfers)
+    print("Transfers:         {transfers}".format(**result))
+    print("Problems found:    {problems}".format(**result))
+    print("Protocol.lint:     {lint_seconds:.3f}s".format(**result))
+    print("lint_json:         {json_seconds:.3f}s".format(**result))
+    print("estimate_duration: {simulate_seconds:.3f}s".format(**result))
@@ -0,0 +1,48 @@
+"""
+Benchmark for Protocol.bill_of_materials.
+
+Builds the same synthetic plate-to-plate protocol as the driver benchmark
+and times the bill of materials against estimate_duration, which runs
+the whole protocol on the handlers.
+
+    python benchmarks/materials.py --transfers 100000
+"""
+
+import argparse
+import time
+
+from driver import build_protocol
+
+
+def run(transfers, compare=True):
+    protocol = build_protocol(transfers)
+    start = time.perf_counter()
+    bill = protocol.bill_of_materials()
+    wall = time.perf_counter() - start
+    simulate = None
+    if compare:
+        start = time.perf_counter()
+        protocol.estimate_duration()
+        simulate = time.perf_counter() - start
+    return {
+        'transfers': transfers,
+        'tips': sum(bill.tips.values()),
+        'wells': sum(bill.occupancy.values()),
+        'wall_seconds': wall,
+        'simulate_seconds': simulate
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--transfers', type=int, default=10000)
+    parser.add_argument('--no-compare', action='store_true',
+                        help="Skip timing estimate_duration.")
+    args = parser.parse_args()
+    result = run(args.transfers, compare=not args.no_compare)
+    print("Transfers:         {transfers}".format(**result))
+    print("Tips:              {tips}".format(**result))
+    print("Wells used:        {wells}".format(**result))
+    print("Bill took:         {wall_seconds:.3f}s".format(**result))
+    if result['simulate_seconds'] is not None:
+        print("estimate_duration: {simulate_seconds:.3f}s".format(**result))
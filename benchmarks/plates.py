@@ -0,0 +1,130 @@
+"""
+Benchmark for full-plate operations on 96, 384 and 1536 well plates.
+
+For each plate, times visiting every well and every row and column,
+filling every well and transferring it to a second plate, using up a
+tiprack of the same layout one tip at a time, and adding and compiling
+a protocol with a transfer from every well.  The time per well should
+stay flat as plates get denser.
+
+Building the protocol is timed on its own too, with a transfer for
+every well (build) and as a single stamp command (stamp), which should
+take the same time whatever the plate.
+
+    python benchmarks/plates.py --repeat 3
+"""
+
+import argparse
+import time
+
+from labsuite.protocol import Protocol
+from labsuite.labware import containers
+from labsuite.labware.grid import humanize_position
+
+PLATES = ['microplate.96', 'microplate.384', 'microplate.1536']
+
+
+def wells(plate):
+    return [(c, r) for c in range(plate.cols) for r in range(plate.rows)]
+
+
+def grid(name):
+    plate = containers.load_container(name)()
+    for position in wells(plate):
+        plate.get_child(humanize_position(position))
+    for r in range(plate.rows):
+        plate.row(r)
+    for c in range(plate.cols):
+        plate.col(c)
+
+
+def liquid(name):
+    source = containers.load_container(name)()
+    destination = containers.load_container(name)()
+    for position in wells(source):
+        well = source.get_child(position)
+        well.add_named_liquid(2, 'water')
+        well.transfer(1, destination.get_child(position))
+
+
+def tips(name):
+    plate = containers.load_container(name)
+    rack = containers.add_custom_container({
+        'type': 'tiprack', 'rows': plate.rows, 'cols': plate.cols
+    })()
+    while rack.has_tips:
+        rack.get_clean_tip().set_used()
+
+
+def _protocol(name):
+    p = Protocol()
+    p.set_tip_policy('never')
+    p.add_instrument('A', 'p10')
+    p.add_container('A1', name)
+    p.add_container('B1', name)
+    p.add_container('C1', 'tiprack.p10')
+    p.add_container('D1', 'point.trash')
+    for n, slot in enumerate(['A1', 'B1', 'C1', 'D1']):
+        p.calibrate(slot, x=n * 150, y=0, top=10, bottom=20)
+    p.calibrate_instrument('A', top=0, blowout=10, droptip=25)
+    return p
+
+
+def _transfers(name):
+    plate = containers.load_container(name)
+    p = _protocol(name)
+    for position in wells(plate):
+        well = humanize_position(position)
+        p.transfer('A1:' + well, 'B1:' + well, ul=1)
+    return p
+
+
+def build(name):
+    _transfers(name)
+
+
+def stamp(name):
+    _protocol(name).stamp('A1', 'B1', ul=1)
+
+
+def protocol(name):
+    _transfers(name).compile_ir()
+
+
+OPERATIONS = [grid, liquid, tips, build, stamp, protocol]
+
+
+def run(repeat):
+    """ Returns {plate: {operation: best seconds}}. """
+    results = {}
+    for name in PLATES:
+        results[name] = {}
+        for operation in OPERATIONS:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                operation(name)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[name][operation.__name__] = best
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    results = run(args.repeat)
+    print("Best of {} runs; ms (us per well).".format(args.repeat))
+    print("{:<18}{:>7}".format('plate', 'wells') + "".join(
+        "{:>14}".format(o.__name__) for o in OPERATIONS
+    ))
+    for name in PLATES:
+        plate = containers.load_container(name)
+        count = plate.rows * plate.cols
+        print("{:<18}{:>7}".format(name, count) + "".join(
+            "{:>14}".format("{:.1f} ({:.0f})".format(
+                results[name][o.__name__] * 1000,
+                results[name][o.__name__] * 1e6 / count
+            )) for o in OPERATIONS
+        ))
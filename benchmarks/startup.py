@@ -0,0 +1,60 @@
+"""
+Startup benchmark for labsuite.
+
+Reports the time to first Protocol() in a fresh interpreter, and the
+modules that cost the most to import with `import labsuite.protocol`
+(from -X importtime, best of --repeat runs).  With --budget, exits with
+an error if startup takes longer than that many milliseconds, or if one
+of the modules that should only be imported on first use (like serial
+or asyncio) was imported at startup.
+
+    python benchmarks/startup.py --repeat 5 --top 15 --budget 150
+"""
+
+import argparse
+import sys
+
+from labsuite.util import profiling
+
+# Modules which should only be imported when they're used.
+LAZY_MODULES = ('asyncio', 'serial', 'yaml', 'logging', 'pickle')
+
+
+def run(repeat):
+    seconds = profiling.startup_time(repeat=repeat)
+    _, modules = profiling.run_startup()
+    times = profiling.import_times('labsuite.protocol', repeat=repeat)
+    return {
+        'startup_seconds': seconds,
+        'eager': [m for m in LAZY_MODULES if m in modules],
+        'imports': times
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--budget', type=float, default=None,
+                        help="Fail if startup takes longer (ms).")
+    args = parser.parse_args()
+    result = run(args.repeat)
+    startup = result['startup_seconds'] * 1000
+    print("First Protocol():  {:.1f}ms".format(startup))
+    print("Imported eagerly:  {}".format(
+        ', '.join(result['eager']) or 'none'))
+    print("")
+    print("{:>10} {:>10}  module".format('self ms', 'total ms'))
+    slowest = sorted(
+        result['imports'].values(), key=lambda t: t.self_us, reverse=True
+    )
+    for item in slowest[:args.top]:
+        print("{:>10.2f} {:>10.2f}  {}".format(
+            item.self_us / 1000, item.cumulative_us / 1000, item.module))
+    if args.budget is not None:
+        if startup > args.budget:
+            sys.exit("Startup took {:.1f}ms, over the {:.1f}ms budget.".format(
+                startup, args.budget))
+        if result['eager']:
+            sys.exit("Imported at startup: {}".format(
+                ', '.join(result['eager'])))
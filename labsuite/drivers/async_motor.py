@@ -0,0 +1,345 @@
+"""
+Asyncio counterparts to the serial drivers in labsuite.drivers.motor.
+
+The synchronous drivers block on the serial port after every line they
+write, which stalls anything else running in the same process while the
+robot moves.  The driver in this module queues G-code as it's generated
+and hands it to a background task which writes each line and waits for
+the controller's acknowledgement without blocking the event loop.
+
+The byte-level connection is provided by a pluggable transport, so the
+same driver can talk to a real serial port, a local PTY, or an in-memory
+stand-in for testing:
+
+>>> transport = MemoryTransport()
+>>> protocol.attach_motor(transport=transport)
+>>> async for current, total in protocol.run_async():
+...     print("Sent command {} of {}".format(current, total))
+"""
+
+import asyncio
+import os
+from collections import deque
+
+from labsuite.drivers.motor import OpenTrons
+from labsuite.util import log
+
+
+class Transport():
+
+    """
+    Interface that all async transports should support.
+
+    Transports deal in raw bytes; the driver is in charge of framing and
+    interpreting responses.
+    """
+
+    is_open = False
+
+    async def open(self):
+        self.is_open = True
+
+    async def write(self, data):
+        raise NotImplementedError()
+
+    async def readline(self):
+        raise NotImplementedError()
+
+    def close(self):
+        self.is_open = False
+
+
+class MemoryTransport(Transport):
+
+    """
+    In-process stand-in for a serial connection.
+
+    Every line written is stored in `written` and passed to the responder,
+    which returns a list of lines to send back to the driver.  By default
+    the responder acknowledges every line with 'ok'.
+    """
+
+    written = None  # [] Every line written, newline stripped.
+
+    _responder = None
+    _responses = None  # deque of pending response lines.
+    _ready = None  # asyncio.Event, set when there's something to read.
+
+    def __init__(self, responder=None):
+        self.written = []
+        self._responses = deque()
+        self._responder = responder or (lambda line: ['ok'])
+
+    async def open(self):
+        self._ready = asyncio.Event()
+        self.is_open = True
+
+    async def write(self, data):
+        if self.is_open is False:
+            raise IOError("Connection not open.")
+        line = data.decode().strip()
+        self.written.append(line)
+        self._responses.extend(self._responder(line))
+        if self._responses:
+            self._ready.set()
+
+    async def readline(self):
+        while not self._responses:
+            self._ready.clear()
+            await self._ready.wait()
+        return (self._responses.popleft() + "\n").encode()
+
+
+class PTYTransport(Transport):
+
+    """
+    Talks to a character device (such as the slave end of a PTY) through
+    non-blocking file descriptors registered with the event loop.
+
+    This is mostly useful for pointing the driver at a simulator or
+    socat bridge running in another process.  For USB serial devices,
+    use SerialTransport so the port is configured properly.
+    """
+
+    path = None
+
+    _fd = None
+    _buffer = None  # bytearray of data read but not yet returned.
+    _ready = None  # asyncio.Event, set when new data has arrived.
+
+    def __init__(self, path):
+        self.path = path
+        self._buffer = bytearray()
+
+    async def open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        if os.isatty(self._fd):
+            import tty
+            tty.setraw(self._fd)
+        self._ready = asyncio.Event()
+        asyncio.get_event_loop().add_reader(self._fd, self._on_readable)
+        self.is_open = True
+        log.debug("PTY", "Opened {}".format(self.path))
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        self._buffer.extend(data)
+        self._ready.set()
+
+    async def write(self, data):
+        if self.is_open is False:
+            raise IOError("Connection not open.")
+        view = memoryview(data)
+        while view:
+            try:
+                n = os.write(self._fd, view)
+            except BlockingIOError:
+                await asyncio.sleep(0.001)
+                continue
+            view = view[n:]
+
+    async def readline(self):
+        while b'\n' not in self._buffer:
+            self._ready.clear()
+            await self._ready.wait()
+        i = self._buffer.index(b'\n') + 1
+        line = bytes(self._buffer[:i])
+        del self._buffer[:i]
+        return line
+
+    def close(self):
+        if self._fd is not None:
+            asyncio.get_event_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        self.is_open = False
+
+
+class SerialTransport(Transport):
+
+    """
+    Wraps a pyserial connection, running its blocking calls in the event
+    loop's default executor.
+    """
+
+    port = None
+    connection = None
+
+    _options = None
+
+    def __init__(self, port, **options):
+        self.port = port
+        self._options = options
+
+    async def open(self):
+        import serial
+        loop = asyncio.get_event_loop()
+        self.connection = await loop.run_in_executor(
+            None, lambda: serial.Serial(port=self.port, **self._options)
+        )
+        self.is_open = True
+        log.debug("Serial", "Connected to {}".format(self.port))
+
+    async def write(self, data):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.connection.write, data)
+
+    async def readline(self):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.connection.readline)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.is_open = False
+
+
+class AsyncOpenTrons(OpenTrons):
+
+    """
+    OpenTrons driver which queues G-code instead of writing it inline.
+
+    The handlers run synchronously and call move() as usual; the lines are
+    buffered and written by a background task.  Command boundaries are
+    recorded with mark(), and throttle() lets the caller keep a bounded
+    number of protocol commands in flight.  This is what lets serial waits
+    overlap with the simulation of the next command.
+    """
+
+    transport = None
+
+    _outbox = None  # deque of (line, wait_for_stat) waiting to be written.
+    _queued = 0  # Number of lines queued since the driver was created.
+    _completed = 0  # Number of lines acknowledged by the controller.
+    _marks = None  # deque of _queued values at each command boundary.
+    _task = None  # Background writer task.
+    _started = None  # Future resolved once the transport is open.
+    _wakeup = None  # asyncio.Event; set when the outbox has new lines.
+    _progress = None  # asyncio.Event; set when a line is acknowledged.
+
+    def __init__(self, transport, stat=True, **kwargs):
+        """
+        If stat is True, the firmware's debug mode is turned on and every
+        line waits for a stat response rather than the next line of
+        output.  Turn it off for controllers (or stand-ins) that only
+        acknowledge with 'ok'.
+        """
+        super(AsyncOpenTrons, self).__init__(**kwargs)
+        self.transport = transport
+        self._outbox = deque()
+        self._marks = deque()
+        if stat:
+            self.wait_for_stat()
+
+    async def connect(self):
+        """
+        Opens the transport and starts the writer task.
+
+        Calling this is optional; the first throttle() or drain() will do
+        it for you.
+        """
+        self._ensure_started()
+        await self._started
+
+    def _ensure_started(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._progress = asyncio.Event()
+        self._started = asyncio.Future()
+        self._task = asyncio.ensure_future(self._write_loop())
+
+    def write_to_serial(self, data, **kwargs):
+        """
+        Queues a line for the writer task.  Never blocks.
+        """
+        log.debug("Serial", "Queue: {}".format(str(data).encode()))
+        stat = self._wait_for_stat is True and self._stat_command is not None
+        self._outbox.append((data, stat))
+        self._queued += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def mark(self):
+        """
+        Records the end of a protocol command in the outgoing stream.
+        """
+        self._marks.append(self._queued)
+
+    @property
+    def pending(self):
+        """
+        Number of queued lines that haven't been acknowledged yet.
+        """
+        return self._queued - self._completed
+
+    async def throttle(self, depth=1):
+        """
+        Waits until no more than `depth` marked commands are still waiting
+        for acknowledgement from the controller.
+        """
+        self._ensure_started()
+        while len(self._marks) > depth:
+            await self._wait_for(self._marks[0])
+            self._marks.popleft()
+
+    async def drain(self):
+        """
+        Waits until every queued line has been acknowledged.
+        """
+        self._ensure_started()
+        await self._wait_for(self._queued)
+        self._marks.clear()
+
+    async def _wait_for(self, count):
+        while self._completed < count:
+            if self._task.done():
+                self._task.result()  # Raise whatever killed the writer.
+                raise IOError("Writer stopped before queue was drained.")
+            self._progress.clear()
+            await self._progress.wait()
+
+    async def _write_loop(self):
+        try:
+            await self.transport.open()
+        except Exception as e:
+            self._started.set_exception(e)
+            self._progress.set()
+            raise
+        self._started.set_result(True)
+        try:
+            while True:
+                while not self._outbox:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                data, stat = self._outbox.popleft()
+                log.debug("Serial", "Write: {}".format(str(data).encode()))
+                await self.transport.write(str(data).encode())
+                await self._read_response(stat)
+                self._completed += 1
+                self._progress.set()
+        finally:
+            self._progress.set()
+
+    async def _read_response(self, stat):
+        count = 0
+        while True:
+            count += 1
+            out = (await self.transport.readline()).decode().strip()
+            log.debug("Serial", "Read: {}".format(out))
+            if stat is False or out == self._stat_command:
+                return out
+            if count == 1 or count % 10 == 0:
+                log.debug(
+                    "Serial",
+                    "Waiting {} lines for stat ({})."
+                    .format(count, self._stat_command)
+                )
+
+    def disconnect(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self.transport.close()
@@ -0,0 +1,190 @@
+"""
+Ahead-of-time compiled G-code files.
+
+Protocol.compile_gcode runs a calibrated protocol through the motor
+handler once and writes the G-code to a file instead of a serial port.
+Each protocol command is preceded by a marker comment, and the file
+starts with a header recording what it was compiled from:
+
+    ; labsuite-gcode 2
+    ; protocol 3f2a...
+    ; calibration 9bc1...
+    ; commands 2
+    ; command 0
+    G90
+    G0 X10 Y20
+    ...
+    ; command 1
+    ...
+    ; reuses B
+
+Executing the file streams it in chunks, so files of any size can be
+sent without reading them into memory, and a run that faulted can be
+resumed from the start of a command.  Under a tip policy other than
+'always', a command can reuse a tip kept from an earlier one; it ends
+with a note of the axes it did so on, and can't be resumed from, since
+the robot would be homed without that tip.
+"""
+
+from labsuite.util import log
+from labsuite.util import exceptions as x
+
+FORMAT = 'labsuite-gcode'
+VERSION = 2
+
+MARKER = '; command '
+REUSES = '; reuses '
+
+
+class GCodeWriter():
+
+    """
+    Serial-like connection that writes G-code to a file object.
+
+    Call mark() at the start of each protocol command to write a command
+    marker, and reuses() at the end of one that reused a tip kept from
+    an earlier command.
+    """
+
+    commands = 0  # Number of command markers written.
+
+    _file = None
+
+    def __init__(self, file, **header):
+        """
+        Keyword arguments are written to the header as '; key value'.
+        """
+        self._file = file
+        file.write("; {} {}\n".format(FORMAT, VERSION))
+        for key in sorted(header):
+            file.write("; {} {}\n".format(key, header[key]))
+
+    def mark(self):
+        self._file.write("{}{}\n".format(MARKER, self.commands))
+        self.commands += 1
+
+    def reuses(self, axes):
+        if axes:
+            self._file.write("{}{}\n".format(REUSES, " ".join(axes)))
+
+    def isOpen(self):
+        return True
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        for line in data.splitlines():
+            line = line.strip()
+            if line:
+                self._file.write(line + "\n")
+
+    def readline(self):
+        return b'ok'
+
+
+def read_header(path):
+    """
+    Returns the header of a compiled G-code file as a dict, or None if
+    the file wasn't written by GCodeWriter.
+    """
+    header = {}
+    try:
+        with open(path) as f:
+            first = f.readline().split()
+            if first != [';', FORMAT, str(VERSION)]:
+                return None
+            for line in f:
+                if not line.startswith('; ') or line.startswith(MARKER):
+                    break
+                key, _, value = line[2:].strip().partition(' ')
+                header[key] = value
+    except (IOError, UnicodeDecodeError):
+        return None
+    return header
+
+
+def read_lines(path, chunk_size=65536):
+    """
+    Yields the lines of a file, reading it `chunk_size` bytes at a time.
+    """
+    with open(path) as f:
+        rest = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (rest + chunk).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line
+        if rest:
+            yield rest
+
+
+def resume_point(path, start):
+    """
+    Returns the index of the latest command, at or before `start`, which
+    doesn't reuse a tip kept from an earlier command, so a run can be
+    resumed from it.  Only the file up to that command is read.
+    """
+    current = None
+    unsafe = set()
+    for line in read_lines(path):
+        if line.startswith(MARKER):
+            current = int(line[len(MARKER):])
+            if current > start:
+                break
+        elif line.startswith(REUSES) and current is not None:
+            unsafe.add(current)
+    while start > 0 and start in unsafe:
+        start -= 1
+    return start
+
+
+def check_resume(start, point):
+    """
+    Raises ResumeUnsafe if a run can't be resumed from `start`, given
+    the resume point found for it.
+    """
+    if point != start:
+        raise x.ResumeUnsafe(
+            "Command {} reuses a tip kept from an earlier command; "
+            "resume from command {} instead.".format(start, point)
+        )
+
+
+def stream_gcode(driver, path, start=0, chunk_size=65536):
+    """
+    Sends a compiled G-code file to the given driver, starting at the
+    marker for command index `start`.
+
+    This is a generator which yields the index of each command as it
+    begins; if the run faults, pass the last index yielded as `start` to
+    pick up where it left off.  When resuming, the robot is homed first,
+    and ResumeUnsafe is raised if the command would need a tip it no
+    longer has (see resume_point).
+    """
+    current = None
+    if start:
+        check_resume(start, resume_point(path, start))
+        driver.home()
+    driver.send_command(driver.ABSOLUTE_POSITIONING)
+    for line in read_lines(path, chunk_size=chunk_size):
+        line = line.strip()
+        if line.startswith(MARKER):
+            current = int(line[len(MARKER):])
+            if current >= start:
+                yield current
+            continue
+        if not line or line.startswith(';'):
+            continue
+        if current is None or current < start:
+            continue
+        log.debug("GCode", "Command {}: {}".format(current, line))
+        driver.send_command(line)
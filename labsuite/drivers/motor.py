@@ -1,5 +1,5 @@
-import serial
 import time
+from collections import deque
 from labsuite.util import log
 
 
@@ -15,8 +15,14 @@ class GCodeLogger():
 
     write_buffer = None
 
-    def __init__(self):
-        self.write_buffer = []
+    def __init__(self, maxlen=None):
+        """
+        If maxlen is set, only the most recent lines are kept.
+        """
+        if maxlen:
+            self.write_buffer = deque(maxlen=maxlen)
+        else:
+            self.write_buffer = []
 
     def isOpen(self):
         return True
@@ -87,6 +93,7 @@ class CNCDriver(object):
         self.command_queue = []
 
     def connect(self, device=None, port=None):
+        import serial  # Only needed with a robot attached.
         self.connection = serial.Serial(port=device or port)
         self.connection.close()
         self.connection.open()
@@ -233,9 +240,9 @@ class CNCDriver(object):
         self.home()
         self.send_command(self.UNITS_TO_MILLIMETERS)
         self.send_command(self.ABSOLUTE_POSITIONING)
-        lines = open(filename).readlines()
-        for l in lines:
-            self.send_command(l)
+        with open(filename) as lines:  # Streamed; files can be large.
+            for l in lines:
+                self.send_command(l)
 
 
 class OpenTrons(CNCDriver):
@@ -258,19 +265,30 @@ class MoveLogger(CNCDriver):
     testing.
     """
 
-    movements = []
+    movements = None  # [] Or a sink from drivers.movelog.
 
-    def __init__(self):
-        self.movements = []
+    def __init__(self, connection=None, sink=None):
+        """
+        Moves are written to a GCodeLogger, unless another serial-like
+        connection (such as a FirmwareSimulator) is provided.
+
+        Moves are kept in a list by default; for long runs, pass a compact
+        sink such as a MoveRing or MoveFile (see drivers.movelog).
+        """
+        self.movements = [] if sink is None else sink
         self.motor = OpenTrons()
         self.motor._wait_for_stat = False
-        self.motor.connection = GCodeLogger()
+        self.motor.connection = connection or GCodeLogger()
 
     def move(self, **kwargs):
         kwargs = dict((k.lower(), v) for k, v in kwargs.items())
         self.movements.append(kwargs)
         self.motor.move(**kwargs)
 
+    def write_to_serial(self, data, **kwargs):
+        """ Raw commands go straight through to the connection. """
+        return self.motor.write_to_serial(data, **kwargs)
+
     def isOpen(self):
         return True
 
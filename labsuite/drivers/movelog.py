@@ -0,0 +1,236 @@
+"""
+Compact storage for the moves recorded by MoveLogger.
+
+By default MoveLogger keeps every move as a dict in a list, which is fine
+for tests but adds up to millions of objects on a long simulated run.
+The sinks in this module store each move as a fixed-size binary record
+instead: a bitmask of the axes present followed by a double for each of
+the X, Y, Z, A and B axes (41 bytes a move).
+
+* MoveRing keeps the most recent moves in a preallocated buffer.
+* MoveFile appends every move to a file in buffered chunks, and
+  MoveFileReader pages through it with mmap without loading it all.
+
+>>> sink = MoveFile('run.moves')
+>>> protocol.attach_motor().simulate(sink=sink)
+>>> protocol.run_all()
+>>> sink.close()
+>>> moves = MoveFileReader('run.moves')
+>>> moves[1000:1010]
+"""
+
+import mmap
+import os
+import struct
+
+AXES = ('x', 'y', 'z', 'a', 'b')
+
+RECORD = struct.Struct('<B5d')
+
+MAGIC = b'LSMOVES\x01'  # File signature, including format version.
+
+
+def pack_move(move):
+    """
+    Packs a move ({axis: position}) into a binary record.
+    """
+    mask = 0
+    values = [0.0] * len(AXES)
+    for axis, value in move.items():
+        try:
+            i = AXES.index(axis.lower())
+        except ValueError:
+            raise ValueError(
+                "Axis {} can't be stored in a move log.".format(axis)
+            )
+        mask |= 1 << i
+        values[i] = value
+    return RECORD.pack(mask, *values)
+
+
+def unpack_move(data, offset=0):
+    """
+    Unpacks the binary record at the given offset into a move dict.
+    """
+    mask, *values = RECORD.unpack_from(data, offset)
+    return {
+        axis: values[i]
+        for i, axis in enumerate(AXES)
+        if mask & (1 << i)
+    }
+
+
+class MoveSequence():
+
+    """
+    Read-only sequence protocol shared by the sinks; subclasses provide
+    __len__ and _read(index).
+    """
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def _read(self, index):
+        raise NotImplementedError()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._read(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Move index out of range.")
+        return self._read(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._read(i)
+
+    def page(self, start, count):
+        """
+        Returns up to `count` moves starting at index `start`.
+        """
+        return self[start:start + count]
+
+
+class MoveRing(MoveSequence):
+
+    """
+    Keeps the last `capacity` moves in a preallocated buffer.  Older moves
+    are overwritten; `total` counts every move ever appended.
+    """
+
+    capacity = None
+    total = 0
+
+    _buffer = None  # bytearray of capacity records.
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1.")
+        self.capacity = capacity
+        self._buffer = bytearray(RECORD.size * capacity)
+
+    def append(self, move):
+        offset = (self.total % self.capacity) * RECORD.size
+        self._buffer[offset:offset + RECORD.size] = pack_move(move)
+        self.total += 1
+
+    @property
+    def dropped(self):
+        """ Number of moves that have been overwritten. """
+        return max(0, self.total - self.capacity)
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def _read(self, index):
+        start = self.dropped
+        offset = ((start + index) % self.capacity) * RECORD.size
+        return unpack_move(self._buffer, offset)
+
+
+class MoveFile():
+
+    """
+    Appends moves to a file as binary records, writing in chunks of
+    `chunk_size` records.
+
+    Call flush() before reading the file from elsewhere, and close() when
+    the run is done.
+    """
+
+    path = None
+    chunk_size = 4096
+    total = 0
+
+    _file = None
+    _chunk = None  # bytearray of records waiting to be written.
+
+    def __init__(self, path, chunk_size=None):
+        """
+        Creates (or truncates) the file at the given path.
+        """
+        self.path = path
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._file.flush()
+        self._chunk = bytearray()
+
+    def append(self, move):
+        self._chunk += pack_move(move)
+        self.total += 1
+        if len(self._chunk) >= self.chunk_size * RECORD.size:
+            self.flush()
+
+    def __len__(self):
+        return self.total
+
+    def flush(self):
+        if self._chunk:
+            self._file.write(self._chunk)
+            self._chunk = bytearray()
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def reader(self):
+        """
+        Flushes pending moves and returns a MoveFileReader for the file.
+        """
+        self.flush()
+        return MoveFileReader(self.path)
+
+
+class MoveFileReader(MoveSequence):
+
+    """
+    Random access to a file written by MoveFile.  The file is memory
+    mapped, so only the pages that are read are loaded.
+    """
+
+    path = None
+
+    _file = None
+    _map = None
+    _count = 0
+
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path)
+        self._file = open(path, 'rb')
+        if size > len(MAGIC):
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+            header = self._map[:len(MAGIC)]
+        else:
+            header = self._file.read()
+        if header != MAGIC:
+            self.close()
+            raise ValueError("{} is not a move log.".format(path))
+        self._count = (size - len(MAGIC)) // RECORD.size
+
+    def __len__(self):
+        return self._count
+
+    def _read(self, index):
+        return unpack_move(self._map, len(MAGIC) + index * RECORD.size)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
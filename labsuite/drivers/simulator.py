@@ -0,0 +1,376 @@
+"""
+A simulated OpenTrons motor controller.
+
+The simulator parses the G-code the drivers send, keeps track of where
+each axis is, and answers the way the firmware does ('ok', plus a stat
+line when debug mode is on).  Each command is also timed against a simple
+kinematic model (per-axis velocity and acceleration, plus a fixed serial
+latency per line), which gives us a repeatable clock for benchmarking
+driver changes without the robot.
+
+It can be reached three ways:
+
+* Directly, as a serial-like connection for the synchronous drivers:
+
+  >>> sim = FirmwareSimulator()
+  >>> protocol.attach_motor().simulate(sim)
+  >>> protocol.run_all()
+  >>> sim.clock  # Simulated seconds.
+
+* As an in-process asyncio transport (see drivers.async_motor):
+
+  >>> protocol.attach_motor(transport=SimulatorTransport(sim))
+
+* As a PTY, for anything that expects a serial device path:
+
+  >>> pty = SimulatorPTY(sim).start()
+  >>> protocol.attach_motor(pty.port)
+"""
+
+import asyncio
+import math
+import os
+import select
+import threading
+from collections import deque
+
+from labsuite.drivers.async_motor import Transport
+
+
+def axis_time(distance, velocity, acceleration):
+    """
+    Returns the time in seconds it takes a single axis to travel the given
+    distance with a trapezoidal velocity profile (accelerate, cruise,
+    decelerate).  Short moves never reach cruising speed.
+
+    >>> axis_time(100, 50, 100)
+    2.5
+    """
+    distance = abs(distance)
+    if distance == 0:
+        return 0.0
+    if acceleration is None:
+        return distance / velocity
+    ramp = velocity * velocity / acceleration  # Accelerate + decelerate.
+    if distance >= ramp:
+        return distance / velocity + velocity / acceleration
+    return 2 * math.sqrt(distance / acceleration)
+
+
+class MotionModel():
+
+    """
+    Per-axis velocity (mm/s) and acceleration (mm/s^2) of the robot, plus
+    the time it takes for one line to cross the serial port and be
+    acknowledged.
+
+    Axes move simultaneously, so a move takes as long as its slowest axis.
+    """
+
+    # Rough figures for an OT-One; override them for your machine.
+    AXES = {
+        'x': (150, 1000),
+        'y': (150, 1000),
+        'z': (50, 500),
+        'a': (20, 200),
+        'b': (20, 200)
+    }
+
+    latency = 0.005
+
+    _axes = None  # {axis: (velocity, acceleration)}
+
+    def __init__(self, axes=None, latency=None):
+        self._axes = dict(self.AXES)
+        for axis, limits in (axes or {}).items():
+            self._axes[axis.lower()] = limits
+        if latency is not None:
+            self.latency = latency
+
+    def axis_limits(self, axis):
+        return self._axes.get(axis.lower(), self._axes['x'])
+
+    def move_time(self, position, target, feedrate=None):
+        """
+        Returns the time to move from the current position to the target
+        position (both dicts of axis values).  Axes missing from the
+        target don't move.
+
+        The feedrate (mm/s) caps the velocity of every axis.
+        """
+        slowest = 0.0
+        axes = self._axes
+        for axis, value in target.items():
+            distance = value - position.get(axis, 0)
+            if not distance:
+                continue
+            if axis in axes:
+                velocity, acceleration = axes[axis]
+            else:
+                velocity, acceleration = self.axis_limits(axis)
+            if feedrate:
+                velocity = min(velocity, feedrate)
+            t = axis_time(distance, velocity, acceleration)
+            if t > slowest:
+                slowest = t
+        return slowest
+
+
+class FirmwareSimulator():
+
+    """
+    Pretends to be the OpenTrons motor controller on the other end of a
+    serial port.
+
+    The serial-like methods (write, readline, isOpen) let it stand in for
+    a pyserial connection on the synchronous drivers.  For everything
+    else, handle() takes a single line of G-code and returns the response
+    lines along with the simulated duration of the command.
+    """
+
+    STAT = '{"stat":0}'
+
+    model = None
+
+    position = None  # {axis: position}
+    absolute = True
+    debug = False
+    halted = False
+
+    clock = 0.0  # Total simulated seconds.
+    count = 0  # Number of lines handled.
+    last_duration = 0.0
+
+    history = None  # [(line, duration, clock)] if recording is enabled.
+
+    _responses = None  # deque of lines waiting to be read.
+    _open = True
+
+    def __init__(self, model=None, record=False, **kwargs):
+        """
+        Keyword arguments are passed on to MotionModel if no model is
+        given.  Set record to True to keep a timeline of every command
+        in `history`.
+        """
+        self.model = model or MotionModel(**kwargs)
+        self.position = {}
+        self._responses = deque()
+        if record:
+            self.history = []
+
+    def handle(self, line):
+        """
+        Executes one line of G-code and returns the response lines and the
+        simulated number of seconds it took.
+        """
+        words = self._parse(line)
+        debug = self.debug  # M62 itself is acknowledged without a stat.
+        duration = self.model.latency
+        if words:
+            code, args = words[0], dict(words[1:])
+            method = getattr(self, '_' + code, None)
+            if method is not None and not (self.halted and code != 'M999'):
+                duration += method(args) or 0.0
+        self.clock += duration
+        self.count += 1
+        self.last_duration = duration
+        if self.history is not None:
+            self.history.append((line.strip(), duration, self.clock))
+        responses = ['ok']
+        if debug:
+            responses.append(self.STAT)
+        return responses, duration
+
+    def _parse(self, line):
+        """
+        Splits a line of G-code into words, ie 'G0 X10 Y2.5' becomes
+        ['G0', ('x', 10.0), ('y', 2.5)].  Comments are ignored.
+        """
+        line = line.split(';', 1)[0].strip()
+        if not line:
+            return []
+        words = line.split()
+        out = [words[0].upper()]
+        for w in words[1:]:
+            try:
+                out.append((w[0].lower(), float(w[1:])))
+            except ValueError:
+                continue  # Anything we don't understand is ignored.
+        return out
+
+    def _move(self, args):
+        feedrate = args.pop('f', None)
+        if feedrate:
+            feedrate = feedrate / 60  # mm/min to mm/s.
+        if self.absolute:
+            target = args
+        else:
+            target = {
+                axis: self.position.get(axis, 0) + value
+                for axis, value in args.items()
+            }
+        duration = self.model.move_time(self.position, target, feedrate)
+        self.position.update(target)
+        return duration
+
+    _G0 = _move
+    _G1 = _move
+
+    def _G4(self, args):
+        """ Dwell for P milliseconds or S seconds. """
+        return args.get('p', 0) / 1000 + args.get('s', 0)
+
+    def _G28(self, args):
+        axes = args or {k: 0 for k in self.position}
+        target = {axis: 0 for axis in axes}
+        duration = self.model.move_time(self.position, target)
+        self.position.update(target)
+        return duration
+
+    def _G90(self, args):
+        self.absolute = True
+
+    def _G91(self, args):
+        self.absolute = False
+
+    def _G92(self, args):
+        self.position.update(args)
+
+    def _M62(self, args):
+        self.debug = True
+
+    def _M63(self, args):
+        self.debug = False
+
+    def _M112(self, args):
+        self.halted = True
+
+    def _M999(self, args):
+        self.halted = False
+
+    def isOpen(self):
+        return self._open
+
+    def open(self):
+        self._open = True
+
+    def close(self):
+        self._open = False
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        for line in data.splitlines():
+            if line.strip():
+                responses, _ = self.handle(line)
+                self._responses.extend(responses)
+
+    def readline(self):
+        if not self._responses:
+            return b''  # Mimic a serial read timeout.
+        return (self._responses.popleft() + "\r\n").encode()
+
+    def read(self, size=1):
+        return self.readline()[:size]
+
+
+class SimulatorTransport(Transport):
+
+    """
+    Async transport (see drivers.async_motor) connected directly to a
+    FirmwareSimulator.
+
+    If realtime is set, each response is delayed by the simulated duration
+    of the command, scaled by the given factor (1 is real time).
+    """
+
+    simulator = None
+    realtime = None
+
+    _responses = None
+    _ready = None
+
+    def __init__(self, simulator=None, realtime=None):
+        self.simulator = simulator or FirmwareSimulator()
+        self.realtime = realtime
+        self._responses = deque()
+
+    async def open(self):
+        self._ready = asyncio.Event()
+        self.is_open = True
+
+    async def write(self, data):
+        for line in data.decode().splitlines():
+            if not line.strip():
+                continue
+            responses, duration = self.simulator.handle(line)
+            if self.realtime:
+                await asyncio.sleep(duration * self.realtime)
+            self._responses.extend(responses)
+        self._ready.set()
+
+    async def readline(self):
+        while not self._responses:
+            self._ready.clear()
+            await self._ready.wait()
+        return (self._responses.popleft() + "\r\n").encode()
+
+
+class SimulatorPTY():
+
+    """
+    Serves a FirmwareSimulator on a pseudo-terminal from a background
+    thread.  The `port` attribute is the device path to connect to.
+    """
+
+    simulator = None
+    port = None
+
+    _master = None
+    _slave = None
+    _thread = None
+    _running = False
+
+    def __init__(self, simulator=None):
+        self.simulator = simulator or FirmwareSimulator()
+
+    def start(self):
+        self._master, self._slave = os.openpty()
+        try:
+            import tty
+            tty.setraw(self._slave)
+        except ImportError:
+            pass
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def _serve(self):
+        buf = b''
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                buf += os.read(self._master, 4096)
+            except OSError:
+                return
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                line = line.decode().strip()
+                if not line:
+                    continue
+                responses, _ = self.simulator.handle(line)
+                out = ''.join(r + "\r\n" for r in responses)
+                os.write(self._master, out.encode())
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(1)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
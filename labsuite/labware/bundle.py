@@ -0,0 +1,273 @@
+"""
+Compiles a directory of container files into a single definition bundle.
+
+Container files loaded one at a time (see containers.load_custom_containers)
+are only checked as their containers are built, so a broken file isn't
+noticed until one of its containers is used, and then only its first
+mistake is reported.  compile_containers reads a whole directory at once,
+checks every file against SCHEMA and collects every problem it finds,
+merges subsets into complete definitions, and returns a Bundle: the list
+of definitions and an index from each container name (and legacy name)
+to its definition.
+
+Saved with Bundle.save, a bundle is a compact JSON file which
+containers.load_bundle registers in place of the files it was compiled
+from:
+
+    bundle = compile_containers('config/containers')
+    bundle.save('containers.bundle.json')  # Raises BundleError if invalid.
+
+    containers.load_bundle('containers.bundle.json')
+"""
+
+import json
+import os
+
+from labsuite.labware import containers
+from labsuite.labware.grid import normalize_position
+
+_number = (int, float)
+
+# The types each container property can have.
+SCHEMA = {
+    'rows': (int,),
+    'cols': (int,),
+    'a1_x': _number,
+    'a1_y': _number,
+    'spacing': _number,
+    'row_spacing': _number,
+    'col_spacing': _number,
+    'height': _number,
+    'length': _number,
+    'width': _number,
+    'diameter': _number,
+    'depth': _number,
+    'well_depth': _number,
+    'volume': _number,
+    'min_vol': _number,
+    'max_vol': _number,
+    'legacy_name': (str,)
+}
+
+# The types each property of a custom well can have.
+WELL_SCHEMA = {
+    'x': _number,
+    'y': _number,
+    'depth': _number,
+    'diameter': _number,
+    'volume': _number,
+    'min_vol': _number,
+    'max_vol': _number
+}
+
+
+class DefinitionError():
+
+    """ A problem with one value in a container file. """
+
+    path = None
+    key = None  # Dotted path to the value, like 'subsets.deep.rows'.
+    message = None
+
+    def __init__(self, path, key, message):
+        self.path = path
+        self.key = key
+        self.message = message
+
+    def __str__(self):
+        if self.key:
+            return "{}: {}: {}".format(self.path, self.key, self.message)
+        return "{}: {}".format(self.path, self.message)
+
+    def __repr__(self):
+        return "<DefinitionError {}>".format(self)
+
+
+class BundleError(ValueError):
+
+    """ Raised when a bundle with errors is saved. """
+
+    errors = None  # [DefinitionError]
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(BundleError, self).__init__(
+            "{} error(s) in container definitions:\n{}".format(
+                len(errors), "\n".join(str(e) for e in errors)
+            )
+        )
+
+
+class Bundle():
+
+    """
+    Compiled container definitions.  Files with errors are left out, and
+    their errors listed.
+    """
+
+    definitions = None  # [(name, type, properties, custom wells)]
+    index = None  # {container name: position in definitions}
+    errors = None  # [DefinitionError]
+    sources = None  # [path] of the files compiled in.
+
+    def __init__(self):
+        self.definitions = []
+        self.index = {}
+        self.errors = []
+        self.sources = []
+
+    def to_json(self):
+        return json.dumps({
+            'version': containers._bundle_version,
+            'definitions': self.definitions,
+            'index': self.index
+        }, sort_keys=True, separators=(',', ':'))
+
+    def save(self, path):
+        """ Writes the bundle to a file, unless it has errors. """
+        if self.errors:
+            raise BundleError(self.errors)
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+    def __repr__(self):
+        return "<Bundle {} containers, {} errors>".format(
+            len(self.definitions), len(self.errors)
+        )
+
+
+def compile_containers(folder=None):
+    """
+    Compiles every container file in a directory (and its subdirectories;
+    by default, the library's own config/containers) into a Bundle.
+    """
+    import yaml
+    if not folder:
+        modpath = os.path.dirname(containers.labware.__file__)
+        folder = os.path.join(modpath, '..', 'config', 'containers')
+    bundle = Bundle()
+    owners = {}  # {container name: path that defined it}
+    for path in _container_files(folder):
+        try:
+            with open(path, 'r') as f:
+                data = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError) as e:
+            bundle.errors.append(DefinitionError(path, None, str(e)))
+            continue
+        errors = validate(data, path)
+        if errors:
+            bundle.errors.extend(errors)
+            continue
+        name = os.path.splitext(os.path.basename(path))[0]
+        definitions = containers._normalize_container(data, name=name)
+        clashes = [n for d in definitions for n in _names(d) if n in owners]
+        for n in clashes:
+            bundle.errors.append(DefinitionError(
+                path, None, "{} is already defined by {}".format(n, owners[n])
+            ))
+        if clashes:
+            continue
+        for definition in definitions:
+            position = len(bundle.definitions)
+            bundle.definitions.append(list(definition))
+            for n in _names(definition):
+                owners[n] = path
+                bundle.index[n] = position
+        bundle.sources.append(path)
+    return bundle
+
+
+def _container_files(folder):
+    """ Returns the path of every container file in a folder, in order. """
+    out = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        out.extend(
+            os.path.join(root, f) for f in sorted(files) if f.endswith('.yml')
+        )
+    return out
+
+
+def _names(definition):
+    name, _, data, _ = definition
+    if data.get('legacy_name'):
+        return [name, 'legacy.' + data['legacy_name']]
+    return [name]
+
+
+def validate(data, path=None, key=''):
+    """
+    Checks a container definition (as read from a container file) against
+    SCHEMA, and returns a DefinitionError for everything wrong with it,
+    including its subsets and custom wells.
+    """
+    errors = []
+
+    def error(k, message):
+        errors.append(DefinitionError(path, (key + k).rstrip('.'), message))
+
+    if not isinstance(data, dict):
+        error('', "Expected a mapping of container properties.")
+        return errors
+    for k, value in data.items():
+        if k == 'type':
+            if value not in containers._typemap:
+                error(k, "Invalid container type {!r}; valid choices: {}"
+                      .format(value, ", ".join(
+                          containers.list_container_types()
+                      )))
+        elif k == 'subsets':
+            if not isinstance(value, dict):
+                error(k, "Expected a mapping of subsets.")
+                continue
+            for name, subset in value.items():
+                errors.extend(validate(
+                    subset, path, "{}{}.{}.".format(key, k, name)
+                ))
+        elif k == 'custom_wells':
+            errors.extend(_validate_wells(value, path, key + k))
+        elif k not in SCHEMA:
+            error(k, "Unknown container property.")
+        elif not _is_type(value, SCHEMA[k]):
+            error(k, "Expected {}, not {!r}.".format(
+                _type_names(SCHEMA[k]), value
+            ))
+    return errors
+
+
+def _validate_wells(wells, path, key):
+    if not isinstance(wells, dict):
+        return [DefinitionError(path, key, "Expected a mapping of wells.")]
+    errors = []
+    for position, props in wells.items():
+        well_key = "{}.{}".format(key, position)
+        try:
+            normalize_position(position)
+        except (TypeError, ValueError) as e:
+            errors.append(DefinitionError(path, well_key, str(e)))
+        if not isinstance(props, dict):
+            errors.append(DefinitionError(
+                path, well_key, "Expected a mapping of well properties."
+            ))
+            continue
+        for k, value in props.items():
+            if k not in WELL_SCHEMA:
+                errors.append(DefinitionError(
+                    path, well_key + '.' + k, "Unknown well property."
+                ))
+            elif not _is_type(value, WELL_SCHEMA[k]):
+                errors.append(DefinitionError(
+                    path, well_key + '.' + k, "Expected {}, not {!r}.".format(
+                        _type_names(WELL_SCHEMA[k]), value
+                    )
+                ))
+    return errors
+
+
+def _is_type(value, types):
+    # bool is an int, but True isn't a number of rows.
+    return isinstance(value, types) and not isinstance(value, bool)
+
+
+def _type_names(types):
+    return " or ".join(t.__name__ for t in types)
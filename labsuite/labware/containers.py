@@ -15,12 +15,39 @@ There's also support for custom containers, either by placing them in the
 config/containers directory of this library (see included examples), or by
 using the load_custom_containers function of this module to specify an
 alternate configuration directory.
+
+Container files are indexed when this module is imported, by skimming
+them for their type, subsets and legacy names, but they're only parsed
+(and their classes built) the first time one of their containers is
+loaded.  Skimming only understands plain block-style `key: value` lines;
+a file with anything else in it (flow-style mappings, quoted keys, tabs
+and so on) is parsed with the YAML parser straight away instead.
+
+Parsed and validated definitions can be kept in an on-disk cache (see
+set_definition_cache; it's off unless LABSUITE_CACHE names a file),
+keyed by each source file's path, modification time and size, so files
+are only parsed again when they change.
+
+A whole directory of container files can also be checked and compiled
+ahead of time into a single definition bundle (see labware.bundle), and
+registered with load_bundle in place of the files.
+
+Each container is described by a ContainerDefinition, which can't be
+changed once it's made, held in a ContainerRegistry.  The functions in
+this module use the default registry; a Protocol keeps its own registry
+on top of it, so containers it defines don't leak into other protocols,
+while the definitions everyone loads are shared between them (and safe
+to share between threads).
 """
 
 import os
-import yaml
-import inspect
+import re
+import copy
 import json
+import atexit
+import threading
+from types import MappingProxyType
+from collections import OrderedDict
 
 from labsuite import labware
 from labsuite.labware.microplates import Microplate
@@ -28,6 +55,7 @@ from labsuite.labware.tipracks import Tiprack
 from labsuite.labware.reservoirs import Reservoir
 from labsuite.labware.tuberacks import Tuberack
 from labsuite.labware.grid import GridContainer, normalize_position
+from labsuite.labware.grid import humanize_column
 
 # These are the base types that containers can extend from.
 _typemap = {
@@ -56,7 +84,39 @@ _container_modules = [
     labware.tipracks, labware.microplates, labware.reservoirs
 ]
 
-_containers = {}
+_containers = {}  # {container name: ContainerDefinition}
+
+# Names defined by container files, and the file that defines them.  A
+# name defined again later (by another file, or add_custom_container)
+# is owned by the later definition; None if that was a direct call.
+_index = {}  # {container name: path or None}
+_loaded = set()  # Paths of container files that have been parsed.
+_loading = None  # Path of the file being parsed, if any.
+
+# Definitions from bundles (see load_bundle), built when first asked for.
+_bundled = {}  # {container name: definition}
+_bundle_version = 1
+
+# Held while the state above (or the definition cache) is changed.
+_lock = threading.RLock()
+
+# Definition cache: {path: ((mtime, size), definitions)}, read from
+# _cache_file (JSON; None turns the cache off) when first needed, and
+# written back by save_definition_cache.  Bump the version when the
+# format of definitions (see _normalize_container) changes.
+_cache_version = 3
+_cache_file = os.environ.get('LABSUITE_CACHE') or None
+_cache = None
+_cache_changed = False  # Whether _cache has entries _cache_file hasn't.
+_cache_saved_at_exit = False
+
+# Plain block-style `key: value` lines in a container file, which can be
+# skimmed without the YAML parser.
+_key_pattern = re.compile(r'^( *)(\w[\w.-]*):(?: +(.*))?$')
+_quoted_pattern = re.compile(r'^([\'"])([^\'"\\]*)\1(?: +#.*)?$')
+_plain_pattern = re.compile(
+    r'^([^-?:,\[\]{}#&*!|>\'"%@`\s]|[-?:](?=\S))([^:#]|:(?=\S)|(?<! )#)*$'
+)
 
 
 def _get_container_filepath(name):
@@ -88,23 +148,244 @@ def load_custom_containers(folder=None):
 
     If a container name is reused, the old container will be
     replaced.
+
+    Files are only indexed here; see _load_container_file.
     """
     # Default to local library configuration.
     if not folder:
         modpath = os.path.dirname(labware.__file__)
         folder = os.path.join(modpath, '..', 'config', 'containers')
-    # Get all YAML files from the specified directory, parse then,
-    # and send the data to add_custom_container.
+    # Get all YAML files from the specified directory and note the
+    # containers each one defines.
     for f in os.listdir(folder):
         full_path = os.path.join(folder, f)
         if os.path.isfile(full_path) and full_path.endswith('.yml'):
-            data = yaml.load(open(full_path, 'r'))
-            name = os.path.splitext(f)[0]
-            add_custom_container(data, name=name)
+            _loaded.discard(full_path)
+            names = _scan_container_file(full_path)
+            if names is not None:
+                for name in names:
+                    _index[name] = full_path
+                continue
+            # Too much for the scan; parse it now, with the YAML parser.
+            with _lock:
+                definitions = _cached_definitions(
+                    full_path, _parse_container_file
+                )
+                for name in _definition_names(definitions):
+                    _index[name] = full_path
+                _load_container_file(full_path, definitions)
         elif os.path.isdir(full_path):
             load_custom_containers(full_path)
 
 
+def _scan_container_file(path):
+    """
+    Returns the names of the containers defined in a container file,
+    without parsing it: the type, subset keys and legacy names are read
+    straight from the lines that set them.
+
+    Returns None if the file has anything but blank lines, comments and
+    plain block-style `key: value` lines, which the scan can't be sure
+    of reading the way the YAML parser would.
+    """
+    obj_type = 'grid'
+    subsets = []  # Subset key paths, like ['pcr', 'tall'].
+    legacy = []
+    stack = []  # [(indent, key)] of the keys enclosing the current line.
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.lstrip(' ').startswith('#'):
+                continue
+            match = _key_pattern.match(line)
+            if match is None:
+                return None
+            indent, key = len(match.group(1)), match.group(2)
+            value = _scan_value(match.group(3) or '')
+            if value is None:
+                return None
+            while stack and stack[-1][0] >= indent:
+                stack.pop()
+            keys = [k for _, k in stack]
+            if not keys and key == 'type' and value:
+                obj_type = value
+            elif key == 'legacy_name' and value:
+                legacy.append(value)
+            elif keys and keys[-1] == 'subsets':
+                subsets.append(keys[1::2] + [key])
+            stack.append((indent, key))
+    name = os.path.splitext(os.path.basename(path))[0]
+    if '.' not in name:
+        name = obj_type + '.' + name
+    names = [name] + ['.'.join([name] + s) for s in subsets]
+    return names + ['legacy.' + n for n in legacy]
+
+
+def _scan_value(text):
+    """
+    Returns the value of a skimmed line as a string ('' for none), or
+    None if it isn't a plain or simply quoted scalar.
+    """
+    text = text.strip()
+    if not text or text.startswith('#'):
+        return ''
+    match = _quoted_pattern.match(text)
+    if match is not None:
+        return match.group(2)
+    text = text.split(' #')[0].rstrip()
+    if _plain_pattern.match(text) is None:
+        return None
+    return text
+
+
+def _definition_names(definitions):
+    """
+    Returns the names (and legacy names) of parsed container
+    definitions, as _scan_container_file would.
+    """
+    names = []
+    for name, _, data, _ in definitions:
+        for n in (name, data.get('legacy_name') and
+                  'legacy.' + data['legacy_name']):
+            if n and n not in names:
+                names.append(n)
+    return names
+
+
+def _load_container_file(path, definitions=None):
+    """
+    Parses a container file, unless its definitions are given, and builds
+    the classes for the containers it defines (see add_custom_container).
+    """
+    global _loading
+    with _lock:
+        if definitions is None:
+            definitions = _cached_definitions(path, _parse_container_file)
+        _loading = path
+        try:
+            for definition in definitions:
+                _build_container(definition)
+        finally:
+            _loading = None
+        _loaded.add(path)
+
+
+def load_bundle(path):
+    """
+    Registers the containers in a definition bundle (see
+    labware.bundle.compile_containers) in place of any container files
+    or earlier definitions with the same names.  Each container is built
+    when it's first asked for.
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data.get('version') != _bundle_version:
+        raise ValueError(
+            "Unsupported container bundle version in {}: {}"
+            .format(path, data.get('version'))
+        )
+    definitions = [tuple(d) for d in data['definitions']]
+    with _lock:
+        for name, position in data['index'].items():
+            _index[name] = None  # No file overrides it.
+            _containers.pop(name, None)
+            _bundled[name] = definitions[position]
+
+
+def _parse_container_file(path):
+    import yaml
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return _normalize_container(data, name=name)
+
+
+def set_definition_cache(path):
+    """
+    Sets the file parsed container definitions are cached in, or turns
+    the cache off if path is None.  Defaults to the LABSUITE_CACHE
+    environment variable; the cache is off if it isn't set.
+    """
+    global _cache_file, _cache, _cache_changed
+    with _lock:
+        _cache_file = path
+        _cache = None
+        _cache_changed = False
+
+
+def _cached_definitions(path, parse):
+    """
+    Returns parse(path), from the cache if the file's modification time
+    and size haven't changed since it was cached.
+    """
+    global _cache, _cache_changed, _cache_saved_at_exit
+    if not _cache_file:
+        return parse(path)
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = [stat.st_mtime_ns, stat.st_size]
+    if _cache is None:
+        _cache = _read_cache()
+    entry = _cache.get(path)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    definitions = parse(path)
+    _cache[path] = (key, definitions)
+    _cache_changed = True
+    if not _cache_saved_at_exit:
+        # Everything parsed in this process is written at once.
+        atexit.register(save_definition_cache)
+        _cache_saved_at_exit = True
+    return definitions
+
+
+def _read_cache():
+    """
+    Returns the cached entries, or {} if the cache can't be read or is
+    from another version.  Entries that don't look like definitions are
+    dropped.
+    """
+    try:
+        with open(_cache_file, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != _cache_version:
+            return {}
+        entries = {}
+        for path, (key, definitions) in data['entries'].items():
+            definitions = [tuple(d) for d in definitions]
+            if all(len(d) == 4 and d[1] in _typemap for d in definitions):
+                entries[path] = (key, definitions)
+        return entries
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return {}
+
+
+def save_definition_cache():
+    """
+    Writes definitions parsed since the cache was read to the cache file,
+    quietly giving up if it can't; it's only a cache.  This is called
+    when the interpreter exits.
+    """
+    global _cache_changed
+    with _lock:
+        if not _cache_file or not _cache_changed:
+            return
+        partial = '{}.{}.partial'.format(_cache_file, os.getpid())
+        try:
+            folder = os.path.dirname(_cache_file)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(partial, 'w') as f:
+                json.dump(
+                    {'version': _cache_version, 'entries': _cache}, f
+                )
+            os.replace(partial, _cache_file)
+            _cache_changed = False
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(partial):
+                os.remove(partial)
+
+
 def load_legacy_containers_file(path=None):
     """
     Takes a path to the old-school containers.json file (or defaults
@@ -113,15 +394,121 @@ def load_legacy_containers_file(path=None):
     legacy namespace.
     """
     if not path:
-        modpath = os.path.dirname(labware.__file__)
-        folder = os.path.join(modpath, '..', 'config', 'containers')
-        path = os.path.join(folder, 'legacy_containers.json')
+        path = _legacy_containers_path()
 
-    containers = json.load(open(path))['containers']
+    with _lock:
+        for definition in _cached_definitions(path, _parse_legacy_file):
+            _build_container(definition)
 
-    for k in containers:
-        data = convert_legacy_container(containers[k])
-        add_custom_container(data, 'legacy.' + k)
+
+def _legacy_containers_path():
+    modpath = os.path.dirname(labware.__file__)
+    folder = os.path.join(modpath, '..', 'config', 'containers')
+    return os.path.join(folder, 'legacy_containers.json')
+
+
+def _parse_legacy_file(path):
+    definitions = []
+    for k, container in _legacy_items(path):
+        data = convert_legacy_container(container)
+        definitions.extend(_normalize_container(data, 'legacy.' + k))
+    return definitions
+
+
+def _legacy_items(path, chunk_size=65536):
+    """
+    Yields (legacy name, container) for each container in a legacy
+    containers.json file, in the order they're listed.  The file is read
+    `chunk_size` characters at a time, and only one container is held in
+    memory at once.
+    """
+    with open(path, 'r') as f:
+        reader = _JSONReader(f, chunk_size)
+        reader.expect('{')
+        while reader.peek() != '}':
+            key = reader.value()
+            reader.expect(':')
+            if key != 'containers':
+                reader.value()
+            else:
+                reader.expect('{')
+                while reader.peek() != '}':
+                    name = reader.value()
+                    reader.expect(':')
+                    yield name, reader.value()
+                    if reader.peek() == ',':
+                        reader.expect(',')
+                reader.expect('}')
+            if reader.peek() == ',':
+                reader.expect(',')
+
+
+class _JSONReader():
+
+    """
+    Reads a JSON file one value at a time, for files too big to load at
+    once.  The caller walks the structure with expect() and peek(), and
+    reads whole values with value().
+    """
+
+    _file = None
+    _chunk_size = None
+    _buffer = ''
+    _pos = 0  # Position of the next character in _buffer.
+    _decoder = None
+
+    def __init__(self, f, chunk_size=65536):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+
+    def _read(self):
+        """ Adds a chunk to the buffer; returns False at the end. """
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """ Returns the next character that isn't whitespace. """
+        while True:
+            while self._pos < len(self._buffer) and \
+                    self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                raise ValueError("Unexpected end of JSON file.")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Expected {!r} in JSON file, not {!r}.".format(
+                char, self._buffer[self._pos]
+            ))
+        self._pos += 1
+
+    def value(self):
+        """ Decodes the next value, reading more of the file as needed. """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(
+                    self._buffer, self._pos
+                )
+                # A number at the end of the buffer may go on in the
+                # next chunk.
+                if end < len(self._buffer):
+                    self._pos = end
+                    return value
+            except ValueError:
+                pass
+            if not self._read():
+                value, self._pos = self._decoder.raw_decode(
+                    self._buffer, self._pos
+                )
+                return value
 
 
 def _load_default_containers():
@@ -132,15 +519,15 @@ def _load_default_containers():
     We do this so that we don't have to manually list a container in this
     module everytime we add a new one.
     """
-    _containers['point'] = GridContainer
-    _containers['grid'] = GridContainer
+    for name in ['point', 'grid']:
+        _containers[name] = ContainerDefinition.for_class(name, GridContainer)
     for mod in _container_modules:
         props = dir(mod)
         for name in props:
             prop = getattr(mod, name)
-            if inspect.isclass(prop) and issubclass(prop, GridContainer):
+            if isinstance(prop, type) and issubclass(prop, GridContainer):
                 name = normalize_container_name(name)
-                _containers[name] = prop
+                _containers[name] = ContainerDefinition.for_class(name, prop)
 
 
 def normalize_container_name(name):
@@ -173,6 +560,19 @@ def add_custom_container(data, name=None, parent=None, legacy=False):
 
     See config/containers/example_plate.yml for more information on
     custom container definitions.
+
+    The container is added to the default registry, and so is available
+    to every protocol; see Protocol.add_custom_container to define one
+    for a single protocol.
+    """
+    return default_registry.add_custom_container(data, name, parent)
+
+
+def _normalize_container(data, name=None, parent=None):
+    """
+    Validates a container definition and returns it, and each of its
+    subsets with the parent's values merged in, as a list of
+    (name, type, properties, custom wells) tuples of plain data.
     """
 
     obj_type = data.pop('type', 'grid')
@@ -222,27 +622,255 @@ def add_custom_container(data, name=None, parent=None, legacy=False):
             .format(", ".join(list_container_types()))
         )
 
-    # Do the extension.
-    tname = (container_name or 'CustomContainer').replace('.', '_').title()
-    subclass = type(tname, (base, object), data)
-
-    # Add custom wells if they're there.
-    if custom_wells:
-        subclass._set_custom_wells(custom_wells)
-
-    # If this is a named container, add it to our list of containers.
-    if name:
-        _containers[container_name] = subclass
-        if 'legacy_name' in data:
-            _containers['legacy.' + data['legacy_name']] = subclass
+    definitions = [(name and container_name, obj_type, data, custom_wells)]
 
     # Recurse for subsets.
     for k in subsets:
-        add_custom_container(
+        definitions.extend(_normalize_container(
             subsets[k], name=container_name + "." + k, parent=data
+        ))
+
+    return definitions
+
+
+def _build_container(definition):
+    """
+    Makes the ContainerDefinition for a definition from
+    _normalize_container, adds it to the default registry if it's named,
+    and returns its class.
+    """
+    definition = ContainerDefinition.from_data(definition)
+    if definition.name:
+        default_registry.add(definition)
+    return definition.container_class
+
+
+def _register(name, definition):
+    """
+    Adds a container definition under a name, unless a container file
+    that hasn't been parsed yet has the final say on it.
+    """
+    if _loading is None:
+        if name in _index:
+            _index[name] = None  # Defined directly; no file overrides it.
+    elif _index.get(name, _loading) != _loading:
+        return  # Defined again by a later file.
+    _containers[name] = definition
+
+
+class ContainerDefinition():
+
+    """
+    The validated properties of a container, and the class built from
+    them.  A definition can't be changed once it's made, so one can be
+    shared by every protocol that uses the container, in any thread;
+    each protocol only makes its own instances of the class.
+    """
+
+    _name = None
+    _base = None  # The class being extended (see _typemap).
+    _properties = None  # Read-only {property: value}.
+    _custom_wells = None  # Read-only {(col, row): {property: value}}.
+    _class = None
+
+    def __init__(self, name, base, properties=None, custom_wells=None,
+                 container_class=None):
+        self._name = name
+        self._base = base
+        self._properties = MappingProxyType(dict(properties or {}))
+        wells = {}
+        for pos, props in (custom_wells or {}).items():
+            wells[normalize_position(pos)] = MappingProxyType(dict(props))
+        self._custom_wells = MappingProxyType(wells)
+        self._class = container_class or self._build_class()
+
+    @classmethod
+    def from_data(cls, definition):
+        """
+        Makes a definition from a (name, type, properties, custom wells)
+        tuple, as returned by _normalize_container.
+        """
+        name, obj_type, data, custom_wells = definition
+        return cls(name, _typemap[obj_type], data, custom_wells)
+
+    @classmethod
+    def for_class(cls, name, container_class):
+        """ Wraps a container class that's defined in code. """
+        return cls(name, container_class, container_class=container_class)
+
+    def _build_class(self):
+        tname = (self._name or 'CustomContainer').replace('.', '_').title()
+        attrs = dict(self._properties)
+        if self._custom_wells:
+            attrs['_custom_wells'] = self._custom_wells
+        return type(tname, (self._base, object), attrs)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def base(self):
+        return self._base
+
+    @property
+    def properties(self):
+        return self._properties
+
+    @property
+    def custom_wells(self):
+        return self._custom_wells
+
+    @property
+    def legacy_name(self):
+        return self._properties.get('legacy_name')
+
+    @property
+    def container_class(self):
+        return self._class
+
+    def __repr__(self):
+        return "<ContainerDefinition {}>".format(self._name)
+
+
+class ContainerRegistry():
+
+    """
+    Container definitions by name.  Names a registry doesn't define are
+    looked up in its parent, so a registry made for one protocol can add
+    (or replace) containers without changing what other protocols see.
+    """
+
+    parent = None  # ContainerRegistry, or None.
+    _definitions = None  # {container name: ContainerDefinition}
+    _custom = None  # {name: data} as given to add_custom_container.
+    _lock = None
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._definitions = {}
+        self._custom = OrderedDict()
+        self._lock = threading.RLock()
+
+    def add(self, definition):
+        """ Adds a definition under its name and legacy name. """
+        with self._lock:
+            self._register(definition.name, definition)
+            if definition.legacy_name:
+                self._register(
+                    'legacy.' + definition.legacy_name, definition
+                )
+
+    def _register(self, name, definition):
+        self._definitions[name] = definition
+
+    def add_custom_container(self, data, name=None, parent=None):
+        """
+        Defines a container, and any subsets, from a dict in the format
+        of the container files (see add_custom_container), and returns
+        its class.  Unnamed containers aren't added to the registry.
+        """
+        source = copy.deepcopy(data)
+        definitions = [
+            ContainerDefinition.from_data(d)
+            for d in _normalize_container(data, name=name, parent=parent)
+        ]
+        for definition in definitions:
+            if definition.name:
+                self.add(definition)
+        if name and parent is None:
+            with self._lock:
+                self._custom.pop(name, None)
+                self._custom[name] = source
+        return definitions[0].container_class
+
+    def custom_containers(self):
+        """
+        Returns the (name, data) pairs given to add_custom_container on
+        this registry (not its parent), in the order they were added, so
+        they can be saved and added again elsewhere.
+        """
+        with self._lock:
+            return copy.deepcopy(list(self._custom.items()))
+
+    def update(self, registry):
+        """
+        Adds the definitions a registry holds itself (not those from its
+        parent).
+        """
+        with self._lock:
+            for name, definition in list(registry._definitions.items()):
+                self._definitions[name] = definition
+            for name, data in registry.custom_containers():
+                self._custom.pop(name, None)
+                self._custom[name] = data
+
+    def _find(self, name):
+        definition = self._definitions.get(name)
+        if definition is None and self.parent is not None:
+            definition = self.parent._find(name)
+        return definition
+
+    def get_definition(self, name):
+        """
+        Returns the ContainerDefinition for a container name (or legacy
+        name).
+        """
+        for key in (name, 'legacy.' + name):
+            definition = self._find(key)
+            if definition is not None:
+                return definition
+        raise KeyError(
+            "Invalid container name {}.  Valid containers: {}"
+            .format(name, ", ".join(self.list_containers()))
         )
 
-    return subclass
+    def load_container(self, name):
+        """ Returns the class of the named container. """
+        return self.get_definition(name).container_class
+
+    def list_containers(self):
+        names = set(self._definitions)
+        if self.parent is not None:
+            names |= set(self.parent.list_containers())
+        return sorted(names)
+
+
+class _DefaultRegistry(ContainerRegistry):
+
+    """
+    The registry behind this module's functions: the built-in containers,
+    and those from container files, which are parsed when one of their
+    containers is first asked for.
+    """
+
+    def __init__(self):
+        self._definitions = _containers
+        self._custom = OrderedDict()
+        self._lock = _lock
+
+    def _register(self, name, definition):
+        _register(name, definition)
+
+    def _find(self, name):
+        path = _index.get(name)
+        if path is not None and path not in _loaded:
+            with _lock:
+                if path not in _loaded:
+                    _load_container_file(path)
+        definition = self._definitions.get(name)
+        if definition is None and name in _bundled:
+            with _lock:
+                if name not in self._definitions:
+                    _build_container(_bundled[name])
+            definition = self._definitions.get(name)
+        return definition
+
+    def list_containers(self):
+        return sorted(set(_containers) | set(_index))
+
+
+default_registry = _DefaultRegistry()
 
 
 def load_container(name):
@@ -251,21 +879,14 @@ def load_container(name):
 
     For a list of all valid containers, use list_containers.
     """
-    if name in _containers:
-        return _containers[name]
-    elif 'legacy.' + name in _containers:
-        return _containers['legacy.' + name]
-    raise KeyError(
-        "Invalid container name {}.  Valid containers: {}"
-        .format(name, ", ".join(list_containers()))
-    )
+    return default_registry.load_container(name)
 
 
 def list_containers():
     """
     Returns a list of all valid container names for use in the JSON protocol
     """
-    return sorted(list(_containers.keys()))
+    return default_registry.list_containers()
 
 
 def list_container_types():
@@ -304,7 +925,7 @@ def generate_legacy_container(container_name, format=False):
         print('\t"locations": {')
     for col in range(0, container.cols):
         for row in range(1, container.rows + 1):
-            pos = '{}{}'.format(chr(col + ord('A')), row)
+            pos = '{}{}'.format(humanize_column(col), row)
             x, y = container.calculate_offset(pos)
             locs[pos] = {
                 'x': round(x, 2),
@@ -340,7 +961,8 @@ def legacy_json_to_yaml(containers=None, path=None, interactive=False):
     """
 
     if path:
-        containers = json.load(open(path))['containers']
+        with open(path, 'r') as f:
+            containers = json.load(f)['containers']
 
     yaml = ""
 
@@ -365,6 +987,157 @@ def legacy_json_to_yaml(containers=None, path=None, interactive=False):
     return yaml
 
 
+class LegacyConversion():
+
+    """ The files convert_legacy_library wrote, and what went wrong. """
+
+    written = None  # [path] of files written.
+    unchanged = None  # [path] of files which already had the same YAML.
+    failed = None  # {legacy name: reason}
+
+    def __init__(self):
+        self.written = []
+        self.unchanged = []
+        self.failed = {}
+
+    @property
+    def converted(self):
+        return len(self.written) + len(self.unchanged)
+
+    def summary(self):
+        lines = [
+            "Converted {} containers ({} written, {} unchanged), {} failed."
+            .format(self.converted, len(self.written), len(self.unchanged),
+                    len(self.failed))
+        ]
+        for name in sorted(self.failed):
+            lines.append("  {}: {}".format(name, self.failed[name]))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "<LegacyConversion {} converted, {} failed>".format(
+            self.converted, len(self.failed)
+        )
+
+
+def convert_legacy_library(folder, path=None, workers=None):
+    """
+    Converts every container in a legacy containers.json file (by default
+    the one in config/containers) to a YAML container file in the given
+    folder, and returns a LegacyConversion.
+
+    The file is streamed: containers are read from it one at a time and
+    converted in a pool of `workers` processes (one per CPU by default; 1
+    converts them in this process), a batch at a time, with a few batches
+    per worker in flight.  Each file is written as its container comes
+    back, in the order the containers are listed.
+
+    The output only depends on the input: files are named for the legacy
+    name (the first container listed keeps a name two would share), and
+    files that already hold the same YAML are left alone, so running it
+    again changes nothing.
+    """
+    if not path:
+        path = _legacy_containers_path()
+    report = LegacyConversion()
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    if workers == 1:
+        _write_legacy_files(
+            folder, map(_convert_legacy_item, _legacy_items(path)), report
+        )
+        return report
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        _write_legacy_files(
+            folder, _convert_in_pool(pool, workers, _legacy_items(path)),
+            report
+        )
+    return report
+
+
+# Containers sent to a worker at once; each is quick to convert, so
+# sending them one at a time would cost more than converting them.
+_LEGACY_BATCH = 32
+
+
+def _convert_in_pool(pool, workers, items):
+    """
+    Converts (legacy name, container) pairs in a process pool, keeping a
+    few batches per worker in flight, and yields the results in order.
+    """
+    from collections import deque
+    pending = deque()
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == _LEGACY_BATCH:
+            pending.append(pool.submit(_convert_legacy_batch, batch))
+            batch = []
+            if len(pending) >= workers * 4:
+                for result in pending.popleft().result():
+                    yield result
+    if batch:
+        pending.append(pool.submit(_convert_legacy_batch, batch))
+    while pending:
+        for result in pending.popleft().result():
+            yield result
+
+
+def _convert_legacy_batch(items):
+    return [_convert_legacy_item(item) for item in items]
+
+
+def _write_legacy_files(folder, results, report):
+    """
+    Writes the YAML for each converted container (see
+    _convert_legacy_item) to the folder, and records it on the
+    LegacyConversion.
+    """
+    owners = {}  # {file name: legacy name}
+    for name, text, error in results:
+        fname = _legacy_file_name(name)
+        if error is None and fname in owners:
+            error = "Same file name as {}: {}".format(owners[fname], fname)
+        if error is not None:
+            report.failed[name] = error
+            continue
+        owners[fname] = name
+        fpath = os.path.join(folder, fname)
+        if os.path.exists(fpath):
+            with open(fpath, 'r') as f:
+                if f.read() == text:
+                    report.unchanged.append(fpath)
+                    continue
+        with open(fpath, 'w') as f:
+            f.write(text)
+        report.written.append(fpath)
+
+
+def _convert_legacy_item(item):
+    """
+    Returns (legacy name, YAML, None) for a (legacy name, container) pair
+    from a containers.json file, or (legacy name, None, reason) if it
+    can't be converted.
+    """
+    name, container = item
+    try:
+        data = convert_legacy_container(container)
+        definition = ContainerDefinition.from_data(
+            _normalize_container(data)[0]
+        )
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        return (name, None, "{}: {}".format(type(e).__name__, e))
+    text = container_to_yaml(definition.container_class, legacy_name=name)
+    return (name, text + "\n", None)
+
+
+def _legacy_file_name(name):
+    """ Returns a YAML file name for a legacy container name. """
+    return (re.sub(r'[^\w-]+', '_', name).strip('_') or 'container') + '.yml'
+
+
 def container_to_yaml(container, legacy_name=None):
 
     # Pretty-print this because we're going to be maintaining them.
@@ -421,10 +1194,11 @@ def convert_legacy_container(container):
         out['col_spacing'] = spacing_x
         out['row_spacing'] = spacing_y
 
-    max_col, max_row = normalize_position(max(wells.keys()))
+    # Compare positions, not names; "A10" sorts before "A9".
+    positions = [normalize_position(k) for k in wells]
 
-    out['rows'] = max_row + 1
-    out['cols'] = max_col + 1
+    out['rows'] = max(row for _, row in positions) + 1
+    out['cols'] = max(col for col, _ in positions) + 1
 
     return out
 
@@ -9,6 +9,11 @@ class Deck(GridContainer):
     rows = 3
     cols = 5
 
+    # Nominal distance between slots (mm), for estimating travel when a
+    # slot hasn't been calibrated.
+    slot_width = 100
+    slot_depth = 135
+
     def __init__(self, **kwargs):
         super(Deck, self).__init__()
         self.add_modules(**kwargs)
@@ -41,3 +46,10 @@ class Deck(GridContainer):
                 .format(humanize_position(pos))
             )
         return self._children[pos]
+
+    def slot_offset(self, position):
+        """
+        Returns the nominal (x, y) of a slot relative to slot A1.
+        """
+        col, row = self._normalize_position(position)
+        return (col * self.slot_width, row * self.slot_depth)
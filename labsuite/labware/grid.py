@@ -1,6 +1,11 @@
 from math import floor
 from labsuite.util import exceptions as x
 from copy import deepcopy
+from functools import lru_cache
+import threading
+
+# Held while a container class's shared instance is made.
+_instance_lock = threading.Lock()
 
 
 def normalize_position(position):
@@ -22,6 +27,14 @@ def normalize_position(position):
     >>> normalize_position('c4')
     (2, 3)
 
+    Columns past Z carry on with double letters, like spreadsheets:
+
+    >>> normalize_position('AA1')
+    (26, 0)
+
+    >>> normalize_position('AF48')
+    (31, 47)
+
     You can also pass through a tuple that's already been normalized and get
     the same tuple back again:
 
@@ -39,22 +52,70 @@ def normalize_position(position):
         raise TypeError("Tuple arguments must be integers.")
     # Normalize a string and return a tuple.
     elif isinstance(position, str):
-        col = position[0].upper()
-        row = position[1:]
-        # Normalize column.
-        col_num = ord(col) - ord('A')  # Get the col's alphabetical index.
-        if col_num < 0 or col_num > 25:
-            raise ValueError("Column must be a letter (A-Z).")
-        # Normalize row.
-        try:
-            row_num = int(row) - 1  # We want it zero-indexed.
-        except ValueError:
-            raise ValueError("Row must be a number.")
-        return (col_num, row_num)
+        return _parse_position(position)
     else:
         raise TypeError("Position must be a str or tuple of ints.")
 
 
+# Plates only have so many wells, and the same names get parsed over and
+# over again.
+@lru_cache(maxsize=4096)
+def _parse_position(position):
+    name = position.upper()
+    letters = 0
+    while letters < len(name) and 'A' <= name[letters] <= 'Z':
+        letters += 1
+    if letters == 0:
+        raise ValueError("Column must be a letter (A-Z).")
+    col_num = normalize_column(name[:letters])
+    # Normalize row.
+    try:
+        row_num = int(name[letters:]) - 1  # We want it zero-indexed.
+    except ValueError:
+        raise ValueError("Row must be a number.")
+    return (col_num, row_num)
+
+
+def normalize_column(name):
+    """
+    Returns the zero-indexed number of a column name.
+
+    >>> normalize_column('C')
+    2
+
+    >>> normalize_column('AB')
+    27
+    """
+    number = 0
+    for letter in name.upper():
+        if not 'A' <= letter <= 'Z':
+            raise ValueError("Column must be a letter (A-Z).")
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number - 1
+
+
+def humanize_column(col):
+    """
+    Returns the name of a zero-indexed column number.
+
+    >>> humanize_column(25)
+    'Z'
+
+    >>> humanize_column(26)
+    'AA'
+    """
+    if col < 0:
+        raise x.SlotMissing(
+            "Column value of {} is out of supported range.".format(col)
+        )
+    name = ''
+    col += 1
+    while col:
+        col, letter = divmod(col - 1, 26)
+        name = chr(letter + ord('A')) + name
+    return name
+
+
 def humanize_position(position):
     """
     Takes a position as either "A1" or (0, 0) and returns the humanized
@@ -71,14 +132,12 @@ def humanize_position(position):
 
     >>> humanize_position('K12')
     'K12'
+
+    >>> humanize_position((27, 0))
+    'AB1'
     """
     col, row = normalize_position(position)
-    if col > 25 or col < 0:  # Support double letters later.
-        raise x.SlotMissing(
-            "Column value of {} is out of supported range."
-            .format(col)
-        )
-    return "{}{}".format(chr(col + ord('A')), row + 1)
+    return "{}{}".format(humanize_column(col), row + 1)
 
 
 class GridItem():
@@ -226,6 +285,10 @@ class GridContainer():
         return (offset_x, offset_y)
 
     def get_child(self, position):
+        # Children are stored under normalized positions, so those can
+        # skip normalizing.
+        if isinstance(position, tuple) and position in self._children:
+            return self._children[position]
         key = self._normalize_position(position)
         if key not in self._children:
             child = self.init_child(position)
@@ -244,11 +307,7 @@ class GridContainer():
 
     def get_child_collection(self, positions):
         """ Initiates a child collection. """
-        group = []
-        for p in positions:
-            pos = self._normalize_position(p)
-            group.append(self.get_child(pos))
-        return ItemGroup(group)
+        return ItemGroup([self.get_child(p) for p in positions])
 
     def row(self, row):
         """ Returns a row as a child collection. """
@@ -259,7 +318,7 @@ class GridContainer():
     def col(self, col):
         """ Returns a column as a child collection. """
         if type(col) is str:
-            col = ord(col.upper()) - ord('A')
+            col = normalize_column(col)
         col, _ = self._normalize_position((col, 0))
         positions = [(col, row) for row in range(self.rows)]
         return self.get_child_collection(positions)
@@ -287,7 +346,7 @@ class GridContainer():
         if self.cols and col + 1 > self.cols:  # col is zero-indexed
             raise x.SlotMissing(
                 "Column {} out of range (max is {})."
-                .format(chr(col + ord('A')), chr(self.cols - 1 + ord('A')))
+                .format(humanize_column(col), humanize_column(self.cols - 1))
             )
         return (col, row)
 
@@ -332,9 +391,16 @@ class GridContainer():
 
     @classmethod
     def _get_instance(cls):
-        if not cls._instance or not isinstance(cls._instance, cls):
-            cls._instance = cls()
-        return cls._instance
+        # Only look at this class's own instance; one inherited from a
+        # parent class is the wrong shape.
+        instance = cls.__dict__.get('_instance')
+        if instance is None:
+            with _instance_lock:
+                instance = cls.__dict__.get('_instance')
+                if instance is None:
+                    instance = cls()
+                    cls._instance = instance
+        return instance
 
     @classmethod
     def coordinates(cls, position):
@@ -358,22 +424,6 @@ class GridContainer():
         """
         return cls.coordinates(position)
 
-    @classmethod
-    def _set_custom_wells(cls, wells):
-        """
-        Provides a mechanism for generating dynamic containers from user
-        configuration in which any well can override the default properties
-        of wells on the container.
-
-        Wells need to be a dict containing cell coordinates (which will be
-        normalized internally) as keys and tuples containing (x, y, z) as
-        values.
-        """
-        normalized = {}
-        for pos in wells:
-            normalized[normalize_position(pos)] = wells[pos]
-        cls._custom_wells = normalized
-
 
 class ItemGroup():
 
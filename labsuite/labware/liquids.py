@@ -160,6 +160,33 @@ class LiquidInventory():
                 )
         return self.calculate_total_volume()
 
+    def get_liquid_name(self):
+        """
+        Returns the name of the only liquid in this container, or None if
+        it's empty or holds a mixture.
+        """
+        names = self.get_liquid_names()
+        if len(names) == 1:
+            return next(iter(names))
+        return None
+
+    def get_liquid_names(self):
+        """
+        Returns a frozenset of the names of the liquids in this container.
+        """
+        return frozenset(k for k, v in self._contents.items() if v != 0)
+
+    def get_drawn_names(self):
+        """
+        Returns a frozenset of the names of the liquids that a transfer out
+        of this container would take.  A container that was drawn dry, or
+        named but never filled, still gives up its only liquid.
+        """
+        names = self.get_liquid_names()
+        if not names and len(self._contents) == 1:
+            return frozenset(self._contents)
+        return names
+
     def get_proportion(self, key):
         if key in self._contents:
             return self._contents[key] / self.calculate_total_volume()
@@ -183,6 +210,8 @@ class LiquidInventory():
             )
 
         if self._allow_liquid_debt and total_volume is 0:
+            if name is None and len(self._contents) == 1:
+                name = next(iter(self._contents))  # Named, but empty.
             if name is None and self._allow_unspecified_liquids:
                 name = 'unspecified'
             if name is None:
@@ -255,6 +284,12 @@ class LiquidWell(GridItem):
     def get_liquid_name(self):
         return self._liquid.get_liquid_name()
 
+    def get_liquid_names(self):
+        return self._liquid.get_liquid_names()
+
+    def get_drawn_names(self):
+        return self._liquid.get_drawn_names()
+
     def get_proportion(self, liquid):
         return self._liquid.get_proportion(liquid)
 
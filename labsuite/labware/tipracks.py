@@ -35,6 +35,10 @@ class Tiprack(GridContainer):
 
     child_class = TiprackSlot
 
+    # Every tip before this offset in the sequence is known to be used,
+    # so searches for a clean tip can start here.
+    _clean_offset = 0
+
     """
     Taken from microplate specs.
     """
@@ -65,6 +69,13 @@ class Tiprack(GridContainer):
                 used += 1
         return used
 
+    def refill(self):
+        """
+        Replaces every tip in the rack with a clean one.
+        """
+        self._children = {}
+        self._clean_offset = 0
+
     @property
     def has_tips(self):
         # Tips can't be used if they've never been initialized.
@@ -81,8 +92,13 @@ class Tiprack(GridContainer):
         return self.get_clean_col() is not None
 
     def get_clean_tip(self, tag=None):
-        for n in range(self.rows * self.cols):
+        # Tagged tips can be reused, so only untagged searches can skip
+        # ahead.
+        start = 0 if tag else self._clean_offset
+        for n in range(start, self.rows * self.cols):
             tip = self.tip(self._position_in_sequence(n))
+            if n == self._clean_offset and tip.used:
+                self._clean_offset = n + 1
             if tag and tip.tag == tag:  # Previously tagged tip.
                 return tip
             if tip.used is False:  # Clean tip!
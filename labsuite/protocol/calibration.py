@@ -0,0 +1,131 @@
+"""
+An affine model of where the deck really is, for one pipette axis.
+
+Slot calibration records where the robot found the A1 well of each
+container.  Those points also say how the deck sits under the head: if
+it's a little rotated, skewed or scaled, every slot shows it.  An
+AffineModel is fitted to the calibrated points and maps nominal deck
+positions (Deck.slot_offset, plus the container's A1 offset and the
+well's offset in the container) onto robot coordinates:
+
+    x = a * X + b * Y + c
+    y = d * X + e * Y + f
+
+With three or more points not in a line, the full affine transform is
+fitted by least squares.  Two points (or points in a line) give a
+rotation, uniform scale and translation; a single point, a translation.
+
+See Protocol.use_affine_calibration.
+"""
+
+from labsuite.util import exceptions as x
+
+
+class AffineModel():
+
+    """ A 2D affine transform, as the rows of a 2x3 matrix. """
+
+    matrix = None  # ((a, b, c), (d, e, f))
+    points = 0  # Number of points the model was fitted to.
+
+    def __init__(self, a=1.0, b=0.0, c=0.0, d=0.0, e=1.0, f=0.0):
+        self.matrix = ((a, b, c), (d, e, f))
+
+    def apply(self, nx, ny):
+        """ Returns the robot (x, y) for a nominal deck position. """
+        (a, b, c), (d, e, f) = self.matrix
+        return (a * nx + b * ny + c, d * nx + e * ny + f)
+
+    def apply_many(self, points):
+        """ Returns the robot (x, y) for each of a list of positions. """
+        (a, b, c), (d, e, f) = self.matrix
+        return [(a * nx + b * ny + c, d * nx + e * ny + f)
+                for nx, ny in points]
+
+    def linear(self, dx, dy):
+        """
+        Returns an offset transformed without the translation, for
+        offsetting from a point that's already in robot coordinates.
+        """
+        (a, b, _), (d, e, _) = self.matrix
+        return (a * dx + b * dy, d * dx + e * dy)
+
+    def residuals(self, pairs):
+        """
+        Returns the distance between the model and each measured point,
+        given as ((X, Y), (x, y)) pairs.
+        """
+        out = []
+        for (nx, ny), (mx, my) in pairs:
+            fx, fy = self.apply(nx, ny)
+            out.append(((fx - mx) ** 2 + (fy - my) ** 2) ** 0.5)
+        return out
+
+    def __repr__(self):
+        return "<AffineModel {} points {}>".format(self.points, self.matrix)
+
+
+def fit_affine(pairs):
+    """
+    Fits an AffineModel to ((X, Y), (x, y)) pairs of nominal and measured
+    positions.  Raises CalibrationMissing if there are none.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        raise x.CalibrationMissing("No calibrated points to fit.")
+    n = len(pairs)
+    # Work around the centroids so the fit is well-conditioned.
+    cx = sum(p[0][0] for p in pairs) / n
+    cy = sum(p[0][1] for p in pairs) / n
+    mx = sum(p[1][0] for p in pairs) / n
+    my = sum(p[1][1] for p in pairs) / n
+    centred = [
+        ((nx - cx, ny - cy), (rx - mx, ry - my))
+        for (nx, ny), (rx, ry) in pairs
+    ]
+    linear = _fit_linear(centred) or _fit_similarity(centred)
+    if linear is None:
+        linear = (1.0, 0.0, 0.0, 1.0)  # One point: translation only.
+    a, b, d, e = linear
+    model = AffineModel(
+        a, b, mx - (a * cx + b * cy),
+        d, e, my - (d * cx + e * cy)
+    )
+    model.points = n
+    return model
+
+
+def _fit_linear(centred):
+    """
+    Least-squares fit of the 2x2 linear part.  Returns (a, b, d, e), or
+    None if the points are in a line.
+    """
+    sxx = sum(p[0][0] * p[0][0] for p in centred)
+    sxy = sum(p[0][0] * p[0][1] for p in centred)
+    syy = sum(p[0][1] * p[0][1] for p in centred)
+    det = sxx * syy - sxy * sxy
+    if len(centred) < 3 or abs(det) <= 1e-9 * max(sxx * syy, 1.0):
+        return None
+    ux = sum(p[0][0] * p[1][0] for p in centred)
+    uy = sum(p[0][1] * p[1][0] for p in centred)
+    vx = sum(p[0][0] * p[1][1] for p in centred)
+    vy = sum(p[0][1] * p[1][1] for p in centred)
+    # Solve [[sxx, sxy], [sxy, syy]] . (a, b) = (ux, uy), same for (d, e).
+    a = (ux * syy - uy * sxy) / det
+    b = (uy * sxx - ux * sxy) / det
+    d = (vx * syy - vy * sxy) / det
+    e = (vy * sxx - vx * sxy) / det
+    return (a, b, d, e)
+
+
+def _fit_similarity(centred):
+    """
+    Least-squares rotation and uniform scale.  Returns (a, b, d, e), or
+    None if all the points are the same.
+    """
+    norm = sum(p[0][0] ** 2 + p[0][1] ** 2 for p in centred)
+    if norm <= 1e-9:
+        return None
+    cos = sum(p[0][0] * p[1][0] + p[0][1] * p[1][1] for p in centred) / norm
+    sin = sum(p[0][0] * p[1][1] - p[0][1] * p[1][0] for p in centred) / norm
+    return (cos, -sin, sin, cos)
@@ -5,7 +5,7 @@ import copy
 from collections import OrderedDict
 from labsuite.protocol.formatters import ProtocolFormatter
 from labsuite.protocol import Protocol
-from labsuite.labware.grid import humanize_position
+from labsuite.labware.grid import humanize_position, humanize_column
 
 
 class JSONFormatter(ProtocolFormatter):
@@ -28,6 +28,8 @@ class JSONFormatter(ProtocolFormatter):
                 ('name', name)
             ])
 
+        custom = OrderedDict(self._protocol._registry.custom_containers())
+
         modules = []
         for slot, name in sorted(self._protocol._containers.items()):
             c = OrderedDict([('name', name)])
@@ -38,6 +40,17 @@ class JSONFormatter(ProtocolFormatter):
                 c['slot'] = humanize_position(slot)
             modules.append(c)
 
+        ingredients = []
+        for address, (name, volume) in sorted(
+                self._protocol._ingredients.items()):
+            i = OrderedDict([
+                ('address', self._protocol.humanize_address(address)),
+                ('name', name)
+            ])
+            if volume:
+                i['volume'] = volume
+            ingredients.append(i)
+
         instructions = []
         for command in self._protocol.commands:
             command = self._export_command(command)
@@ -46,7 +59,13 @@ class JSONFormatter(ProtocolFormatter):
         out = OrderedDict()
         out['info'] = info
         out['instruments'] = instruments
+        if custom:
+            out['custom_containers'] = custom
         out['containers'] = modules
+        if self._protocol._tip_policy is not None:
+            out['tip_policy'] = self._protocol._tip_policy
+        if ingredients:
+            out['ingredients'] = ingredients
         out['instructions'] = instructions
         return json.dumps(out, indent=4)
 
@@ -87,6 +106,26 @@ class JSONFormatter(ProtocolFormatter):
         command['repetitions'] = command.pop('reps')
         return command
 
+    def _export_stamp_command(self, command):
+        command['source'] = self._protocol.humanize_slot(command['source'])
+        command['destination'] = self._protocol.humanize_slot(
+            command['destination']
+        )
+        if 'region' in command:
+            command['region'] = [
+                humanize_position(well) for well in command['region']
+            ]
+        return command
+
+    def _export_replicate_command(self, command):
+        command['source'] = self._protocol.humanize_slot(command['source'])
+        command['column'] = humanize_column(command['column'])
+        command['plates'] = [
+            self._protocol.humanize_slot(slot) for slot in command['plates']
+        ]
+        command['to_column'] = humanize_column(command['to_column'])
+        return command
+
     def convert(self, content):
         """
         Takes a JSON string and returns a protocol.
@@ -99,11 +138,15 @@ class JSONLoader():
     _protocol = None
 
     def __init__(self, json_str):
-        data = json.loads(json_str)
+        data = json.loads(json_str, object_pairs_hook=OrderedDict)
         self._protocol = Protocol()
         self._load_info(data['info'])
+        self._load_custom_containers(data.get('custom_containers', {}))
         self._load_containers(data['containers'])
         self._load_instruments(data['instruments'])
+        if 'tip_policy' in data:
+            self._protocol.set_tip_policy(data['tip_policy'])
+        self._load_ingredients(data.get('ingredients', []))
         self._load_instructions(data['instructions'])
 
     def _load_info(self, info):
@@ -113,6 +156,10 @@ class JSONLoader():
         for k, inst in instruments.items():
             self._protocol.add_instrument(inst['axis'], inst['name'])
 
+    def _load_custom_containers(self, custom):
+        for name, definition in custom.items():
+            self._protocol.add_custom_container(definition, name)
+
     def _load_containers(self, deck):
         for container in deck:
             name = container.get('name', None)
@@ -122,6 +169,12 @@ class JSONLoader():
                 slot, name, label=label
             )
 
+    def _load_ingredients(self, ingredients):
+        for i in ingredients:
+            self._protocol.add_ingredient(
+                i['address'], i['name'], ul=i.get('volume')
+            )
+
     def _load_instructions(self, instructions):
         for i in copy.deepcopy(instructions):
             command = i.pop('command')
@@ -158,7 +211,10 @@ class JSONLoader():
             start = t.pop('start')
             t['ul'] = t.pop('volume')
             transfers.append((start, t))
-        self._protocol.consolidate(inst['end'], *transfers, tool=inst['tool'])
+        self._protocol.consolidate(
+            inst['end'], *transfers,
+            tool=inst['tool'], multi=inst.get('multi', False)
+        )
 
     def _load_distribute_command(self, inst):
         transfers = []
@@ -166,7 +222,22 @@ class JSONLoader():
             start = t.pop('end')
             t['ul'] = t.pop('volume')
             transfers.append((start, t))
-        self._protocol.distribute(inst['start'], *transfers, tool=inst['tool'])
+        self._protocol.distribute(
+            inst['start'], *transfers,
+            tool=inst['tool'], multi=inst.get('multi', False)
+        )
+
+    def _load_stamp_command(self, inst):
+        inst['ul'] = inst.pop('volume', None)
+        start = inst.pop('source')
+        end = inst.pop('destination')
+        self._protocol.stamp(start, end, **inst)
+
+    def _load_replicate_command(self, inst):
+        inst['ul'] = inst.pop('volume', None)
+        start = "{}:{}".format(inst.pop('source'), inst.pop('column'))
+        plates = inst.pop('plates')
+        self._protocol.replicate(start, *plates, **inst)
 
     @property
     def protocol(self):
@@ -1,4 +1,7 @@
 from labsuite.protocol.handlers.interface import ProtocolHandler
 from labsuite.protocol.handlers.context import ContextHandler
 from labsuite.protocol.handlers.motor_control import MotorControlHandler
-from labsuite.protocol.handlers.requirements import RequirementsHandler
\ No newline at end of file
+from labsuite.protocol.handlers.motor_control import GCodeCompilerHandler
+from labsuite.protocol.handlers.motor_control import IRCompilerHandler
+from labsuite.protocol.handlers.requirements import RequirementsHandler
+from labsuite.protocol.handlers.duration import DurationHandler
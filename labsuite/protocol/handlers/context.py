@@ -1,6 +1,7 @@
 from labsuite.protocol.handlers import ProtocolHandler
 from labsuite.labware import deck, pipettes
 from labsuite.labware.grid import humanize_position
+from labsuite.protocol.calibration import fit_affine
 from labsuite.util import exceptions as ex
 from labsuite.util.filters import find_objects
 
@@ -14,10 +15,14 @@ class ContextHandler(ProtocolHandler):
 
     _deck = None
     _instruments = None  # Axis as keys; Pipette object as vals.
+    _models = None  # {axis: AffineModel}, fitted when first needed.
+    _drawn = None  # {address: liquid names} before the last command drew.
 
     def setup(self):
         self._deck = deck.Deck()
         self._instruments = {}
+        self._models = {}
+        self._drawn = {}
 
     @property
     def _calibration(self):
@@ -55,7 +60,12 @@ class ContextHandler(ProtocolHandler):
         return self._deck.find_module(**filters)
 
     def add_container(self, slot, container_name):
-        self._deck.add_module(slot, container_name)
+        container = self._protocol._registry.load_container(container_name)
+        self._deck.add_module(slot, container())
+
+    def add_ingredient(self, address, name, volume=0):
+        slot, well = address
+        self._deck.slot(slot).get_child(well).add_named_liquid(volume, name)
 
     def get_only_instrument(self):
         ks = list(self._instruments)
@@ -127,6 +137,61 @@ class ContextHandler(ProtocolHandler):
             pos_cal['top'] = top
         if bottom is not None:
             pos_cal['bottom'] = bottom
+        self._models.clear()
+
+    def use_affine(self, axis, enabled=True):
+        """
+        Turns the affine deck model (see protocol.calibration) on or off
+        for an axis.
+        """
+        cal = self.get_axis_calibration(axis)
+        if enabled:
+            cal['_affine'] = True
+        else:
+            cal.pop('_affine', None)
+        self._models.clear()
+
+    def get_affine_model(self, axis):
+        """
+        Returns the AffineModel fitted to the calibrated points for the
+        axis, or None if the axis doesn't use one.
+        """
+        axis = self.normalize_axis(axis)
+        cal = self.get_axis_calibration(axis)
+        if not cal.get('_affine'):
+            return None
+        if axis not in self._models:
+            self._models[axis] = fit_affine(self.calibration_points(axis))
+        return self._models[axis]
+
+    def calibration_points(self, axis):
+        """
+        Returns ((X, Y), (x, y)) pairs of the nominal deck position and
+        calibrated position of every calibrated slot and well on the axis.
+        """
+        points = []
+        for key, values in self.get_axis_calibration(axis).items():
+            if isinstance(key, str) or 'x' not in values or \
+               'y' not in values:
+                continue
+            if isinstance(key[0], tuple):
+                slot, well = key
+                ox, oy = self._deck.slot(slot).get_child_coordinates(well)
+            else:
+                slot, ox, oy = key, 0, 0
+            ax, ay = self.nominal_a1(slot)
+            points.append(((ax + ox, ay + oy), (values['x'], values['y'])))
+        return sorted(points)
+
+    def nominal_a1(self, slot):
+        """
+        Returns the (x, y) of the A1 well of the container in a slot,
+        going by the deck layout and container definition alone.
+        Calibrating a slot sets where its A1 is.
+        """
+        container = self._deck.slot(slot)
+        sx, sy = self._deck.slot_offset(slot)
+        return (sx + (container.a1_x or 0), sy + (container.a1_y or 0))
 
     def calibrate_instrument(self, axis, top=None, blowout=None, droptip=None,
                              bottom=None):
@@ -151,29 +216,19 @@ class ContextHandler(ProtocolHandler):
             position = [position[0], (0, 0)]
         if tool is not None:
             axis = tool.axis
-        cal = self.get_axis_calibration(axis)
         slot, well = position
-        if slot not in cal:
-            raise ex.CalibrationMissing(
-                "No calibration for {} (axis {}).".
-                format(humanize_position(slot), axis)
-            )
-        defaults = ({'top': 0, 'bottom': 0, 'x': 0, 'y': 0})
-        output = {}
-        # Calibration for A1 in this container (x, y, top, bottom).
-        slot_cal = {}
-        slot_cal.update(defaults)
-        slot_cal.update(cal.get((slot), {}))
+        slot_cal, model = self._slot_calibration(slot, axis)
+        container = self._deck.slot(slot)
         # Default offset on x, y calculated from container definition.
-        ox, oy = self._deck.slot(slot).get_child(well).coordinates()
+        ox, oy = container.get_child_coordinates(well)
         # x, y, top bottom
-        well_cal = cal.get((slot, well), {})
-        output.update(well_cal)
+        output = {}
+        output.update(self.get_axis_calibration(axis).get((slot, well), {}))
         # Use calculated offsets if no custom well calibration provided.
-        if 'x' not in output:
-            output['x'] = slot_cal['x'] + ox
-        if 'y' not in output:
-            output['y'] = slot_cal['y'] + oy
+        if 'x' not in output or 'y' not in output:
+            x, y = self._locate_wells(slot, slot_cal, model, [(ox, oy)])[0]
+            output.setdefault('x', x)
+            output.setdefault('y', y)
         # Merge slot and well calibration
         if 'top' not in output:
             output['top'] = slot_cal['top']
@@ -181,6 +236,94 @@ class ContextHandler(ProtocolHandler):
             output['bottom'] = slot_cal['bottom']
         return output
 
+    def get_container_coordinates(self, slot, axis=None, tool=None):
+        """
+        Returns {well position: coordinates} for every well of the
+        container in a slot, worked out in one pass instead of one
+        get_coordinates call per well.
+        """
+        if tool is not None:
+            axis = tool.axis
+        slot_cal, model = self._slot_calibration(slot, axis)
+        container = self._deck.slot(slot)
+        wells = [
+            (col, row)
+            for col in range(container.cols)
+            for row in range(container.rows)
+        ]
+        offsets = [container.get_child_coordinates(w) for w in wells]
+        located = self._locate_wells(slot, slot_cal, model, offsets)
+        cal = self.get_axis_calibration(axis)
+        output = {}
+        for well, (x, y) in zip(wells, located):
+            coords = {
+                'x': x, 'y': y,
+                'top': slot_cal['top'], 'bottom': slot_cal['bottom']
+            }
+            coords.update(cal.get((slot, well), {}))
+            output[well] = coords
+        return output
+
+    def _slot_calibration(self, slot, axis):
+        """
+        Returns the calibration for a slot, with defaults filled in, and
+        the affine model for the axis (or None).
+
+        Under an affine model, slots that were never calibrated take top
+        and bottom from the nearest calibrated slot holding the same kind
+        of container.
+        """
+        cal = self.get_axis_calibration(axis)
+        model = self.get_affine_model(axis)
+        slot_cal = {'top': 0, 'bottom': 0}
+        if slot in cal:
+            slot_cal.update(cal[slot])
+            return slot_cal, model
+        heights = None
+        if model is not None:
+            heights = self._nearest_heights(cal, slot)
+        if heights is None:
+            raise ex.CalibrationMissing(
+                "No calibration for {} (axis {}).".
+                format(humanize_position(slot), axis)
+            )
+        slot_cal.update(heights)
+        return slot_cal, model
+
+    def _nearest_heights(self, cal, slot):
+        name = self._deck.slot(slot).name
+        sx, sy = self._deck.slot_offset(slot)
+        best = None
+        for key, values in cal.items():
+            if isinstance(key, str) or isinstance(key[0], tuple):
+                continue
+            if getattr(self._deck._children.get(key), 'name', None) != name:
+                continue
+            kx, ky = self._deck.slot_offset(key)
+            distance = (kx - sx) ** 2 + (ky - sy) ** 2
+            if best is None or distance < best[0]:
+                heights = {k: values[k] for k in ('top', 'bottom')
+                           if k in values}
+                best = (distance, heights)
+        return best[1] if best else None
+
+    def _locate_wells(self, slot, slot_cal, model, offsets):
+        """
+        Returns the (x, y) of wells at the given offsets in a slot.  Under
+        an affine model, offsets are turned with the deck, starting from
+        the slot's calibrated A1 if it has one.
+        """
+        if model is None:
+            x, y = slot_cal.get('x', 0), slot_cal.get('y', 0)
+            return [(x + ox, y + oy) for ox, oy in offsets]
+        if 'x' in slot_cal and 'y' in slot_cal:
+            x, y = slot_cal['x'], slot_cal['y']
+            (a, b, _), (d, e, _) = model.matrix
+            return [(x + a * ox + b * oy, y + d * ox + e * oy)
+                    for ox, oy in offsets]
+        ax, ay = self.nominal_a1(slot)
+        return model.apply_many([(ax + ox, ay + oy) for ox, oy in offsets])
+
     def get_tiprack(self, pipette, **kwargs):
         """ Returns a tiprack compatible with this pipette. """
         name = 'tiprack.{}'.format(pipette.size.lower())
@@ -193,6 +336,14 @@ class ContextHandler(ProtocolHandler):
         """
         Returns the next tip coordinates and decrements tip inventory.
         """
+        return self.get_coordinates(
+            self.get_next_tip_address(pipette), axis=pipette.axis
+        )
+
+    def get_next_tip_address(self, pipette):
+        """
+        Returns the address of the next tip and decrements tip inventory.
+        """
         # Just grabbing the properties from this rack; we might use a
         # different one.
         xrack = self.get_tiprack(pipette)
@@ -215,20 +366,98 @@ class ContextHandler(ProtocolHandler):
                 "No tiprack found with enough tips for {}-channel {}."
                 .format(pipette.channels, pipette.size)
             )
-        return self.get_coordinates(tip.address, axis=pipette.axis)
+        return tip.address
 
     def get_trash_coordinates(self, tool):
+        return self.get_coordinates(self.get_trash_address(), tool=tool)
+
+    def get_trash_address(self):
         trash = self.find_container(name='point.trash')
         if trash is None:
             raise ex.ContainerMissing("No disposal point (trash) on deck.")
-        return self.get_coordinates(trash.address + [(0, 0)], tool=tool)
+        return trash.address + [(0, 0)]
 
     def get_volume(self, well):
         slot, well = self._protocol._normalize_address(well)
         return self._deck.slot(slot).get_child(well).get_volume()
 
+    def get_liquids(self, address):
+        """
+        Returns a frozenset of the names of the liquids in the well at the
+        given (slot, well) address, or None if they aren't known: the well
+        is empty or holds liquid that was never named.
+        """
+        slot, well = address
+        names = self._deck.slot(slot).get_child(well).get_liquid_names()
+        return known_liquids(names)
+
+    def get_source_liquids(self, address):
+        """
+        Like get_liquids, but for a well the last command drew from,
+        returns the liquids it gave up when the command first drew from
+        it.
+
+        Handlers see a command after it has run here, so their tip
+        decisions use these; otherwise a source drawn exactly dry would
+        look different from one with liquid left over.
+        """
+        if address in self._drawn:
+            return self._drawn[address]
+        return self.get_liquids(address)
+
+    def get_drawn_liquids(self, address):
+        """
+        Like get_liquids, but returns the liquids a transfer out of the
+        well would take, so a well drawn dry keeps its liquid's name.
+        """
+        slot, well = address
+        names = self._deck.slot(slot).get_child(well).get_drawn_names()
+        return known_liquids(names)
+
+    def _draw_from(self, address):
+        """ Records the liquids in a well before it's drawn from. """
+        if address not in self._drawn:
+            self._drawn[address] = self.get_drawn_liquids(address)
+
+    def share_liquid(self, wells):
+        """
+        Returns True if drawing from every well would take the same named
+        liquid, so a tip dipped into one won't contaminate the others.
+        """
+        return same_liquid(self.get_drawn_liquids(w) for w in wells)
+
+    def plan_multi(self, tool, transfers, liquids=None):
+        """
+        Splits the transfers of a multi-dispense or multi-aspirate command
+        into chunks that each fit in one pipette-full of the tool, and
+        groups those chunks by tip.  Returns a list of tips, each a list
+        of chunks.
+
+        A distribute has a single source, so one tip does the lot.  For a
+        consolidate, pass the liquids in each source before the command
+        (see get_source_liquids); a tip is only kept between chunks if
+        they all hold the same liquid.
+        """
+        tool = self.get_instrument(name=tool)
+        chunks = []
+        total = 0
+        for t in transfers:
+            if not chunks or total + t['volume'] > tool.max_vol:
+                chunks.append([])
+                total = 0
+            chunks[-1].append(t)
+            total += t['volume']
+        if liquids is None or same_liquid(liquids):
+            return [chunks] if chunks else []
+        return [[c] for c in chunks]
+
     def transfer(self, start=None, end=None, volume=None, tool=None,
                  **kwargs):
+        self._drawn = {}
+        self._transfer(start, end, volume, tool)
+
+    def _transfer(self, start, end, volume, tool=None):
+        self._draw_from(start)
         start_slot, start_well = start
         end_slot, end_well = end
         start_container = self._deck.slot(start_slot)
@@ -254,10 +483,13 @@ class ContextHandler(ProtocolHandler):
         start.transfer(volume, end)
 
     def transfer_group(self, transfers=None, **kwargs):
+        self._drawn = {}
         for t in transfers:
-            self.transfer(t['start'], t['end'], t['volume'])
+            self._transfer(t['start'], t['end'], t['volume'])
 
     def distribute(self, start, transfers, **kwargs):
+        self._drawn = {}
+        self._draw_from(start)
         start_slot, start_well = start
         start = self._deck.slot(start_slot).get_child(start_well)
         for c in transfers:
@@ -266,15 +498,42 @@ class ContextHandler(ProtocolHandler):
             start.transfer(c.get('volume'), end)
 
     def consolidate(self, end, transfers, **kwargs):
+        self._drawn = {}
         end_slot, end_well = end
         end = self._deck.slot(end_slot).get_child(end_well)
         for c in transfers:
+            self._draw_from(c.get('start'))
             slot, well = c.get('start')
             start = self._deck.slot(slot).get_child(well)
             start.transfer(c.get('volume'), end)
 
     def mix(self, start=None, reps=None, tool=None, volume=None, **kwargs):
+        self._drawn = {}
+        self._draw_from(start)
         slot, well = start
         start = self._deck.slot(slot).get_child(well)
         for i in range(reps):
             start.transfer(volume, start)
+
+
+def known_liquids(names):
+    """
+    Returns a frozenset of liquid names, or None if there are none or any
+    of them were never named.
+    """
+    if not names or 'unspecified' in names:
+        return None
+    return names
+
+
+def same_liquid(liquids):
+    """
+    Returns True if every item of liquids (see get_liquids) is the same
+    single named liquid, so a tip dipped into one won't contaminate the
+    others.
+    """
+    names = set(liquids)
+    if len(names) != 1:
+        return False
+    liquids = names.pop()
+    return liquids is not None and len(liquids) == 1
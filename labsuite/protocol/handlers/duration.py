@@ -0,0 +1,188 @@
+from labsuite.protocol.handlers.motor_control import (
+    MotorControlHandler, PipetteMotor
+)
+from labsuite.labware.tipracks import Tiprack
+from labsuite.util import exceptions as x
+
+
+class DurationEstimate():
+
+    """
+    Result of a duration estimate: the total number of seconds a protocol
+    is expected to take on the robot, and the number of seconds for each
+    command in the protocol.
+    """
+
+    total = 0.0
+    commands = None  # [seconds] Indexed by command.
+    moves = 0  # Number of motor moves.
+    refills = 0  # Number of times the tipracks ran out and were refilled.
+
+    _remaining = None  # [seconds] Suffix sums of commands.
+
+    def __init__(self, commands, moves=0, refills=0):
+        self.commands = commands
+        self.moves = moves
+        self.refills = refills
+        remaining = [0.0] * (len(commands) + 1)
+        for i in range(len(commands) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + commands[i]
+        self._remaining = remaining
+        self.total = remaining[0]
+
+    def remaining(self, index):
+        """
+        Returns the estimated number of seconds left once the first `index`
+        commands have been completed.
+        """
+        return self._remaining[min(index, len(self.commands))]
+
+
+class CoordinateCache():
+
+    """
+    Wraps a ContextHandler and remembers the coordinates it returns.
+    Calibration doesn't change during a run, and the same wells tend to
+    be visited over and over.
+    """
+
+    _context = None
+    _coordinates = None  # {(position, axis): coordinates}
+    _trash = None  # {axis: coordinates}
+
+    def __init__(self, context):
+        self._context = context
+        self._coordinates = {}
+        self._trash = {}
+
+    def get_coordinates(self, position, axis=None, tool=None):
+        if tool is not None:
+            axis = tool.axis
+        key = (tuple(position), axis)
+        if key not in self._coordinates:
+            self._coordinates[key] = self._context.get_coordinates(
+                position, axis=axis
+            )
+        return self._coordinates[key]
+
+    def get_trash_coordinates(self, tool):
+        if tool.axis not in self._trash:
+            self._trash[tool.axis] = self._context.get_trash_coordinates(tool)
+        return self._trash[tool.axis]
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+
+class TimedPipetteMotor(PipetteMotor):
+
+    """
+    PipetteMotor which accounts for the time the robot spends standing
+    still to pick up tips and blow out liquid.
+    """
+
+    def __init__(self, pipette, motor):
+        super(TimedPipetteMotor, self).__init__(pipette, motor)
+        self.context = CoordinateCache(self.context)
+        # Looked up on every move otherwise; the head doesn't change
+        # during a run.
+        self.axis = pipette.axis
+
+    def pickup_tip(self):
+        try:
+            super(TimedPipetteMotor, self).pickup_tip()
+        except x.TipMissing:
+            # Assume someone swaps in fresh racks rather than failing.
+            self.motor.refill_tipracks()
+            super(TimedPipetteMotor, self).pickup_tip()
+        self.motor.dwell(self.motor.pickup_dwell)
+
+    def blowout(self):
+        super(TimedPipetteMotor, self).blowout()
+        self.motor.dwell(self.motor.blowout_dwell)
+
+
+class DurationHandler(MotorControlHandler):
+
+    """
+    Runs the protocol through the MotorControlHandler without a driver
+    and feeds each move into a kinematic model (see MotionModel) to
+    estimate how long the protocol will take on the robot.
+
+    Use Protocol.estimate_duration rather than attaching this directly.
+    """
+
+    pickup_dwell = 1.0  # Seconds to seat a tip.
+    blowout_dwell = 0.5  # Seconds to let the last drop out.
+
+    # The serial driver sends a positioning command before every move, so
+    # each move costs two round trips.
+    lines_per_move = 2
+
+    _model = None
+    _position = None  # {axis: position}
+    _elapsed = 0.0  # Seconds spent on the current command.
+    _times = None  # [seconds] For each completed command.
+    _moves = 0
+    _refills = 0
+
+    _pipette_class = TimedPipetteMotor
+
+    def setup(self):
+        super(DurationHandler, self).setup()
+        if self._model is None:
+            from labsuite.drivers.simulator import MotionModel
+            self._model = MotionModel()
+        self._position = {}
+        self._times = []
+
+    def configure(self, model=None, pickup_dwell=None, blowout_dwell=None,
+                  **kwargs):
+        """
+        Sets the MotionModel used for the estimate (or builds one from the
+        keyword arguments) and the dwell times.
+        """
+        if model is None and kwargs:
+            from labsuite.drivers.simulator import MotionModel
+            model = MotionModel(**kwargs)
+        if model is not None:
+            self._model = model
+        if pickup_dwell is not None:
+            self.pickup_dwell = pickup_dwell
+        if blowout_dwell is not None:
+            self.blowout_dwell = blowout_dwell
+
+    def before_each(self):
+        self._elapsed = 0.0
+
+    def after_each(self):
+        self._times.append(self._elapsed)
+
+    def teardown(self):
+        # Tips kept by the tip policy are dropped after the last command.
+        self._elapsed = 0.0
+        self.dispose_tips()
+        if self._times:
+            self._times[-1] += self._elapsed
+
+    def move_motors(self, **kwargs):
+        model = self._model
+        self._elapsed += model.move_time(self._position, kwargs)
+        self._elapsed += model.latency * self.lines_per_move
+        self._position.update(kwargs)
+        self._moves += 1
+
+    def dwell(self, seconds):
+        self._elapsed += seconds
+
+    def refill_tipracks(self):
+        for module in self._context._deck._children.values():
+            if isinstance(module, Tiprack):
+                module.refill()
+        self._refills += 1
+
+    @property
+    def estimate(self):
+        return DurationEstimate(
+            list(self._times), moves=self._moves, refills=self._refills
+        )
@@ -1,6 +1,13 @@
+import sys
+
 from labsuite.util.log import debug
 from labsuite.protocol.handlers import ProtocolHandler
 import labsuite.drivers.motor as motor_drivers
+from labsuite.drivers import gcode
+from labsuite.drivers.movelog import MoveRing
+from labsuite.protocol.optimizers.clearance import ClearancePlanner
+from labsuite.protocol.handlers.tips import TipTracker
+from labsuite.protocol import ir
 from labsuite.util import exceptions as x
 
 
@@ -8,9 +15,56 @@ class MotorControlHandler(ProtocolHandler):
 
     _driver = None
     _pipette_motors = None  # {axis: PipetteMotor}
+    _pipette_class = None  # Defaults to PipetteMotor.
+    _position = None  # {axis: position} Last position sent to the motors.
+    _clearance = None  # {'margin': mm} if clearance planning is on.
+    _planner = None  # ClearancePlanner for the current context.
+    _tips = None  # TipTracker for the tips on each pipette.
+    _kept = None  # Axes still holding the tip they began the command with.
+    _reused = None  # Axes which reused that tip in the current command.
 
     def setup(self):
         self._pipette_motors = {}
+        self._position = {}
+        self._tips = TipTracker(self._protocol._tip_policy)
+        self._kept = set()
+        self._reused = set()
+
+    def set_context(self, context):
+        super(MotorControlHandler, self).set_context(context)
+        self._pipette_motors = {}  # They hold on to the old context.
+        self._planner = None
+        self._tips = TipTracker(self._protocol._tip_policy)
+        self._kept = set()
+        self._reused = set()
+
+    def plan_clearance(self, enabled=True, margin=None):
+        """
+        With clearance planning on, the pipette only retracts as far as it
+        needs to clear whatever's between it and the next well, rather
+        than all the way up.  See optimizers.clearance.
+        """
+        self._clearance = {'margin': margin} if enabled else None
+        self._planner = None
+
+    def travel_height(self, tool, coords=None):
+        """
+        Returns the z to retract to before moving the tool to the given
+        coordinates, or to leave the current well if none are given.
+        """
+        if self._clearance is None:
+            return 0
+        if self._planner is None:
+            self._planner = ClearancePlanner(self._context, **self._clearance)
+        here = None
+        if 'x' in self._position and 'y' in self._position:
+            here = (self._position['x'], self._position['y'])
+        there = (coords['x'], coords['y']) if coords else None
+        return self._planner.travel_height(tool.axis, here, there)
+
+    @property
+    def plans_clearance(self):
+        return self._clearance is not None
 
     def set_driver(self, driver):
         self._driver = driver
@@ -25,27 +79,150 @@ class MotorControlHandler(ProtocolHandler):
         self.set_driver(motor_drivers.OpenTrons())
         self._driver.connect(device=port)
 
-    def simulate(self):
-        self._driver = motor_drivers.MoveLogger()
+    def use_transport(self, transport, **kwargs):
+        """
+        Switches the MotorControlHandler to the asyncio driver, talking over
+        the given transport (see drivers.async_motor).
+
+        Protocols using this driver must be run with Protocol.run_async.
+        """
+        # asyncio is slow to import, so the driver is only loaded here.
+        import labsuite.drivers.async_motor as async_drivers
+        self.set_driver(async_drivers.AsyncOpenTrons(transport, **kwargs))
+        return self._driver
+
+    def simulate(self, connection=None, sink=None):
+        """
+        Logs moves instead of sending them to the robot.
+
+        If a serial-like connection such as a FirmwareSimulator is
+        provided, the G-code is sent there.  Moves are recorded in the
+        given sink (see drivers.movelog), or in a list by default.
+        """
+        self._driver = motor_drivers.MoveLogger(connection, sink=sink)
         return self._driver
 
     def disconnect(self):
         self._driver.disconnect()
 
+    def replay_ir(self, program, start=0):
+        """
+        Sends a compiled MotionIR (see Protocol.compile_ir) to the robot,
+        starting from command index `start`.  Yields the index of each
+        command as it begins.
+        """
+        if self.is_async:
+            raise RuntimeError("Compiled programs can't be replayed async.")
+        return program.replay(self._driver, start=start)
+
+    def stream_gcode(self, path, start=0):
+        """
+        Sends a compiled G-code file (see Protocol.compile_gcode) to the
+        robot, starting from command index `start`.  Yields the index of
+        each command as it begins.
+        """
+        if self.is_async:
+            raise RuntimeError("Compiled G-code can't be streamed async.")
+        return gcode.stream_gcode(self._driver, path, start=start)
+
+    @property
+    def is_async(self):
+        # If the asyncio driver was never imported, it can't be in use.
+        async_drivers = sys.modules.get('labsuite.drivers.async_motor')
+        return async_drivers is not None and \
+            isinstance(self._driver, async_drivers.AsyncOpenTrons)
+
+    def before_each(self):
+        self._kept = set(self._tips.held())
+        self._reused = set()
+
+    def after_each(self):
+        """
+        With the async driver, mark the end of the command and let the
+        caller wait for the previous one to finish on the robot.  The
+        current command keeps streaming while the next one is planned.
+        """
+        if self.is_async:
+            self._driver.mark()
+            return self._driver.throttle()
+
+    def teardown(self):
+        self.dispose_tips()
+        if self.is_async:
+            return self._driver.drain()
+
+    def use_tip(self, tool, source):
+        """
+        Makes sure the tool has a tip fit to draw from source, according to
+        the protocol's tip policy.
+        """
+        liquids = self._context.get_source_liquids(source)
+        dispose, pickup = self._tips.use(tool.axis, source, liquids)
+        if dispose:
+            tool.dispose_tip()
+        if pickup:
+            tool.pickup_tip()
+            self._drop_kept(tool.axis)
+        elif tool.axis in self._kept:
+            self._reused.add(tool.axis)
+
+    def _drop_kept(self, axis):
+        self._kept.discard(axis)
+
+    def release_tip(self, tool, *wells):
+        """
+        Called when a command is done with the tool's tip, after it's been
+        in the given wells.  The tip is kept if the policy allows.
+        """
+        if self._tips.release(tool.axis):
+            tool.dispose_tip()
+            self._drop_kept(tool.axis)
+            return
+        for well in wells:
+            self._tips.touch(
+                tool.axis, self._context.get_source_liquids(well)
+            )
+
+    def fresh_tip(self, tool):
+        """
+        Picks up a new tip for commands that manage their own, dropping any
+        tip kept from an earlier command.
+        """
+        if self._tips.drop(tool.axis):
+            tool.dispose_tip()
+        tool.pickup_tip()
+        self._drop_kept(tool.axis)
+
+    def dispose_tips(self):
+        """ Drops any tips still held at the end of a run. """
+        for axis in self._tips.held():
+            self._tips.drop(axis)
+            self._pipette_motors[axis].dispose_tip()
+
     def transfer(self, start=None, end=None, volume=None, tool=None, **kwargs):
         tool = self.get_pipette(name=tool, has_volume=volume)
-        tool.pickup_tip()
+        self.use_tip(tool, start)
         self.move_volume(tool, start, end, volume)
-        tool.dispose_tip()
+        self.release_tip(tool, start, end)
 
     def transfer_group(self, transfers=None, tool=None, volume=None, **kwargs):
         tool = self.get_pipette(name=tool, has_volume=volume)
-        tool.pickup_tip()
+        self.fresh_tip(tool)
         for t in transfers:
             self.move_volume(tool, t['start'], t['end'], t['volume'])
         tool.dispose_tip()
 
-    def distribute(self, start=None, transfers=None, tool=None, **kwargs):
+    def distribute(self, start=None, transfers=None, tool=None,
+                   multi=False, **kwargs):
+        if multi:
+            tips = self._context.plan_multi(tool, transfers)
+            pipette = self.get_pipette(name=tool)
+            for chunks in tips:
+                self.fresh_tip(pipette)
+                for chunk in chunks:
+                    self.multi_dispense(pipette, start, chunk)
+                pipette.dispose_tip()
+            return
         for t in transfers:
             self.transfer(
                 start=start,
@@ -55,22 +232,83 @@ class MotorControlHandler(ProtocolHandler):
                 **t
             )
 
-    def consolidate(self, end=None, transfers=None, **kwargs):
+    def consolidate(self, end=None, transfers=None, tool=None,
+                    multi=False, **kwargs):
+        if multi:
+            liquids = [
+                self._context.get_source_liquids(t['start'])
+                for t in transfers
+            ]
+            tips = self._context.plan_multi(tool, transfers, liquids)
+            pipette = self.get_pipette(name=tool)
+            for chunks in tips:
+                self.fresh_tip(pipette)
+                for chunk in chunks:
+                    self.multi_aspirate(pipette, chunk, end)
+                pipette.dispose_tip()
+            return
         for t in transfers:
-            self.transfer(start=t.pop('start'), end=end, **t)
+            self.transfer(start=t.pop('start'), end=end, tool=tool, **t)
 
     def mix(self, start=None, reps=None, tool=None, volume=None, **kwargs):
         tool = self.get_pipette(name=tool, has_volume=volume)
-        tool.pickup_tip()
+        self.use_tip(tool, start)
         for i in range(reps):
             self.move_volume(tool, start, start, volume)
-        tool.dispose_tip()
+        self.release_tip(tool, start)
 
     def move_volume(self, tool, start, end, volume):
         tool.move_to_well(start)
         tool.plunge(volume)
         tool.move_into_well(start)
+        tool.aspirate()
+        tool.move_to_well(end)
+        tool.move_into_well(end)
+        tool.blowout()
+        tool.move_up()
+        tool.reset()
+
+    def multi_dispense(self, tool, start, transfers):
+        """
+        Aspirates the volume for every transfer at once, then dispenses
+        into each destination in turn.
+        """
+        tool.move_to_well(start)
+        tool.plunge(sum(t['volume'] for t in transfers))
+        tool.move_into_well(start)
+        tool.aspirate()
+        dispensed = 0
+        for t in transfers[:-1]:
+            dispensed += t['volume']
+            tool.move_to_well(t['end'])
+            tool.move_into_well(t['end'])
+            tool.dispense(dispensed)
+            tool.move_up()
+        end = transfers[-1]['end']
+        tool.move_to_well(end)
+        tool.move_into_well(end)
+        tool.blowout()
+        tool.move_up()
         tool.reset()
+
+    def multi_aspirate(self, tool, transfers, end):
+        """
+        Aspirates from each source in turn, then dispenses the lot at
+        once.
+        """
+        remaining = sum(t['volume'] for t in transfers)
+        tool.move_to_well(transfers[0]['start'])
+        tool.plunge(remaining)
+        for i, t in enumerate(transfers):
+            if i:
+                tool.move_to_well(t['start'])
+            tool.move_into_well(t['start'])
+            remaining -= t['volume']
+            if i < len(transfers) - 1:
+                tool.aspirate(remaining)
+            else:
+                tool.aspirate()
+            tool.move_up()
         tool.move_to_well(end)
         tool.move_into_well(end)
         tool.blowout()
@@ -89,14 +327,75 @@ class MotorControlHandler(ProtocolHandler):
             )
         axis = pipette.axis
         if axis not in self._pipette_motors:
-            self._pipette_motors[axis] = PipetteMotor(pipette, self)
+            cls = self._pipette_class or PipetteMotor
+            self._pipette_motors[axis] = cls(pipette, self)
         return self._pipette_motors[axis]
 
     def move_motors(self, **kwargs):
         debug("MotorHandler", "Moving: {}".format(kwargs))
+        self._position.update(kwargs)
         self._driver.move(**kwargs)
 
 
+class GCodeCompilerHandler(MotorControlHandler):
+
+    """
+    Writes the G-code for a protocol to a file, with a marker at the start
+    of each command.  See Protocol.compile_gcode.
+    """
+
+    _writer = None
+
+    def compile_to(self, writer):
+        """
+        Sends all G-code to the given GCodeWriter.
+        """
+        self._writer = writer
+        # The moves are in the file; no need to keep them around too.
+        self.simulate(writer, sink=MoveRing(1))
+
+    def before_each(self):
+        super(GCodeCompilerHandler, self).before_each()
+        self._writer.mark()
+
+    def after_each(self):
+        self._writer.reuses(sorted(self._reused))
+
+
+class IRCompilerHandler(MotorControlHandler):
+
+    """
+    Records every move as a row of a MotionIR, tagged with the primitive
+    operation it's part of.  See Protocol.compile_ir.
+    """
+
+    _ir = None
+    _command = 0  # Index of the command being compiled.
+    _op = ir.MOVE  # Operation the current moves belong to.
+    _tool = None  # Axis of the pipette making the current moves.
+
+    def compile_to(self, program):
+        self._ir = program
+        self._command = 0
+
+    def after_each(self):
+        self._ir.set_reused(self._command, sorted(self._reused))
+        self._command += 1
+
+    def teardown(self):
+        # Tips dropped at the end belong to the last command.
+        self._command = max(self._command - 1, 0)
+        self.dispose_tips()
+
+    def move_motors(self, **kwargs):
+        self._position.update(kwargs)
+        row = len(self._ir)
+        self._ir.append(self._op, self._command, self._tool, kwargs)
+        for axis, value in kwargs.items():
+            if isinstance(value, ir.Reference):
+                self._ir.add_reference(row, axis, value.ref)
+
+
 class PipetteMotor():
 
     def __init__(self, pipette, motor):
@@ -120,6 +419,33 @@ class PipetteMotor():
         depth = self.pipette.plunge_depth(volume)
         self.move_axis(depth)
 
+    def aspirate(self, volume=0):
+        """
+        Lets the plunger up from where it was plunged, drawing in liquid
+        until there's room left for only `volume` more.
+        """
+        debug(
+            "PipetteMotor",
+            "Aspirating on {} axis ({}), {}µl left to draw."
+            .format(self.axis, self.name, volume)
+        )
+        if volume:
+            self.move_axis(self.pipette.plunge_depth(volume))
+        else:
+            self.move_axis(0)
+
+    def dispense(self, volume):
+        """
+        Pushes the plunger down until `volume` has been dispensed since
+        the last aspirate.  Use blowout to empty the tip.
+        """
+        debug(
+            "PipetteMotor",
+            "Dispensing on {} axis ({}) to {}µl."
+            .format(self.axis, self.name, volume)
+        )
+        self.move_axis(self.pipette.plunge_depth(volume))
+
     def blowout(self):
         debug(
             "PipetteMotor",
@@ -135,30 +461,45 @@ class PipetteMotor():
         self.move_axis(self.droptip_depth)
 
     def pickup_tip(self):
-        coords = self.context.get_next_tip_coordinates(self)
+        coords = self.locate(self.context.get_next_tip_address(self))
+        self.clear_path(coords)
         self.move(x=coords['x'], y=coords['y'])
         self.move(z=coords['top'])
 
     def dispose_tip(self):
-        coords = self.context.get_trash_coordinates(self)
+        coords = self.locate(self.context.get_trash_address())
+        self.clear_path(coords)
         self.move(x=coords['x'], y=coords['y'])
         self.move(z=coords['top'])
         self.droptip()
         self.reset()
 
+    def clear_path(self, coords):
+        """
+        With clearance planning, retracts before travelling to a tiprack
+        or the trash.  Without it, those moves have never retracted.
+        """
+        if self.motor.plans_clearance:
+            self.move(z=self.motor.travel_height(self, coords))
+
+    def locate(self, address):
+        """ Returns the calibrated coordinates for a (slot, well) address. """
+        return self.context.get_coordinates(address, tool=self)
+
     def move_to_well(self, well):
-        self.move(z=0)  # Move up so we don't hit things.
-        coords = self.context.get_coordinates(well, tool=self)
+        coords = self.locate(well)
+        # Move up so we don't hit things.
+        self.move(z=self.motor.travel_height(self, coords))
         self.move(x=coords['x'], y=coords['y'])
         self.move(z=coords['top'])
 
     def move_into_well(self, well):
-        coords = self.context.get_coordinates(well, tool=self)
+        coords = self.locate(well)
         self.move(x=coords['x'], y=coords['y'])
         self.move(z=coords['bottom'])
 
     def move_up(self):
-        self.move(z=0)
+        self.move(z=self.motor.travel_height(self))
 
     def move(self, **coords):
         self.motor.move_motors(**coords)
@@ -170,3 +511,56 @@ class PipetteMotor():
     def __getattr__(self, name):
         """ Fallback to Pipette for everything else. """
         return getattr(self.pipette, name)
+
+
+class IRPipetteMotor(PipetteMotor):
+
+    """
+    PipetteMotor which tells an IRCompilerHandler which operation each
+    of its moves belongs to.
+    """
+
+    def _as(self, op, method, *args):
+        self.motor._op = op
+        try:
+            return method(*args)
+        finally:
+            self.motor._op = ir.MOVE
+
+    def pickup_tip(self):
+        self._as(ir.PICKUP, super(IRPipetteMotor, self).pickup_tip)
+
+    def dispose_tip(self):
+        self._as(ir.DROP, super(IRPipetteMotor, self).dispose_tip)
+
+    def aspirate(self, volume=0):
+        self._as(ir.ASPIRATE, super(IRPipetteMotor, self).aspirate, volume)
+
+    def dispense(self, volume):
+        self._as(ir.DISPENSE, super(IRPipetteMotor, self).dispense, volume)
+
+    def blowout(self):
+        self._as(ir.BLOWOUT, super(IRPipetteMotor, self).blowout)
+
+    def locate(self, address):
+        """
+        Marks the coordinates that follow the slot's calibration, so the
+        program can be relinked when it changes.
+        """
+        coords = super(IRPipetteMotor, self).locate(address)
+        slot = tuple(address[0])
+        well = tuple(address[1]) if len(address) > 1 else (0, 0)
+        cal = self.context.get_axis_calibration(self.axis)
+        well_cal = cal.get((slot, well), {})
+        return {
+            key: value if key in well_cal or key not in ir.SLOT_KEYS
+            else ir.Reference(value, (self.axis, slot, key))
+            for key, value in coords.items()
+        }
+
+    def move(self, **coords):
+        self.motor._tool = self.axis
+        super(IRPipetteMotor, self).move(**coords)
+
+
+IRCompilerHandler._pipette_class = IRPipetteMotor
@@ -1,4 +1,5 @@
 from labsuite.protocol.handlers import ProtocolHandler
+from labsuite.protocol.handlers.tips import TipTracker
 from labsuite.util import exceptions as x
 from copy import deepcopy
 
@@ -14,33 +15,52 @@ class RequirementsHandler(ProtocolHandler):
     """
 
     _requirements = None  # {}
+    _tips = None  # TipTracker, mirroring the MotorControlHandler's.
 
     def setup(self):
         self._requirements = []
+        self._tips = TipTracker(self._protocol._tip_policy)
+
+    def set_context(self, context):
+        super(RequirementsHandler, self).set_context(context)
+        self._tips = TipTracker(self._protocol._tip_policy)
 
     def transfer(self, start=None, end=None, volume=None, tool=None, **kwargs):
         self._assert_calibration(tool, start, end)
-        self._advance_tip(tool)
+        self._use_tip(tool, start, end)
 
     def transfer_group(self, transfers=None, tool=None, volume=None, **kwargs):
         for t in transfers:
             self._assert_calibration(tool, t['start'], t['end'])
-        self._advance_tip(tool)
+        self._fresh_tip(tool)
 
-    def distribute(self, start=None, transfers=None, tool=None, **kwargs):
+    def distribute(self, start=None, transfers=None, tool=None,
+                   multi=False, **kwargs):
         for t in transfers:
             self._assert_calibration(tool, start, t['end'])
-            self._advance_tip(tool)
-
-    def consolidate(self, end=None, transfers=None, tool=None, **kwargs):
+            if not multi:
+                self._use_tip(tool, start, t['end'])
+        if multi:
+            for tip in self._context.plan_multi(tool, transfers):
+                self._fresh_tip(tool)
+
+    def consolidate(self, end=None, transfers=None, tool=None,
+                    multi=False, **kwargs):
         for t in transfers:
             self._assert_calibration(tool, start=t['start'], end=end)
-            self._advance_tip(tool)
+            if not multi:
+                self._use_tip(tool, t['start'], end)
+        if multi:
+            liquids = [
+                self._context.get_source_liquids(t['start'])
+                for t in transfers
+            ]
+            for tip in self._context.plan_multi(tool, transfers, liquids):
+                self._fresh_tip(tool)
 
     def mix(self, start=None, reps=None, tool=None, volume=None, **kwargs):
-        for i in range(reps):
-            self._assert_calibration(tool, start, start)
-            self._advance_tip(tool)
+        self._assert_calibration(tool, start, start)
+        self._use_tip(tool, start, start)
 
     def _assert_calibration(self, tool, start, end):
         tool = self._context.get_instrument(name=tool)
@@ -50,6 +70,27 @@ class RequirementsHandler(ProtocolHandler):
             self._check_container_calibration(c, tool)
         self._check_instrument_calibration(tool)
 
+    def _use_tip(self, tool_name, source, *wells):
+        """
+        Counts a tip for drawing from source unless the tip policy lets the
+        last one be reused.  See MotorControlHandler.use_tip.
+        """
+        axis = self._context.get_instrument(name=tool_name).axis
+        liquids = self._context.get_source_liquids(source)
+        dispose, pickup = self._tips.use(axis, source, liquids)
+        if pickup:
+            self._advance_tip(tool_name)
+        if not self._tips.release(axis):
+            for well in (source,) + wells:
+                self._tips.touch(
+                    axis, self._context.get_source_liquids(well)
+                )
+
+    def _fresh_tip(self, tool_name):
+        axis = self._context.get_instrument(name=tool_name).axis
+        self._tips.drop(axis)
+        self._advance_tip(tool_name)
+
     def _advance_tip(self, tool_name):
         """
         Advances the tip inventory for the tool in question. We need this
@@ -0,0 +1,107 @@
+"""
+Decides when a pipette needs a fresh tip.
+
+Each pipette holds at most one tip.  Under the default 'always' policy a
+tip is dropped as soon as a command is done with it.  Under the others,
+the tip stays on and the TipTracker keeps a record of what it has
+touched, so the next command can tell in one comparison whether the tip
+is still clean enough:
+
+* 'per-source': reused while liquid keeps coming from the same well.
+* 'per-liquid': reused while the source holds exactly the liquids the
+  tip has already touched.  Wells with unnamed liquids are never
+  assumed to match.
+* 'never': one tip per pipette for the whole run.
+
+The MotorControlHandler and RequirementsHandler both use a TipTracker,
+so the tips a run picks up are the tips the requirements count.
+"""
+
+POLICIES = ('always', 'per-source', 'per-liquid', 'never')
+
+
+class TipRecord():
+
+    """ What a tip on a pipette has been in contact with. """
+
+    __slots__ = ('source', 'liquids')
+
+    def __init__(self, source):
+        self.source = source  # Well the tip first drew liquid from.
+        self.liquids = frozenset()  # Liquid names; None if any unknown.
+
+    def touch(self, liquids):
+        if self.liquids is None or liquids is None:
+            self.liquids = None
+        else:
+            self.liquids = self.liquids | liquids
+
+
+class TipTracker():
+
+    policy = 'always'
+
+    _tips = None  # {axis: TipRecord}
+
+    def __init__(self, policy=None):
+        if policy is not None:
+            if policy not in POLICIES:
+                raise ValueError(
+                    "Unknown tip policy: {}. Choose from {}."
+                    .format(policy, ', '.join(POLICIES))
+                )
+            self.policy = policy
+        self._tips = {}
+
+    def holding(self, axis):
+        return axis in self._tips
+
+    def can_reuse(self, axis, source, liquids):
+        """
+        Returns True if the tip on the given axis may be used to draw from
+        source, which holds the given liquids (a frozenset of names, or
+        None if unknown).
+        """
+        tip = self._tips.get(axis)
+        if tip is None or self.policy == 'always':
+            return False
+        if self.policy == 'never':
+            return True
+        if self.policy == 'per-source':
+            return tip.source == source
+        return tip.liquids is not None and tip.liquids == liquids
+
+    def use(self, axis, source, liquids):
+        """
+        Records that the pipette on the axis is about to draw from source.
+
+        Returns (dispose, pickup): whether the held tip must be dropped
+        first, and whether a new one must be picked up.
+        """
+        if self.can_reuse(axis, source, liquids):
+            return False, False
+        dispose = self.holding(axis)
+        self._tips[axis] = TipRecord(source)
+        return dispose, True
+
+    def touch(self, axis, liquids):
+        """ Records liquids that the tip on the axis has been in. """
+        self._tips[axis].touch(liquids)
+
+    def release(self, axis):
+        """
+        Called when a command is done with a tip.  Returns True if the tip
+        should be dropped now.
+        """
+        if self.policy == 'always':
+            self.drop(axis)
+            return True
+        return False
+
+    def drop(self, axis):
+        """ Forgets the tip on the axis; returns True if there was one. """
+        return self._tips.pop(axis, None) is not None
+
+    def held(self):
+        """ Returns the axes currently holding a tip. """
+        return sorted(self._tips)
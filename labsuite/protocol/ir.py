@@ -0,0 +1,344 @@
+"""
+A flat motion program compiled from a Protocol.
+
+Running a protocol through the handlers works out the tools, coordinates
+and tips for every command as it goes, and every handler does it again.
+Protocol.compile_ir does that work once and keeps the result as a
+MotionIR: one row per motor move, stored in flat arrays, with the
+primitive operation the move belongs to and the command it came from.
+
+The program can then be replayed to a motor driver (Protocol.run_ir),
+timed (MotionIR.estimate) or checked for tip use (MotionIR.tips_used)
+without going back through the handlers.  Compiled programs are cached
+against the protocol and calibration hashes.
+
+Programs are also relocatable.  Every x, y and z value that came from a
+slot's calibration is recorded against that (axis, slot, calibration
+key), along with a copy of the calibration it was compiled with.  When
+only slot calibration changes, MotionIR.relink translates the affected
+values by the difference instead of compiling the protocol again.
+"""
+
+import copy
+from array import array
+
+from labsuite.drivers.movelog import AXES
+from labsuite.drivers.gcode import check_resume
+
+# Primitive operations.  Every move made while picking up a tip is a
+# PICKUP, and so on; gantry moves between operations are plain MOVEs.
+MOVE = 0
+PICKUP = 1
+DROP = 2
+ASPIRATE = 3
+DISPENSE = 4
+BLOWOUT = 5
+
+OPS = ('move', 'pickup', 'drop', 'aspirate', 'dispense', 'blowout')
+
+NO_TOOL = 0  # Tool column value for moves that aren't tied to a pipette.
+
+# Slot calibration keys that coordinates are worked out from.
+SLOT_KEYS = ('x', 'y', 'top', 'bottom')
+
+
+class Reference(float):
+
+    """
+    A coordinate that follows a slot's calibration: the (pipette axis,
+    slot, calibration key) it was worked out from travels with the value
+    through the motor handler, so the compiler can record it.
+    """
+
+    __slots__ = ('ref',)
+
+    def __new__(cls, value, ref):
+        self = float.__new__(cls, value)
+        self.ref = ref
+        return self
+
+
+class MotionIR():
+
+    protocol_hash = None
+    calibration_hash = None
+
+    # Columns, one entry per row (values has one per axis per row).
+    _ops = None  # array('B')
+    _commands = None  # array('I') Index of the command the row is from.
+    _tools = None  # array('B') ord() of the pipette axis, or NO_TOOL.
+    _masks = None  # array('B') Bitmask of the axes the row moves.
+    _values = None  # array('d')
+
+    _starts = None  # array('I') First row of each command, plus the end.
+    _count = None  # Number of commands, once compiled.
+
+    calibration = None  # Calibration compiled against, if relocatable.
+    _relocs = None  # {(axis, slot, key): array('I') of indexes in _values}
+
+    # {command index: [axis]} Tips kept from an earlier command which the
+    # command reuses.
+    _reused = None
+
+    def __init__(self, protocol_hash=None, calibration_hash=None):
+        self.protocol_hash = protocol_hash
+        self.calibration_hash = calibration_hash
+        self._ops = array('B')
+        self._commands = array('I')
+        self._tools = array('B')
+        self._masks = array('B')
+        self._values = array('d')
+        self._relocs = {}
+        self._reused = {}
+
+    def append(self, op, command, tool, move):
+        """
+        Adds a row: a move ({axis: position}) made as part of the given
+        operation, for the command at the given index, by the pipette on
+        the given axis (or None).
+        """
+        mask = 0
+        values = [0.0] * len(AXES)
+        for axis, value in move.items():
+            i = AXES.index(axis.lower())
+            mask |= 1 << i
+            values[i] = value
+        self._ops.append(op)
+        self._commands.append(command)
+        self._tools.append(ord(tool) if tool else NO_TOOL)
+        self._masks.append(mask)
+        self._values.extend(values)
+        self._starts = None
+
+    def add_reference(self, row, axis, ref):
+        """
+        Records that the value for the given motor axis in a row follows
+        the slot calibration described by ref (see Reference).
+        """
+        index = row * len(AXES) + AXES.index(axis.lower())
+        self._relocs.setdefault(ref, array('I')).append(index)
+
+    def references(self):
+        """
+        Returns {(row, axis): (axis, slot, key)} for every value that
+        follows a slot's calibration (see add_reference).
+        """
+        width = len(AXES)
+        out = {}
+        for ref, indexes in self._relocs.items():
+            for index in indexes:
+                row, n = divmod(index, width)
+                out[(row, AXES[n])] = ref
+        return out
+
+    def copy(self):
+        out = MotionIR(self.protocol_hash, self.calibration_hash)
+        out._ops = array('B', self._ops)
+        out._commands = array('I', self._commands)
+        out._tools = array('B', self._tools)
+        out._masks = array('B', self._masks)
+        out._values = array('d', self._values)
+        out._count = self._count
+        out.calibration = self.calibration
+        out._relocs = dict(self._relocs)
+        out._reused = dict(self._reused)
+        return out
+
+    def can_relink(self, calibration):
+        """
+        Returns True if the only differences between the given calibration
+        and the one the program was compiled with are in slot calibration,
+        so relink can bring the program up to date.
+        """
+        if self.calibration is None:
+            return False
+        for axis in set(self.calibration) | set(calibration):
+            old = self.calibration.get(axis, {})
+            new = calibration.get(axis, {})
+            for key in set(old) | set(new):
+                if old.get(key) == new.get(key):
+                    continue
+                # Instrument and well calibration, or any change under an
+                # affine model, change more than a translation of the
+                # slot's moves.
+                if isinstance(key, str) or isinstance(key[0], tuple) or \
+                   old.get('_affine') or new.get('_affine'):
+                    return False
+        return True
+
+    def relink(self, calibration, calibration_hash=None):
+        """
+        Returns a copy of the program with every move that depends on a
+        recalibrated slot translated to the new calibration, or None if
+        the change isn't one relink can handle (see can_relink).
+
+        Only the values of recalibrated slots are touched.
+        """
+        if not self.can_relink(calibration):
+            return None
+        out = self.copy()
+        out.calibration_hash = calibration_hash
+        out.calibration = copy.deepcopy(calibration)
+        values = out._values
+        for (axis, slot, key), indexes in self._relocs.items():
+            before = self.calibration.get(axis, {}).get(slot, {})
+            after = calibration.get(axis, {}).get(slot, {})
+            delta = after.get(key, 0) - before.get(key, 0)
+            if delta:
+                for i in indexes:
+                    values[i] += delta
+        return out
+
+    def __len__(self):
+        return len(self._ops)
+
+    def __getitem__(self, i):
+        """ Returns (op, command, tool, move) for row i. """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Row {} out of range.".format(i))
+        tool = self._tools[i]
+        return (
+            self._ops[i],
+            self._commands[i],
+            chr(tool) if tool != NO_TOOL else None,
+            self.move(i)
+        )
+
+    def move(self, i):
+        """ Returns the {axis: position} move for row i. """
+        mask = self._masks[i]
+        base = i * len(AXES)
+        return {
+            axis: self._values[base + n]
+            for n, axis in enumerate(AXES)
+            if mask & (1 << n)
+        }
+
+    @property
+    def commands(self):
+        """ Number of commands the program was compiled from. """
+        return len(self._command_starts()) - 1
+
+    def command_rows(self, index):
+        """ Returns the range of rows for the command at index. """
+        starts = self._command_starts()
+        return range(starts[index], starts[index + 1])
+
+    def set_commands(self, count):
+        """
+        Records the number of commands, so commands with no moves still
+        count.  Called once compiling is done.
+        """
+        self._count = count
+        self._starts = None
+
+    def _command_starts(self):
+        if self._starts is None:
+            count = self._count
+            if count is None:
+                count = self._commands[-1] + 1 if len(self) else 0
+            starts = array('I', [0] * (count + 1))
+            # Rows are in command order; count the rows of each command,
+            # then turn the counts into offsets.
+            for c in self._commands:
+                starts[c + 1] += 1
+            for i in range(count):
+                starts[i + 1] += starts[i]
+            self._starts = starts
+        return self._starts
+
+    def set_reused(self, index, axes):
+        """
+        Records the axes on which the command at index reuses a tip kept
+        from an earlier command.
+        """
+        if axes:
+            self._reused[index] = list(axes)
+
+    def reused(self, index):
+        """
+        Returns the axes on which the command at index reuses a tip kept
+        from an earlier command.
+        """
+        return list(self._reused.get(index, []))
+
+    def resume_point(self, start):
+        """
+        Returns the index of the latest command, at or before `start`,
+        which doesn't reuse a tip kept from an earlier command, so the
+        program can be replayed from it.
+        """
+        while start > 0 and start in self._reused:
+            start -= 1
+        return start
+
+    def tips_used(self):
+        """ Returns {axis: number of tips picked up}. """
+        used = {}
+        previous = None
+        for i in range(len(self)):
+            op = self._ops[i]
+            if op == PICKUP and previous != PICKUP:
+                axis = chr(self._tools[i])
+                used[axis] = used.get(axis, 0) + 1
+            previous = op
+        return used
+
+    def replay(self, driver, start=0):
+        """
+        Sends the moves to a motor driver, starting from the command at
+        index `start`.  A generator yielding the index of each command as
+        it begins.  When resuming, the robot is homed first, and
+        ResumeUnsafe is raised if the command would need a tip it no
+        longer has (see resume_point).
+        """
+        if start:
+            check_resume(start, self.resume_point(start))
+            driver.home()
+        for index in range(start, self.commands):
+            yield index
+            for i in self.command_rows(index):
+                driver.move(**self.move(i))
+
+    def estimate(self, model=None, pickup_dwell=None, blowout_dwell=None,
+                 lines_per_move=None):
+        """
+        Times the program with a MotionModel and returns a
+        DurationEstimate, as Protocol.estimate_duration does.  Unlike the
+        handler-based estimate, tipracks are never refilled: the program
+        was compiled against the tips on the deck.
+        """
+        from labsuite.drivers.simulator import MotionModel
+        from labsuite.protocol.handlers.duration import (
+            DurationHandler, DurationEstimate
+        )
+        model = model or MotionModel()
+        if pickup_dwell is None:
+            pickup_dwell = DurationHandler.pickup_dwell
+        if blowout_dwell is None:
+            blowout_dwell = DurationHandler.blowout_dwell
+        if lines_per_move is None:
+            lines_per_move = DurationHandler.lines_per_move
+        per_move = model.latency * lines_per_move
+        position = {}
+        times = [0.0] * self.commands
+        n = len(self)
+        for i in range(n):
+            move = self.move(i)
+            elapsed = model.move_time(position, move) + per_move
+            position.update(move)
+            op = self._ops[i]
+            if op == PICKUP and (i + 1 == n or self._ops[i + 1] != PICKUP):
+                elapsed += pickup_dwell  # Seated; wait for it.
+            elif op == BLOWOUT:
+                elapsed += blowout_dwell
+            times[self._commands[i]] += elapsed
+        return DurationEstimate(times, moves=n)
+
+    def __repr__(self):
+        return "<MotionIR {} commands, {} moves>".format(
+            self.commands, len(self)
+        )
+
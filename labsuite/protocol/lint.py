@@ -0,0 +1,325 @@
+"""
+Static checks for protocols.
+
+Running a protocol on the ContextHandler (as the virtual run and
+run_requirements do) finds mistakes one at a time, and only after
+simulating every liquid and tip up to the first one.  lint() instead
+walks the command log once, looking each command up against what's on
+the deck and head, and returns a LintProblem for everything it finds:
+
+ * addresses in containers that aren't on the deck, or outside them
+ * tools that aren't on the head, and volumes they can't pipette
+ * tools with no tiprack of their size, and a deck with no trash
+ * multichannel transfers on square plates
+
+No liquids or tips are tracked, so this takes time in proportion to the
+number of commands (and transfers within them), and says nothing about
+problems that depend on what's in a well.
+
+lint_json() checks a protocol in the JSON format without loading it into
+a Protocol, so it can catch unknown labels and containers as well:
+
+    problems = lint_json(text)
+    for problem in problems:
+        print(problem)  # Command 12: Volume of 5 is out of range for p200.
+"""
+
+import json
+
+from labsuite.labware import containers, pipettes
+from labsuite.labware.grid import normalize_position, normalize_column
+from labsuite.labware.grid import humanize_position
+from labsuite.util import exceptions as x
+
+# Well addresses within each command and its transfers, by command.
+ADDRESSES = {
+    'transfer': (('start', 'end'), ()),
+    'mix': (('start',), ()),
+    'transfer_group': ((), ('start', 'end')),
+    'distribute': (('start',), ('end',)),
+    'consolidate': (('end',), ('start',)),
+    'stamp': ((), ()),
+    'replicate': ((), ())
+}
+
+TRASH = 'point.trash'
+
+
+class LintProblem():
+
+    """ A problem with a protocol, found without running it. """
+
+    index = None  # Index of the command, or None for the deck and head.
+    message = None
+
+    def __init__(self, index, message):
+        self.index = index
+        self.message = message
+
+    def to_dict(self):
+        return {'index': self.index, 'message': self.message}
+
+    def __str__(self):
+        if self.index is None:
+            return self.message
+        return "Command {}: {}".format(self.index, self.message)
+
+    def __repr__(self):
+        return "<LintProblem {}>".format(self)
+
+
+class Linter():
+
+    """
+    Checks commands against the containers and instruments added to it.
+    Addresses can be normalized, as in Protocol.commands, or strings, as
+    in the JSON format.
+    """
+
+    problems = None  # [LintProblem]
+
+    _registry = None
+    _deck = None  # {slot: container instance}
+    _labels = None  # {lowercase label: slot}
+    _tools = None  # {name: Pipette}
+    _names = None  # Names of the containers on the deck.
+    _reported = None  # Missing racks (and trash) already reported.
+    _index = None  # Index of the command being checked.
+
+    def __init__(self, registry=None):
+        self.problems = []
+        self._registry = registry or containers.default_registry
+        self._deck = {}
+        self._labels = {}
+        self._tools = {}
+        self._names = set()
+        self._reported = set()
+
+    def error(self, message, *args):
+        self.problems.append(LintProblem(self._index, message.format(*args)))
+
+    def add_container(self, slot, name, label=None):
+        try:
+            slot = normalize_position(slot)
+        except (TypeError, ValueError):
+            self.error("Invalid slot for {}: {}", name, slot)
+            return
+        try:
+            container = self._registry.load_container(name)()
+        except (KeyError, TypeError):
+            self.error("Unknown container in slot {}: {}",
+                       humanize_position(slot), name)
+            return
+        self._deck[slot] = container
+        self._names.add(container.name)
+        if label:
+            self._labels[label.lower()] = slot
+
+    def add_instrument(self, axis, name):
+        try:
+            tool = pipettes.load_instrument(name)
+        except AttributeError:
+            self.error("Unknown instrument on axis {}: {}", axis, name)
+            return
+        self._tools[tool.name] = tool
+
+    def check_all(self, commands):
+        """ Checks each command in turn and returns every problem found. """
+        for index, command in enumerate(commands):
+            self.check(index, command)
+        self._index = None
+        return self.problems
+
+    def check(self, index, command):
+        self._index = index
+        name = command.get('command')
+        if name not in ADDRESSES:
+            self.error("Unknown command: {}", name)
+            return
+        tool = self._tool(command.get('tool'))
+        keys, transfer_keys = ADDRESSES[name]
+        wells = [self._well(command, k) for k in keys]
+        if transfer_keys:
+            transfers = command.get('transfers') or []
+            if not transfers:
+                self.error("No transfers given.")
+            for t in transfers:
+                self._volume(tool, t.get('volume'))
+                for k in transfer_keys:
+                    self._well(t, k)
+        else:
+            self._volume(tool, command.get('volume'))
+        if name == 'transfer' and tool is not None and tool.channels > 1:
+            container = wells[0] and self._deck[wells[0][0]]
+            if container is not None and container.rows == container.cols:
+                self.error(
+                    "Ambiguous multichannel transfer; plate is square."
+                )
+        elif name == 'stamp':
+            self._check_stamp(command)
+        elif name == 'replicate':
+            self._check_replicate(command)
+
+    def _check_stamp(self, command):
+        source = self._container(command.get('source'))
+        destination = self._container(command.get('destination'))
+        if source is None or destination is None:
+            return
+        region = command.get('region')
+        if region is None:
+            region = ((0, 0), (source.cols - 1, source.rows - 1))
+        elif len(region) != 2:
+            self.error("Region must be given as two opposite wells.")
+            return
+        for corner in region:
+            self._in(source, corner)
+            self._in(destination, corner)
+
+    def _check_replicate(self, command):
+        source = self._container(command.get('source'))
+        column = self._column(command.get('column'))
+        to_column = self._column(command.get('to_column', column))
+        plates = [self._container(p) for p in command.get('plates') or []]
+        if not plates:
+            self.error("No plates to replicate into.")
+        if source is None or column is None or to_column is None:
+            return
+        self._in(source, (column, source.rows - 1))
+        for plate in plates:
+            if plate is not None:
+                self._in(plate, (to_column, source.rows - 1))
+
+    def _tool(self, name):
+        """
+        Returns the named Pipette, reporting it if it's not on the head,
+        or if there's no tiprack (or trash) for it.
+        """
+        if name is None:
+            self.error("No tool given.")
+            return None
+        tool = self._tools.get(name)
+        if tool is None:
+            self.error("No instrument on the head named {}.", name)
+            return None
+        rack = 'tiprack.{}'.format(tool.size.lower())
+        for needed in (rack, TRASH):
+            if needed not in self._names and needed not in self._reported:
+                self._reported.add(needed)
+                self.error("No {} on the deck for {}.", needed, name)
+        return tool
+
+    def _volume(self, tool, volume):
+        if volume is None:
+            self.error("No volume given.")
+        elif not isinstance(volume, (int, float)) or volume <= 0:
+            self.error("Volume must exceed 0, not {!r}.", volume)
+        elif tool is not None and not tool.supports_volume(volume):
+            self.error(
+                "Volume of {} is out of range for {} ({} to {}).",
+                volume, tool.name, tool.min_vol, tool.max_vol
+            )
+
+    def _slot(self, name):
+        """ Returns the slot for a slot name, label or tuple, or None. """
+        if isinstance(name, str) and name.lower() in self._labels:
+            return self._labels[name.lower()]
+        try:
+            return normalize_position(name)
+        except (TypeError, ValueError):
+            return None
+
+    def _container(self, name):
+        """ Returns the container in a slot (or labelled), or None. """
+        slot = self._slot(name)
+        if slot not in self._deck:
+            self.error("Container not found: {}", name)
+            return None
+        return self._deck[slot]
+
+    def _well(self, command, key):
+        """
+        Returns the (slot, well) at command[key], or None if it isn't a
+        valid address.
+        """
+        address = command.get(key)
+        if address is None:
+            self.error("No {} given.", key)
+            return None
+        if isinstance(address, str):
+            if ':' not in address:
+                self.error("Address must be in the form of "
+                           "'container:well', not {}.", address)
+                return None
+            name, well = address.split(':', 1)
+        else:
+            name, well = address
+        container = self._container(name)
+        if container is None:
+            return None
+        try:
+            well = normalize_position(well)
+        except (TypeError, ValueError) as e:
+            self.error("Invalid well {}: {}", address, e)
+            return None
+        if not self._in(container, well):
+            return None
+        return (self._slot(name), well)
+
+    def _column(self, column):
+        if isinstance(column, int):
+            return column
+        try:
+            return normalize_column(column)
+        except (AttributeError, ValueError):
+            self.error("Invalid column: {}", column)
+            return None
+
+    def _in(self, container, well):
+        """ Reports a well that's outside its container. """
+        try:
+            container._normalize_position(well)
+        except (TypeError, ValueError, x.SlotMissing) as e:
+            self.error("{}: {}", container.name, e)
+            return False
+        return True
+
+
+def lint(protocol):
+    """
+    Checks a Protocol without running it, and returns a LintProblem for
+    everything wrong with it.
+    """
+    linter = Linter(protocol._registry)
+    labels = {
+        slot: protocol._label_case[label]
+        for label, slot in protocol._container_labels.items()
+    }
+    for slot, name in sorted(protocol._containers.items()):
+        linter.add_container(slot, name, labels.get(slot))
+    for axis, name in sorted(protocol._head.items()):
+        linter.add_instrument(axis, name)
+    return linter.check_all(protocol._commands)
+
+
+def lint_json(text, registry=None):
+    """
+    Checks a protocol in the JSON format (see JSONFormatter) without
+    loading it, and returns a LintProblem for everything wrong with it.
+    """
+    linter = Linter(registry)
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        linter.error("Invalid JSON: {}", e)
+        return linter.problems
+    if not isinstance(data, dict):
+        linter.error("Expected a JSON object.")
+        return linter.problems
+    for container in data.get('containers') or []:
+        linter.add_container(
+            container.get('slot'), container.get('name'),
+            container.get('label')
+        )
+    for inst in (data.get('instruments') or {}).values():
+        linter.add_instrument(inst.get('axis'), inst.get('name'))
+    return linter.check_all(data.get('instructions') or [])
@@ -0,0 +1,285 @@
+"""
+Bill of materials: what a protocol uses up, worked out without running it.
+
+Counting tips and volumes used to mean running the protocol and looking
+at the ContextHandler afterwards, which tracks every liquid in every well
+and moves every tip in its racks.  A BillOfMaterials takes the commands
+one at a time, in a single pass, and keeps only what it needs:
+
+ * tips picked up, by pipette size; a multichannel pickup takes a whole
+   row or column of a rack, one tip per channel
+ * the volume that has to be in each well before the run: the most it
+   runs short by at any point, counting what's added along the way
+ * the wells used in each container
+
+Tips are counted with a TipTracker under the protocol's tip policy, like
+the MotorControlHandler does.  For the 'per-liquid' policy, each well's
+liquids are tracked by name, along with its level.  A well drawn dry
+gives up its only liquid, and one emptied exactly takes on the names of
+whatever is added next, as in the ContextHandler; mixtures are only
+followed by name, so a mixture drawn down to a rounding error may still
+differ.
+
+    bill = protocol.bill_of_materials()
+    bill.tips  # {'P200': 96, 'P10': 24}
+"""
+
+from labsuite.protocol import plates
+from labsuite.protocol.handlers.tips import TipTracker
+
+# What the ContextHandler names liquid drawn from a well with none in it.
+UNSPECIFIED = frozenset(['unspecified'])
+
+
+class BillOfMaterials():
+
+    """
+    Adds up the materials used by commands passed to add_command, given
+    the deck and head of a ContextHandler (only their shapes are used).
+    """
+
+    tips = None  # {pipette size: tips}
+    pickups = None  # {tool name: times a tip, or line of tips, was taken}
+    wells = None  # {slot: set of wells used}
+
+    _context = None
+    _ingredients = None  # {(slot, well): (name, volume)}
+    _tracker = None  # TipTracker
+    _tools = None  # {tool name: Pipette}
+    _names = None  # {(slot, well): frozenset of liquid names}
+    _net = None  # {(slot, well): net change in volume so far}
+    _short = None  # {(slot, well): most the net change has fallen to}
+    _drawn = None  # {(slot, well): names a step took from the well}
+
+    def __init__(self, context, policy=None, ingredients=None):
+        self.tips = {}
+        self.pickups = {}
+        self.wells = {}
+        self._context = context
+        self._ingredients = dict(ingredients or {})
+        self._tracker = TipTracker(policy)
+        self._tools = {}
+        self._names = {
+            address: frozenset([name])
+            for address, (name, _) in self._ingredients.items()
+        }
+        self._net = {}
+        self._short = {}
+        self._drawn = {}
+
+    @property
+    def volumes(self):
+        """
+        {(slot, well): ul} that has to be in each well drawn from, before
+        the run, for it never to run dry.
+        """
+        return {a: -v for a, v in self._short.items() if v < 0}
+
+    @property
+    def liquids(self):
+        """ {ingredient name: ul} drawn from the wells it was added to. """
+        out = {}
+        for address, ul in self.volumes.items():
+            if address in self._ingredients:
+                name = self._ingredients[address][0]
+                out[name] = out.get(name, 0) + ul
+        return out
+
+    @property
+    def occupancy(self):
+        """ {slot: number of wells used}. """
+        return {slot: len(wells) for slot, wells in self.wells.items()}
+
+    def add_command(self, command):
+        """
+        Adds a command, like those in Protocol.commands.  As in a run, the
+        liquid is moved for each step of a plate command just before its
+        tips are counted.
+        """
+        for step in plates.expand(command, self._context):
+            self._drawn = {}
+            self._move(step)
+            self._count_tips(step)
+
+    def _move(self, command):
+        name = command['command']
+        if name == 'transfer':
+            tool = self._tool(command['tool'])
+            for start, end in self._lines(tool, command):
+                self._transfer(start, end, command['volume'])
+        elif name == 'mix':
+            self._use(command['start'])
+            if command.get('reps'):
+                self._draw(command['start'])
+        elif name == 'distribute':
+            for t in command['transfers']:
+                self._transfer(command['start'], t['end'], t['volume'])
+        elif name == 'consolidate':
+            for t in command['transfers']:
+                self._transfer(t['start'], command['end'], t['volume'])
+        elif name == 'transfer_group':
+            for t in command['transfers']:
+                self._transfer(t['start'], t['end'], t['volume'])
+
+    def _count_tips(self, command):
+        """ Mirrors the tips taken by the MotorControlHandler. """
+        name = command['command']
+        tool = command['tool']
+        transfers = command.get('transfers', [])
+        if name == 'transfer':
+            self._use_tip(tool, command['start'], command['end'])
+        elif name == 'mix':
+            self._use_tip(tool, command['start'])
+        elif name == 'transfer_group':
+            self._fresh_tip(tool)
+        elif name == 'distribute' and not command.get('multi'):
+            for t in transfers:
+                self._use_tip(tool, command['start'], t['end'])
+        elif name == 'consolidate' and not command.get('multi'):
+            for t in transfers:
+                self._use_tip(tool, t['start'], command['end'])
+        else:  # Multi-dispense or multi-aspirate; see plan_multi.
+            chunks = self._chunks(tool, transfers)
+            if name == 'consolidate':
+                sources = [t['start'] for t in transfers]
+                if not self._share_liquid(sources):
+                    for _ in range(chunks):
+                        self._fresh_tip(tool)
+                    return
+            if chunks:
+                self._fresh_tip(tool)
+
+    def _tool(self, name):
+        tool = self._tools.get(name)
+        if tool is None:
+            tool = self._context.get_instrument(name=name)
+            self._tools[name] = tool
+        return tool
+
+    def _lines(self, tool, command):
+        """
+        Returns the (start, end) of each well a transfer moves liquid
+        between, a whole column or row at a time for a multichannel tool
+        (see ContextHandler.transfer).
+        """
+        (start_slot, start_well), (end_slot, end_well) = (
+            command['start'], command['end']
+        )
+        if tool.channels > 1:
+            container = self._context._deck.slot(start_slot)
+            if tool.channels == container.rows != container.cols:
+                return [
+                    ((start_slot, (start_well[0], row)),
+                     (end_slot, (end_well[0], row)))
+                    for row in range(container.rows)
+                ]
+            if tool.channels == container.cols != container.rows:
+                return [
+                    ((start_slot, (col, start_well[1])),
+                     (end_slot, (col, end_well[1])))
+                    for col in range(container.cols)
+                ]
+        return [(command['start'], command['end'])]
+
+    def _use(self, address):
+        slot, well = address
+        wells = self.wells.get(slot)
+        if wells is None:
+            wells = self.wells[slot] = set()
+        wells.add(well)
+
+    def _level(self, address):
+        """ Volume in a well, as the ContextHandler would have it. """
+        start = self._ingredients.get(address, (None, 0))[1]
+        return start + self._net.get(address, 0)
+
+    def _draw(self, address):
+        """
+        Returns the names of the liquids a transfer out of a well takes.
+        See LiquidInventory.transfer.
+        """
+        names = self._names.get(address)
+        if self._level(address) == 0 and (not names or len(names) > 1):
+            # Nothing to draw, and no one liquid to owe.
+            names = self._names[address] = UNSPECIFIED
+        if address not in self._drawn:
+            self._drawn[address] = names
+        return names
+
+    def _transfer(self, start, end, volume):
+        self._use(start)
+        self._use(end)
+        names = self._draw(start)
+        net = self._net[start] = self._net.get(start, 0) - volume
+        if net < self._short.get(start, 0):
+            self._short[start] = net
+        if self._level(end) == 0:
+            # Liquids emptied out of a well are forgotten.
+            self._names[end] = names
+        else:
+            self._names[end] = self._names.get(end, frozenset()) | names
+        self._net[end] = self._net.get(end, 0) + volume
+
+    def _liquids(self, address):
+        """ Like ContextHandler.get_source_liquids. """
+        names = self._drawn.get(address, self._names.get(address))
+        if not names or 'unspecified' in names:
+            return None
+        return names
+
+    def _share_liquid(self, wells):
+        names = set(self._liquids(w) for w in wells)
+        if len(names) != 1:
+            return False
+        liquids = names.pop()
+        return liquids is not None and len(liquids) == 1
+
+    def _chunks(self, tool, transfers):
+        """ Number of pipette-fulls plan_multi splits transfers into. """
+        max_vol = self._tool(tool).max_vol
+        chunks = 0
+        total = 0
+        for t in transfers:
+            if not chunks or total + t['volume'] > max_vol:
+                chunks += 1
+                total = 0
+            total += t['volume']
+        return chunks
+
+    def _use_tip(self, tool_name, source, *wells):
+        """ See RequirementsHandler._use_tip. """
+        axis = self._tool(tool_name).axis
+        _, pickup = self._tracker.use(axis, source, self._liquids(source))
+        if pickup:
+            self._pickup(tool_name)
+        if not self._tracker.release(axis):
+            for well in (source,) + wells:
+                self._tracker.touch(axis, self._liquids(well))
+
+    def _fresh_tip(self, tool_name):
+        self._tracker.drop(self._tool(tool_name).axis)
+        self._pickup(tool_name)
+
+    def _pickup(self, tool_name):
+        tool = self._tool(tool_name)
+        self.pickups[tool_name] = self.pickups.get(tool_name, 0) + 1
+        self.tips[tool.size] = self.tips.get(tool.size, 0) + tool.channels
+
+    def __repr__(self):
+        return "<BillOfMaterials {} tips, {} wells>".format(
+            sum(self.tips.values()), sum(self.occupancy.values())
+        )
+
+
+def bill_of_materials(protocol):
+    """
+    Returns a BillOfMaterials for a Protocol.  See
+    Protocol.bill_of_materials.
+    """
+    bill = BillOfMaterials(
+        protocol._context_handler, protocol._tip_policy,
+        protocol._ingredients
+    )
+    for command in protocol._commands:
+        bill.add_command(command)
+    return bill
@@ -0,0 +1,5 @@
+from labsuite.protocol.optimizers.routing import optimize_routes, RouteReport
+from labsuite.protocol.optimizers.multichannel import lower_multichannel
+from labsuite.protocol.optimizers.multichannel import LoweringReport
+from labsuite.protocol.optimizers.layout import optimize_layout, LayoutReport
+from labsuite.protocol.optimizers.peephole import optimize_ir, PeepholeReport
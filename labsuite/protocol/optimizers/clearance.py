@@ -0,0 +1,138 @@
+"""
+Z-clearance planning.
+
+Without a planner, the pipette goes all the way up (z=0) before every
+move across the deck.  The ClearancePlanner builds a height map of the
+deck from calibration and container heights, so each x/y hop only
+retracts far enough to clear the tallest thing along the way.
+
+The z axis points down: 0 is fully retracted, and a container's
+calibrated 'top' is the z at which the tip meets its top surface.
+
+Heights are worked out per axis:
+
+* Calibrated slots use their calibrated top.
+* Uncalibrated slots are inferred from the container's height and the
+  deck plane, which is in turn inferred from a calibrated container of
+  known height.
+* Anything else (including tipracks, where the tips stick up above the
+  calibrated nozzle position) is unknown, and crossing it means a full
+  retract.
+"""
+
+from labsuite.labware.tipracks import Tiprack
+from labsuite.util import exceptions as x
+
+UNKNOWN = None
+
+
+class ClearancePlanner():
+
+    margin = 5  # mm to stay above the tallest obstacle.
+
+    _context = None
+    _maps = None  # {axis: ([((x0, y0, x1, y1), top)], deck)}
+
+    def __init__(self, context, margin=None):
+        self._context = context
+        self._maps = {}
+        if margin is not None:
+            self.margin = margin
+
+    def travel_height(self, axis, start, end=None):
+        """
+        Returns the z to retract to before moving in x/y from start to
+        end, both (x, y) tuples.  Without an end, returns the z that
+        clears the container at start.
+        """
+        if start is None:
+            return 0
+        end = end or start
+        box = (
+            min(start[0], end[0]) - self.margin,
+            min(start[1], end[1]) - self.margin,
+            max(start[0], end[0]) + self.margin,
+            max(start[1], end[1]) + self.margin
+        )
+        highest = None
+        obstacles, deck = self._height_map(axis)
+        for rect, top in obstacles:
+            if not _overlaps(rect, box):
+                continue
+            if top is UNKNOWN:
+                return 0
+            if highest is None or top < highest:
+                highest = top
+        if highest is None:
+            highest = deck  # Over empty deck.
+        if highest is UNKNOWN:
+            return 0
+        return max(0, highest - self.margin)
+
+    def _height_map(self, axis):
+        if axis not in self._maps:
+            self._maps[axis] = self._build_map(axis)
+        return self._maps[axis]
+
+    def _build_map(self, axis):
+        context = self._context
+        cal = context.get_axis_calibration(axis)
+        slots = context._deck._children
+        deck = UNKNOWN
+        for slot, container in slots.items():
+            height = getattr(container, 'height', None)
+            # Points (like the trash) have no height to go by.
+            if isinstance(container, Tiprack) or not height:
+                continue
+            top = cal.get(slot, {}).get('top')
+            if top is not None:
+                # Higher estimates of the deck are the conservative ones.
+                if deck is UNKNOWN or top + height < deck:
+                    deck = top + height
+        obstacles = []
+        for slot, container in slots.items():
+            obstacles.append((
+                self._footprint(axis, slot, container),
+                self._top(cal, slot, container, deck)
+            ))
+        return obstacles, deck
+
+    def _top(self, cal, slot, container, deck):
+        if isinstance(container, Tiprack):
+            return UNKNOWN
+        top = cal.get(slot, {}).get('top')
+        if top is not None:
+            return top
+        height = getattr(container, 'height', None)
+        if deck is UNKNOWN or height is None:
+            return UNKNOWN
+        return deck - height
+
+    def _footprint(self, axis, slot, container):
+        """
+        Returns the (x0, y0, x1, y1) rectangle a container covers.
+        """
+        try:
+            a1 = self._context.get_coordinates([slot, (0, 0)], axis=axis)
+            ax, ay = a1['x'], a1['y']
+        except x.CalibrationMissing:
+            deck = self._context._deck
+            ax, ay = deck.slot_offset(slot)
+            ax += container.a1_x or 0
+            ay += container.a1_y or 0
+        width = getattr(container, 'width', None)
+        length = getattr(container, 'length', None)
+        if width is None or length is None:
+            # Work it out from the wells, with the same margin all round.
+            wx, wy = container.get_child_coordinates(
+                (container.cols - 1, container.rows - 1)
+            )
+            width = wx + 2 * (container.a1_x or 0)
+            length = wy + 2 * (container.a1_y or 0)
+        x0 = ax - (container.a1_x or 0)
+        y0 = ay - (container.a1_y or 0)
+        return (x0, y0, x0 + width, y0 + length)
+
+
+def _overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
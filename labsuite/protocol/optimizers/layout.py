@@ -0,0 +1,313 @@
+"""
+Assigns containers to deck slots so the gantry travels less.
+
+The command log is turned into a table of hops between containers (and
+the tiprack and trash trips in between), weighted by how often each hop
+is made.  A layout's cost is the total nominal distance of those hops on
+the Deck's slot grid.  Starting from the current layout, containers are
+swapped with each other (or moved into empty slots) for as long as that
+lowers the cost.  Containers in fixed slots, like a plate on a cooling
+block, stay where they are.
+
+Tipracks of the same kind are interchangeable: tips are used from the
+rack in the lowest slot first, so the first rack's worth of tip trips
+goes to whichever rack ends up in the lowest slot.
+"""
+
+import copy
+import math
+
+from labsuite.labware.grid import normalize_position, humanize_position
+from labsuite.labware.tipracks import Tiprack
+from labsuite.protocol.optimizers.routing import transfer_wells
+from labsuite.protocol import plates
+
+TRASH = 'trash'
+
+
+class LayoutReport():
+
+    """
+    The slot each container moved to, the estimated travel (mm) before
+    and after, and the Protocol with the new layout.
+    """
+
+    mapping = None  # {old slot: new slot}
+    before = None
+    after = None
+    protocol = None
+
+    def __init__(self, mapping, before, after, protocol):
+        self.mapping = mapping
+        self.before = before
+        self.after = after
+        self.protocol = protocol
+
+    @property
+    def moved(self):
+        return {a: b for a, b in self.mapping.items() if a != b}
+
+    @property
+    def saved(self):
+        return self.before - self.after
+
+    def __repr__(self):
+        moves = ', '.join(
+            "{}->{}".format(humanize_position(a), humanize_position(b))
+            for a, b in sorted(self.moved.items())
+        )
+        return "<LayoutReport {:.1f}mm -> {:.1f}mm ({})>".format(
+            self.before, self.after, moves or 'unchanged'
+        )
+
+
+class Traffic():
+
+    """
+    Counts the hops a protocol makes between containers.
+
+    Containers are identified by their original slot.  Tip trips go to a
+    ('tiprack', name, n) placeholder for the nth rack of that kind, and
+    trash trips to TRASH.
+    """
+
+    hops = None  # {(a, b): count}
+
+    _context = None
+    _tips = None  # {tiprack name: tips used so far}
+
+    def __init__(self, context):
+        self._context = context
+        self.hops = {}
+        self._tips = {}
+
+    def add_protocol(self, commands):
+        for command in commands:
+            for step in plates.expand(command, self._context):
+                for path in self.paths(step):
+                    self.add_path(path)
+
+    def add_path(self, path):
+        for a, b in zip(path, path[1:]):
+            if a != b:
+                self.hops[(a, b)] = self.hops.get((a, b), 0) + 1
+
+    def paths(self, command):
+        """
+        Yields the containers visited by a command, one list per tip.
+        """
+        name = command['command']
+        tool = command.get('tool')
+        if name == 'transfer':
+            yield self._path(tool, [command['start'], command['end']])
+        elif name == 'mix':
+            yield self._path(tool, [command['start']])
+        elif name == 'transfer_group' or command.get('multi'):
+            wells = []
+            for t in command['transfers']:
+                wells.extend(transfer_wells(command, t))
+            yield self._path(tool, wells)
+        elif name in ('distribute', 'consolidate'):
+            for t in command['transfers']:
+                yield self._path(tool, transfer_wells(command, t))
+
+    def _path(self, tool, wells):
+        return [self._tip(tool)] + [w[0] for w in wells] + [TRASH]
+
+    def _tip(self, tool_name):
+        tool = self._context.get_instrument(name=tool_name)
+        name = 'tiprack.{}'.format(tool.size.lower())
+        racks = [
+            c for c in self._context._deck._children.values()
+            if getattr(c, 'name', None) == name
+        ]
+        used = self._tips.get(name, 0)
+        self._tips[name] = used + 1
+        if not racks:
+            return ('tiprack', name, 0)
+        rack = racks[0]
+        if tool.channels == rack.cols:
+            per_rack = rack.rows
+        elif tool.channels == rack.rows:
+            per_rack = rack.cols
+        else:
+            per_rack = rack.rows * rack.cols
+        return ('tiprack', name, min(used // per_rack, len(racks) - 1))
+
+
+class Layout():
+
+    """
+    Searches slot assignments for the containers on a deck.
+    """
+
+    max_passes = 50
+
+    _deck = None
+    _hops = None  # [(a, b, count)]
+    _racks = None  # {tiprack name: [original slot]}
+    _trash = None  # Original slot of the trash.
+
+    def __init__(self, context, traffic):
+        self._deck = context._deck
+        self._hops = [(a, b, n) for (a, b), n in traffic.hops.items()]
+        self._racks = {}
+        for slot, container in sorted(self._deck._children.items()):
+            if isinstance(container, Tiprack):
+                self._racks.setdefault(container.name, []).append(slot)
+        trash = context.find_container(name='point.trash')
+        if trash is not None:
+            self._trash = normalize_position(trash.position)
+
+    def cost(self, assignment):
+        """
+        Returns the weighted travel (mm) for a {original slot: slot}
+        assignment.
+        """
+        racks = {
+            name: sorted(assignment[s] for s in slots)
+            for name, slots in self._racks.items()
+        }
+        total = 0.0
+        for a, b, count in self._hops:
+            pa = self._locate(a, assignment, racks)
+            pb = self._locate(b, assignment, racks)
+            if pa is None or pb is None:
+                continue
+            total += count * math.hypot(pa[0] - pb[0], pa[1] - pb[1])
+        return total
+
+    def _locate(self, node, assignment, racks):
+        if node == TRASH:
+            node = assignment.get(self._trash)
+        elif isinstance(node, tuple) and node and node[0] == 'tiprack':
+            slots = racks.get(node[1])
+            node = slots[node[2]] if slots else None
+        else:
+            node = assignment.get(node)
+        if node is None:
+            return None
+        return self._deck.slot_offset(node)
+
+    def search(self, fixed=()):
+        """
+        Returns the best {original slot: slot} assignment found by
+        swapping the contents of slots, leaving fixed slots alone.
+        """
+        assignment = {s: s for s in self._deck._children}
+        slots = [
+            (col, row)
+            for row in range(self._deck.rows)
+            for col in range(self._deck.cols)
+            if (col, row) not in fixed
+        ]
+        best = self.cost(assignment)
+        for _ in range(self.max_passes):
+            improved = False
+            for i in range(len(slots)):
+                for j in range(i + 1, len(slots)):
+                    trial = _swap(assignment, slots[i], slots[j])
+                    if trial is None:
+                        continue
+                    cost = self.cost(trial)
+                    if cost < best - 1e-9:
+                        assignment, best = trial, cost
+                        improved = True
+            if not improved:
+                break
+        return assignment
+
+
+def _swap(assignment, a, b):
+    """
+    Returns a copy of the assignment with the contents of slots a and b
+    swapped, or None if both are empty.
+    """
+    where = {slot: origin for origin, slot in assignment.items()}
+    if a not in where and b not in where:
+        return None
+    out = dict(assignment)
+    if a in where:
+        out[where[a]] = b
+    if b in where:
+        out[where[b]] = a
+    return out
+
+
+def remap_protocol(protocol, mapping):
+    """
+    Returns a new Protocol with every container moved according to a
+    {old slot: new slot} mapping.  Calibration is only carried over for
+    containers that stayed put.
+    """
+    from labsuite.protocol import Protocol
+    out = Protocol()
+    info = protocol.info
+    info.pop('version', None)
+    info.pop('version_hash', None)
+    out.set_info(**info)
+    out._registry.update(protocol._registry)
+    for axis, name in sorted(protocol._head.items()):
+        out.add_instrument(axis, name)
+    for slot, name in sorted(protocol._containers.items()):
+        label = protocol.get_container_label(slot)
+        out.add_container(mapping[slot], name, label=label)
+    for (slot, well), (name, volume) in sorted(protocol._ingredients.items()):
+        address = "{}:{}".format(
+            humanize_position(mapping[slot]), humanize_position(well)
+        )
+        out.add_ingredient(address, name, ul=volume or None)
+    if protocol._tip_policy is not None:
+        out.set_tip_policy(protocol._tip_policy)
+    for axis, cal in protocol._calibration.items():
+        kept = {}
+        for key, values in cal.items():
+            if isinstance(key, str):  # Instrument or affine settings.
+                kept[key] = copy.copy(values)
+                continue
+            # Either a slot, or a (slot, well) for well calibration.
+            slot = key[0] if isinstance(key[0], tuple) else key
+            if mapping.get(slot) == slot:
+                kept[key] = dict(values)
+        out._calibration[axis] = kept
+    for command in protocol.commands:
+        name = command.pop('command')
+        out.add_command(name, **_remap_command(command, mapping))
+    return out
+
+
+def _remap_command(command, mapping):
+    for key in ('start', 'end'):
+        if key in command:
+            slot, well = command[key]
+            command[key] = (mapping[slot], well)
+    # Plate commands name whole containers.
+    for key in ('source', 'destination'):
+        if key in command:
+            command[key] = mapping[command[key]]
+    if 'plates' in command:
+        command['plates'] = [mapping[slot] for slot in command['plates']]
+    for t in command.get('transfers', []):
+        _remap_command(t, mapping)
+    return command
+
+
+def optimize_layout(protocol, fixed=None):
+    """
+    Searches for a deck layout with less travel and returns a
+    LayoutReport.  See Protocol.optimize_layout.
+    """
+    context = protocol._context_handler
+    traffic = Traffic(context)
+    traffic.add_protocol(protocol._commands)
+    layout = Layout(context, traffic)
+    fixed = set(normalize_position(s) for s in (fixed or ()))
+    identity = {s: s for s in context._deck._children}
+    before = layout.cost(identity)
+    mapping = layout.search(fixed)
+    after = layout.cost(mapping)
+    if after >= before:
+        mapping, after = identity, before
+    return LayoutReport(
+        mapping, before, after, remap_protocol(protocol, mapping)
+    )
@@ -0,0 +1,181 @@
+"""
+Rewrites runs of single-well transfers as multichannel transfers.
+
+Worklists tend to spell out a plate stamp as one transfer per well, even
+with a multichannel pipette on the head.  This pass looks for runs of
+consecutive transfer commands that move the same volume from every well
+of one column (or row) into the matching wells of another, and replaces
+each run with a single transfer on a multichannel pipette.  The
+ContextHandler's multichannel logic then handles the whole column.
+
+A run is only lowered when the result is the same: every well in the
+line is covered exactly once, each channel lands in the same row (or
+column) it started from, and the transfers share their options.
+"""
+
+import copy
+
+# Transfer options that must match for transfers to share a pipette.
+OPTIONS = ('volume', 'blowout', 'touchtip')
+
+
+class LoweringReport():
+
+    """
+    Runs of single-channel transfers which were lowered, by the index of
+    the first command in the original protocol.
+    """
+
+    groups = None  # [(index, count, tool)]
+
+    def __init__(self):
+        self.groups = []
+
+    def add(self, index, count, tool):
+        self.groups.append((index, count, tool))
+
+    @property
+    def before(self):
+        """ Number of transfer commands that were lowered. """
+        return sum(g[1] for g in self.groups)
+
+    @property
+    def after(self):
+        """ Number of multichannel transfers that replaced them. """
+        return len(self.groups)
+
+    @property
+    def saved(self):
+        return self.before - self.after
+
+    def __repr__(self):
+        return "<LoweringReport {} transfers -> {}>".format(
+            self.before, self.after
+        )
+
+
+class Lowerer():
+
+    """
+    Finds multichannel groups among commands using the instruments and
+    containers of a ContextHandler.
+    """
+
+    _context = None
+    _tools = None  # [Pipette] Multichannel pipettes on the head.
+
+    def __init__(self, context):
+        self._context = context
+        instruments = context._instruments
+        self._tools = [
+            instruments[axis] for axis in sorted(instruments)
+            if instruments[axis].channels > 1
+        ]
+
+    def lower(self, commands, index):
+        """
+        Returns (command, count) if the commands starting at index can be
+        replaced by one multichannel transfer, or (None, 0).
+        """
+        for tool in self._tools:
+            run = commands[index:index + tool.channels]
+            if len(run) < tool.channels:
+                continue
+            command = self._lower_run(tool, run)
+            if command is not None:
+                return command, len(run)
+        return None, 0
+
+    def _lower_run(self, tool, run):
+        first = run[0]
+        for c in run:
+            if c['command'] != 'transfer':
+                return None
+            if any(c.get(k) != first.get(k) for k in OPTIONS):
+                return None
+            single = self._context.get_instrument(name=c['tool'])
+            if single is None or single.channels != 1:
+                return None
+        if not tool.has_volume(first['volume']):
+            return None
+        start_slot, end_slot = first['start'][0], first['end'][0]
+        start = self._context._deck.slot(start_slot)
+        end = self._context._deck.slot(end_slot)
+        line = self._line(tool, start)
+        if line is None or self._line(tool, end) != line:
+            return None
+        # Index of the line (0 for A or 1) and of the well along it.
+        across, along = (0, 1) if line == 'col' else (1, 0)
+        start_line = first['start'][1][across]
+        end_line = first['end'][1][across]
+        if start_slot == end_slot and start_line == end_line:
+            return None  # Each well would feed another in the same line.
+        seen = set()
+        for c in run:
+            (s_slot, s_well), (e_slot, e_well) = c['start'], c['end']
+            if s_slot != start_slot or e_slot != end_slot:
+                return None
+            if s_well[across] != start_line or e_well[across] != end_line:
+                return None
+            if s_well[along] != e_well[along]:
+                return None  # Channels can't cross over.
+            seen.add(s_well[along])
+        if len(seen) != tool.channels:
+            return None
+        out = copy.deepcopy(first)
+        out['tool'] = tool.name
+        # The head is positioned by the first channel.
+        out['start'] = (start_slot, self._well(line, start_line))
+        out['end'] = (end_slot, self._well(line, end_line))
+        return out
+
+    def _line(self, tool, container):
+        """
+        Returns 'col' or 'row' for the way the tool spans the container,
+        matching ContextHandler.transfer, or None if it doesn't fit.
+        """
+        cols = getattr(container, 'cols', None)
+        rows = getattr(container, 'rows', None)
+        if cols is None or rows is None or cols == rows:
+            return None
+        if tool.channels == rows:
+            return 'col'
+        if tool.channels == cols:
+            return 'row'
+        return None
+
+    def _well(self, line, index):
+        return (index, 0) if line == 'col' else (0, index)
+
+
+def lower_all(commands, lowerer):
+    """
+    Returns (commands, report): the commands with every run the Lowerer
+    can merge replaced by its multichannel transfer.
+    """
+    report = LoweringReport()
+    out = []
+    i = 0
+    while i < len(commands):
+        command, count = lowerer.lower(commands, i)
+        if command is None:
+            out.append(commands[i])
+            i += 1
+            continue
+        report.add(i, count, command['tool'])
+        out.append(command)
+        i += count
+    return out, report
+
+
+def lower_multichannel(protocol):
+    """
+    Replaces runs of single-well transfers in a Protocol with multichannel
+    transfers, and returns a LoweringReport.  See
+    Protocol.lower_multichannel.
+    """
+    lowerer = Lowerer(protocol._context_handler)
+    commands, report = lower_all(protocol._commands, lowerer)
+    if report.groups:
+        protocol._replace_commands(commands)
+    return report
@@ -0,0 +1,255 @@
+"""
+Removes redundant moves from a compiled MotionIR.
+
+The motor handlers build every operation out of the same few motions, so
+the moves they produce have obvious waste in them: move_into_well repeats
+the x/y move that move_to_well just made, a plunger reset is followed by
+a plunge that overrides it, and back-to-back move(z=0) calls retract a
+head that's already retracted.
+
+Each pass here rewrites the rows of a program and the pipeline reports
+how many rows each one removed.  Passes work one command at a time and
+forget the robot's position at every command boundary, so a program can
+still be resumed after homing from the same commands as the original
+(see MotionIR.replay).
+
+Values that follow a slot's calibration are handed to the passes as
+ir.Reference, so the optimised program can still be relinked (see
+MotionIR.relink).  A value only counts as where the robot already is if
+it follows the same calibration, since the two may part after a relink.
+
+verify() replays two programs on a FirmwareSimulator and checks that the
+robot ends every command in the same place, and that every aspiration
+and dispense moves the plunger the same way from the same place.
+"""
+
+from labsuite.protocol.ir import MotionIR, Reference
+from labsuite.protocol.ir import MOVE, ASPIRATE, DISPENSE
+
+# Axes which drive a pipette plunger rather than the gantry.
+PLUNGER_AXES = ('a', 'b')
+
+
+class PassStats():
+
+    """ Number of rows before and after one pass. """
+
+    name = None
+    before = None
+    after = None
+
+    def __init__(self, name, before, after):
+        self.name = name
+        self.before = before
+        self.after = after
+
+    @property
+    def removed(self):
+        return self.before - self.after
+
+    def __repr__(self):
+        return "<PassStats {}: {} -> {}>".format(
+            self.name, self.before, self.after
+        )
+
+
+class PeepholeReport():
+
+    """ The optimised MotionIR and the PassStats for each pass run. """
+
+    program = None
+    passes = None  # [PassStats]
+
+    def __init__(self, program, passes):
+        self.program = program
+        self.passes = passes
+
+    @property
+    def before(self):
+        return self.passes[0].before if self.passes else len(self.program)
+
+    @property
+    def after(self):
+        return len(self.program)
+
+    @property
+    def saved(self):
+        return self.before - self.after
+
+    def __repr__(self):
+        return "<PeepholeReport {} moves -> {}>".format(
+            self.before, self.after
+        )
+
+
+def drop_stationary(rows):
+    """
+    Strips axis values the robot is already at, and drops moves that are
+    left with nothing to do.
+    """
+    out = []
+    position = {}
+    command = None
+    for op, cmd, tool, move in rows:
+        if cmd != command:
+            position = {}
+            command = cmd
+        move = {
+            axis: value for axis, value in move.items()
+            if axis not in position or position[axis] != value or
+            _ref(position[axis]) != _ref(value)
+        }
+        if not move:
+            continue
+        position.update(move)
+        out.append((op, cmd, tool, move))
+    return out
+
+
+def collapse_moves(rows):
+    """
+    Merges back-to-back plain moves of the same single axis, keeping the
+    last.  Along one axis the direct move covers a subset of the path the
+    pair did.
+
+    Tagged moves are never merged: a plunge followed by an aspiration on
+    the same axis is what draws the liquid.
+    """
+    out = []
+    for row in rows:
+        if out:
+            op, cmd, tool, move = out[-1]
+            if op == MOVE and row[0] == MOVE and cmd == row[1] and \
+               len(move) == 1 and list(move) == list(row[3]):
+                out[-1] = row
+                continue
+        out.append(row)
+    return out
+
+
+def fold_plunger(rows):
+    """
+    Drops a plain plunger move (like a reset) when the next thing that
+    plunger does is another plain move, such as the plunge for the next
+    aspiration.
+
+    Moves tagged MOVE are only ever made with the tip out of the liquid,
+    so moving the plunger once instead of twice draws no liquid either
+    way.  Any tagged operation in between keeps both moves.
+    """
+    dead = set()
+    pending = {}  # {plunger axis: index of its last plain move}
+    command = None
+    for i, (op, cmd, tool, move) in enumerate(rows):
+        if cmd != command:
+            pending = {}
+            command = cmd
+        if op != MOVE:
+            pending = {}
+            continue
+        if len(move) != 1:
+            continue
+        axis = next(iter(move))
+        if axis not in PLUNGER_AXES:
+            continue
+        if axis in pending:
+            dead.add(pending[axis])
+        pending[axis] = i
+    return [row for i, row in enumerate(rows) if i not in dead]
+
+
+PASSES = (drop_stationary, collapse_moves, fold_plunger)
+
+
+def optimize_ir(program, passes=None):
+    """
+    Runs the given passes (functions from rows to rows, PASSES by
+    default) over a MotionIR, and returns a PeepholeReport with a new
+    program.  The original is left alone.
+
+    Values that follow a slot's calibration are passed through as
+    References, and those that come out the other end are recorded on
+    the new program, so it can be relinked like the original.
+    """
+    references = program.references()
+    rows = []
+    for i in range(len(program)):
+        op, cmd, tool, move = program[i]
+        for axis, value in move.items():
+            ref = references.get((i, axis))
+            if ref is not None:
+                move[axis] = Reference(value, ref)
+        rows.append((op, cmd, tool, move))
+    stats = []
+    for run in passes or PASSES:
+        before = len(rows)
+        rows = run(rows)
+        stats.append(PassStats(run.__name__, before, len(rows)))
+    out = MotionIR(program.protocol_hash, program.calibration_hash)
+    for op, cmd, tool, move in rows:
+        row = len(out)
+        out.append(op, cmd, tool, move)
+        for axis, value in move.items():
+            if isinstance(value, Reference):
+                out.add_reference(row, axis, value.ref)
+    out.set_commands(program.commands)
+    out.calibration = program.calibration
+    for index in range(program.commands):
+        out.set_reused(index, program.reused(index))
+    return PeepholeReport(out, stats)
+
+
+def _ref(value):
+    return value.ref if isinstance(value, Reference) else None
+
+
+def simulate(program, model=None):
+    """
+    Replays a program on a FirmwareSimulator and returns the position of
+    the robot at the end of each command.
+    """
+    return _replay(program, model)[0]
+
+
+def strokes(program, model=None):
+    """
+    Replays a program on a FirmwareSimulator and returns (command,
+    position before, position after) for each aspiration and dispense
+    that moves a plunger.
+    """
+    return _replay(program, model)[1]
+
+
+def _replay(program, model=None):
+    from labsuite.drivers.motor import MoveLogger
+    from labsuite.drivers.simulator import FirmwareSimulator
+    sim = FirmwareSimulator(model=model)
+    driver = MoveLogger(sim)
+    positions = []
+    moved = []
+    for index in range(program.commands):
+        if index:
+            positions.append(dict(sim.position))
+        for i in program.command_rows(index):
+            op, cmd, tool, move = program[i]
+            before = dict(sim.position)
+            driver.move(**move)
+            if op not in (ASPIRATE, DISPENSE):
+                continue
+            after = dict(sim.position)
+            plungers = [a for a in move if a in PLUNGER_AXES]
+            if any(before.get(a) != after.get(a) for a in plungers):
+                moved.append((index, before, after))
+    positions.append(dict(sim.position))
+    return positions, moved
+
+
+def verify(original, optimized, model=None):
+    """
+    Returns True if both programs leave the simulated robot in the same
+    place at the end of every command, and draw and dispense the same
+    liquid in the same places along the way.
+    """
+    if original.commands != optimized.commands:
+        return False
+    return _replay(original, model) == _replay(optimized, model)
@@ -0,0 +1,426 @@
+"""
+Reorders the transfers within a group command to cut down gantry travel.
+
+A transfer_group, or a distribute or consolidate with multi set, runs its
+transfers in the order they were listed, in one trip with one tip.  For
+cherry-picking worklists, that order has nothing to do with where the
+wells are on the deck.  This pass builds a route with a nearest-neighbour
+tour, improves it with 2-opt, and rewrites the command.
+
+Other distributes and consolidates make a round trip (with its own tip)
+for each transfer, so there's nothing to gain by reordering them, and
+they're left alone.
+
+Travel is counted the way the MotorControlHandler moves: from the first
+well the tip visits to the trash where it's dropped, going back to the
+source of a distribute (or on to the destination of a consolidate) each
+time the pipette is full.  Trips to the tiprack aren't counted, since
+which tip comes next depends on the commands before.
+
+Transfers are only reordered when it can't change the result: if one
+transfer reads from a well that an earlier one writes to (or writes to a
+well an earlier one reads from), the two stay in their original order.
+"""
+
+import copy
+import math
+
+from labsuite.protocol import plates
+from labsuite.util import exceptions as x
+
+# Commands which can be reordered, and the keys of their transfers which
+# the pipette visits between transfers.
+GROUP_COMMANDS = {
+    'transfer_group': ('start', 'end'),
+    'distribute': ('end',),
+    'consolidate': ('start',)
+}
+
+
+class RouteReport():
+
+    """
+    Travel distance (mm, in x/y) of each routed command before and after
+    routing.
+    """
+
+    commands = None  # [(index, before, after)]
+
+    def __init__(self):
+        self.commands = []
+
+    def add(self, index, before, after):
+        self.commands.append((index, before, after))
+
+    @property
+    def before(self):
+        return sum(c[1] for c in self.commands)
+
+    @property
+    def after(self):
+        return sum(c[2] for c in self.commands)
+
+    @property
+    def saved(self):
+        return self.before - self.after
+
+    def __repr__(self):
+        return "<RouteReport {:.1f}mm -> {:.1f}mm>".format(
+            self.before, self.after
+        )
+
+
+def distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def transfer_wells(command, transfer):
+    """
+    Returns the (source, destination) addresses of a transfer within a
+    group command.
+    """
+    start = transfer.get('start', command.get('start'))
+    end = transfer.get('end', command.get('end'))
+    return start, end
+
+
+def routable(command):
+    """
+    Returns True for commands which run all their transfers in one trip.
+    """
+    name = command['command']
+    if name == 'transfer_group':
+        return True
+    return name in GROUP_COMMANDS and bool(command.get('multi'))
+
+
+def dependencies(command):
+    """
+    Returns a list of sets; the set at index i holds the indexes of the
+    transfers which must stay after transfer i.
+    """
+    wells = [transfer_wells(command, t) for t in command['transfers']]
+    after = [set() for _ in wells]
+    for i, (src_i, dst_i) in enumerate(wells):
+        for j in range(i + 1, len(wells)):
+            src_j, dst_j = wells[j]
+            if dst_i == src_j or src_i == dst_j:
+                after[i].add(j)
+    return after
+
+
+class Router():
+
+    """
+    Routes group commands using coordinates from a ContextHandler.
+
+    Calibrated coordinates are used where they exist; otherwise positions
+    are estimated from the nominal deck layout.
+    """
+
+    max_passes = 50  # 2-opt passes before giving up on improvement.
+
+    _context = None
+    _points = None  # {(address, axis): (x, y)}
+
+    def __init__(self, context):
+        self._context = context
+        self._points = {}
+
+    def point(self, address, axis=None):
+        key = (tuple(address), axis)
+        if key not in self._points:
+            self._points[key] = self._locate(address, axis)
+        return self._points[key]
+
+    def _locate(self, address, axis):
+        try:
+            coords = self._context.get_coordinates(address, axis=axis)
+            return (coords['x'], coords['y'])
+        except x.CalibrationMissing:
+            slot, well = address
+            ax, ay = self._context.nominal_a1(slot)
+            wx, wy = self._context._deck.slot(slot).get_child_coordinates(
+                well
+            )
+            return (ax + wx, ay + wy)
+
+    def route(self, command):
+        """
+        Returns a copy of the command with its transfers reordered, and
+        the travel distance before and after.
+
+        The context should hold the liquids as they are just before the
+        command runs, since a consolidate of different liquids takes a
+        new tip for each pipette-full.
+        """
+        name = command['command']
+        transfers = command['transfers']
+        axis = self._tool_axis(command)
+        keys = GROUP_COMMANDS[name]
+        stops = []
+        for t in transfers:
+            src, dst = transfer_wells(command, t)
+            wells = {'start': src, 'end': dst}
+            points = [self.point(wells[k], axis) for k in keys]
+            stops.append((points[0], points[-1]))
+        tour = Tour(stops, dependencies(command), trash=self._trash(axis))
+        if name != 'transfer_group':
+            tour.volumes = [t['volume'] for t in transfers]
+            tour.capacity = self._context.get_instrument(
+                name=command['tool']
+            ).max_vol
+        if name == 'distribute':
+            tour.first = self.point(command['start'], axis)
+        elif name == 'consolidate':
+            tour.last = self.point(command['end'], axis)
+            sources = [t['start'] for t in transfers]
+            tour.new_tips = not self._context.share_liquid(sources)
+        before = tour.cost(list(range(len(stops))))
+        order = tour.nearest_neighbour()
+        order = tour.two_opt(order, self.max_passes)
+        after = tour.cost(order)
+        if after >= before:
+            return command, before, before
+        out = copy.deepcopy(command)
+        out['transfers'] = [copy.deepcopy(transfers[i]) for i in order]
+        return out, before, after
+
+    def _trash(self, axis):
+        try:
+            return self.point(self._context.get_trash_address(), axis)
+        except x.ContainerMissing:
+            return None
+
+    def _tool_axis(self, command):
+        tool = self._context.get_instrument(name=command.get('tool'))
+        return tool.axis if tool else None
+
+
+class Tour():
+
+    """
+    An open path through a list of stops, each with an entry point and an
+    exit point, with precedence constraints between stops.
+
+    With a capacity, the stops are visited a pipette-full at a time (as
+    plan_multi splits them), with the first point visited before each
+    and the last point after each.
+    """
+
+    stops = None  # [(entry, exit)]
+    after = None  # [set()] Stops which must come after each stop.
+    before = None  # [set()] Stops which must come before each stop.
+    first = None  # Fixed point visited before the stops, if any.
+    last = None  # Fixed point visited after the stops, if any.
+    trash = None  # Where the tip is dropped at the end, if anywhere.
+    volumes = None  # [volume] of each stop, if there's a capacity.
+    capacity = None  # Volume the pipette holds.
+    new_tips = False  # True to drop the tip after each pipette-full.
+
+    def __init__(self, stops, after, first=None, last=None, trash=None):
+        self.stops = stops
+        self.after = after
+        self.first = first
+        self.last = last
+        self.trash = trash
+        self.before = [set() for _ in stops]
+        for i, succ in enumerate(after):
+            for j in succ:
+                self.before[j].add(i)
+
+    def link(self, a, b):
+        """ Travel from the exit of stop a to the entry of stop b. """
+        return distance(self.stops[a][1], self.stops[b][0])
+
+    def fills(self, order):
+        """ Splits the order into pipette-fulls. """
+        if self.capacity is None:
+            return [order] if order else []
+        fills = []
+        total = 0
+        for stop in order:
+            volume = self.volumes[stop]
+            if not fills or total + volume > self.capacity:
+                fills.append([])
+                total = 0
+            fills[-1].append(stop)
+            total += volume
+        return fills
+
+    def path(self, order):
+        """
+        Yields each point visited in turn, and None where the tip is
+        swapped for a new one.
+        """
+        fills = self.fills(order)
+        for i, fill in enumerate(fills):
+            if self.first is not None:
+                yield self.first
+            for stop in fill:
+                yield self.stops[stop][0]
+                yield self.stops[stop][1]
+            if self.last is not None:
+                yield self.last
+            if self.new_tips or i == len(fills) - 1:
+                if self.trash is not None:
+                    yield self.trash
+                yield None
+
+    def cost(self, order):
+        total = 0.0
+        here = None
+        for point in self.path(order):
+            if here is not None and point is not None:
+                total += distance(here, point)
+            here = point
+        return total
+
+    def nearest_neighbour(self):
+        """
+        Builds a path by always going to the closest stop whose
+        predecessors have all been visited.
+        """
+        remaining = set(range(len(self.stops)))
+        waiting = [len(b) for b in self.before]
+        order = []
+        here = self.first
+        while remaining:
+            ready = [i for i in remaining if waiting[i] == 0]
+            if here is None:
+                stop = min(ready)  # Start where the user started.
+            else:
+                stop = min(
+                    ready,
+                    key=lambda i: (distance(here, self.stops[i][0]), i)
+                )
+            order.append(stop)
+            remaining.remove(stop)
+            for j in self.after[stop]:
+                waiting[j] -= 1
+            here = self.stops[stop][1]
+        return order
+
+    def two_opt(self, order, max_passes=50):
+        """
+        Reverses segments of the path while that shortens it and keeps
+        every dependency in order.
+
+        With a capacity, segments are only reversed within a
+        pipette-full, which leaves each pipette-full holding the same
+        stops.  Only the links into, through and out of a segment change,
+        and those are added up as the segment grows, so a pass costs the
+        sum of the squares of the fill sizes.
+        """
+        order = list(order)
+        for _ in range(max_passes):
+            improved = False
+            lo = 0
+            fills = self.fills(order)
+            for k, fill in enumerate(fills):
+                hi = lo + len(fill) - 1
+                ends = self._ends(order, lo, hi, k == len(fills) - 1)
+                for i in range(lo, hi):
+                    if self._reverse_from(order, i, (lo, hi), ends):
+                        improved = True
+                lo = hi + 1
+            if not improved:
+                break
+        return order
+
+    def _ends(self, order, lo, hi, final):
+        """
+        Returns the points visited just before order[lo] and just after
+        order[hi], the first and last stops of a pipette-full, or None
+        where the tip is swapped for a new one (see path).
+        """
+        if self.first is not None:
+            enter = self.first
+        elif lo == 0 or self.new_tips:
+            enter = None
+        elif self.last is not None:
+            enter = self.last
+        else:
+            enter = self.stops[order[lo - 1]][1]
+        if self.last is not None:
+            leave = self.last
+        elif final or self.new_tips:
+            leave = self.trash
+        elif self.first is not None:
+            leave = self.first
+        else:
+            leave = self.stops[order[hi + 1]][0]
+        return enter, leave
+
+    def _reverse_from(self, order, i, bounds, ends):
+        """
+        Reverses each segment order[i:j + 1] within the pipette-full
+        order[lo:hi + 1] that shortens the path, and returns True if any
+        did.
+        """
+        members = {order[i]}
+        forward = backward = 0.0  # Links through the segment, each way.
+        improved = False
+        for j in range(i + 1, bounds[1] + 1):
+            stop = order[j]
+            if (self.before[stop] | self.after[stop]) & members:
+                break  # Reversing would break a dependency.
+            members.add(stop)
+            forward += self.link(order[j - 1], stop)
+            backward += self.link(stop, order[j - 1])
+            old = forward + self._outer_cost(
+                order, i, j, order[i], order[j], bounds, ends
+            )
+            new = backward + self._outer_cost(
+                order, i, j, order[j], order[i], bounds, ends
+            )
+            if new < old - 1e-9:
+                order[i:j + 1] = order[i:j + 1][::-1]
+                forward, backward = backward, forward
+                improved = True
+        return improved
+
+    def _outer_cost(self, order, i, j, head, tail, bounds, ends):
+        """
+        Cost of the links into and out of a segment that would replace
+        order[i:j + 1], running from stop head to stop tail, within the
+        pipette-full order[lo:hi + 1] which is entered and left at ends.
+        """
+        (lo, hi), (enter, leave) = bounds, ends
+        total = 0.0
+        if i > lo:
+            total += self.link(order[i - 1], head)
+        elif enter is not None:
+            total += distance(enter, self.stops[head][0])
+        if j < hi:
+            total += self.link(tail, order[j + 1])
+        elif leave is not None:
+            total += distance(self.stops[tail][1], leave)
+        return total
+
+
+def optimize_routes(protocol):
+    """
+    Reorders the transfers in every routable command of a Protocol and
+    returns a RouteReport.  See Protocol.optimize_routes.
+    """
+    context = protocol.initialize_context()
+    router = Router(context)
+    report = RouteReport()
+    commands = []
+    changed = False
+    for i, command in enumerate(protocol._commands):
+        if routable(command):
+            routed, before, after = router.route(command)
+            report.add(i, before, after)
+            if routed is not command:
+                changed = True
+            command = routed
+        commands.append(command)
+        # Keep the liquids up to date for the commands that follow.
+        for step in plates.expand(command, context):
+            kwargs = copy.deepcopy(step)
+            getattr(context, kwargs.pop('command'))(**kwargs)
+    if changed:
+        protocol._replace_commands(commands)
+    return report
@@ -0,0 +1,114 @@
+"""
+Plate commands: stamp and replicate.
+
+A stamp (every well of one plate into the same well of another) or a
+replicate (one column into the same column of several plates) is kept
+in the protocol as a single command, however many wells it covers.
+expand() spells it out as transfers only when the protocol is run (or
+compiled, or estimated), so adding, hashing and exporting a protocol
+cost the same for a 1536 well plate as for a 96 well one.
+
+With multichannel set, the expanded transfers are lowered onto a
+multichannel pipette the same way Protocol.lower_multichannel does it.
+"""
+
+from labsuite.protocol.optimizers.multichannel import Lowerer, lower_all
+from labsuite.util import exceptions as x
+
+# Commands that stand for many transfers.
+PLATE_COMMANDS = ('stamp', 'replicate')
+
+# Options copied onto each transfer.
+_OPTIONS = ('volume', 'tool', 'blowout', 'touchtip')
+
+
+def region_wells(container, region=None, by='row'):
+    """
+    Returns the wells in a rectangle of a container, given by opposite
+    corners ((col, row), (col, row)), or every well if there's no region.
+
+    Wells are listed a row at a time (A1, B1, ... A2), or a column at a
+    time with by='col'.
+    """
+    if region is None:
+        first, last = (0, 0), (container.cols - 1, container.rows - 1)
+    else:
+        first, last = (container._normalize_position(p) for p in region)
+    cols = range(min(first[0], last[0]), max(first[0], last[0]) + 1)
+    rows = range(min(first[1], last[1]), max(first[1], last[1]) + 1)
+    if by == 'col':
+        return [(col, row) for col in cols for row in rows]
+    return [(col, row) for row in rows for col in cols]
+
+
+def check(command, context):
+    """
+    Raises if a plate command doesn't fit the containers on the deck.
+
+    Only the corners of each plate are checked, so this costs the same
+    however many wells the command covers.
+    """
+    deck = context._deck
+    if command['command'] == 'stamp':
+        source = deck.slot(command['source'])
+        destination = deck.slot(command['destination'])
+        region = command.get('region')
+        if region is None:
+            region = ((0, 0), (source.cols - 1, source.rows - 1))
+        for corner in region:
+            source._normalize_position(corner)
+            destination._normalize_position(corner)
+    else:
+        source = deck.slot(command['source'])
+        column = command['column']
+        last = (column, source.rows - 1)
+        source._normalize_position(last)
+        if not command['plates']:
+            raise x.ContainerMissing("No plates to replicate into.")
+        for slot in command['plates']:
+            deck.slot(slot)._normalize_position(
+                (command['to_column'], source.rows - 1)
+            )
+
+
+def expand(command, context):
+    """
+    Returns the commands a plate command stands for, as a list of
+    transfer commands.  Other commands are returned in a list of one.
+    """
+    name = command['command']
+    if name not in PLATE_COMMANDS:
+        return [command]
+    deck = context._deck
+    by = _order(command, context) if command.get('multichannel') else 'row'
+    if name == 'stamp':
+        source, destination = command['source'], command['destination']
+        wells = region_wells(deck.slot(source), command.get('region'), by)
+        pairs = [((source, w), (destination, w)) for w in wells]
+    else:
+        source = command['source']
+        rows = range(deck.slot(source).rows)
+        column, to_column = command['column'], command['to_column']
+        pairs = [
+            ((source, (column, row)), (plate, (to_column, row)))
+            for plate in command['plates'] for row in rows
+        ]
+    options = {k: command[k] for k in _OPTIONS}
+    transfers = [
+        dict(options, command='transfer', start=start, end=end)
+        for start, end in pairs
+    ]
+    if command.get('multichannel'):
+        transfers, _ = lower_all(transfers, Lowerer(context))
+    return transfers
+
+
+def _order(command, context):
+    """
+    Lists wells along the line a multichannel pipette spans in the
+    source, so each run of transfers can be lowered.
+    """
+    lowerer = Lowerer(context)
+    source = context._deck.slot(command['source'])
+    lines = [lowerer._line(tool, source) for tool in lowerer._tools]
+    return 'col' if 'col' in lines else 'row'
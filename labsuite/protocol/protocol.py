@@ -1,27 +1,41 @@
 from labsuite.labware import containers, deck, pipettes
 from labsuite.labware.grid import normalize_position, humanize_position
+from labsuite.labware.grid import normalize_column
 import labsuite.drivers.motor as motor_drivers
 from labsuite.util.log import debug
+from labsuite.util import log
 from labsuite.protocol.handlers import ContextHandler, MotorControlHandler, RequirementsHandler
+from labsuite.protocol.handlers import DurationHandler, GCodeCompilerHandler
+from labsuite.protocol.handlers import IRCompilerHandler
+from labsuite.protocol.ir import MotionIR
+from labsuite.protocol.handlers.tips import TipTracker
+from labsuite.drivers import gcode
+from labsuite.protocol import optimizers
+from labsuite.protocol import plates
+from labsuite.protocol import lint
+from labsuite.protocol import materials
 from labsuite.util import hashing
 from labsuite.util import exceptions as x
 from labsuite.util import ExceptionProxy
 
+import os
 import time
 import copy
-import logging
-import inspect
+from collections.abc import Awaitable
 
 class Protocol():
 
     # Operational data.
-    _ingredients = None  # { 'name': "A1:A1" }
+    _ingredients = None  # { address: (liquid name, volume) }
     _head = None  # Head layout. { motor_axis: instrument name }
     _calibration = None  # Axis and instrument calibration.
     _container_labels = None  # Aliases. { 'foo': (0,0), 'bar': (0,1) }
     _label_case = None  # Capitalized labels.
     _containers = None  # { slot: container_name }
+    _registry = None  # Containers defined for this protocol.
     _commands = None  # []
+    _tip_policy = None  # See set_tip_policy; None is 'always'.
+    _compiled = None  # {optimize: (hash, calibration hash, MotionIR)}
 
     # Metadata
     _name = None
@@ -47,6 +61,9 @@ class Protocol():
         self._head = {}
         self._calibration = {}
         self._containers = {}
+        self._registry = containers.ContainerRegistry(
+            containers.default_registry
+        )
         self._commands = []
         self._handlers = []
         self._context_handler = self.initialize_context()
@@ -126,14 +143,21 @@ class Protocol():
 
     @property
     def hash(self):
-        return hashing.hash_data([
+        data = [
             self._ingredients,
             self._head,
             self._container_labels,
             self._label_case,
             self._containers,
             self._commands
-        ])
+        ]
+        if self._tip_policy is not None:
+            data.append(self._tip_policy)
+        return hashing.hash_data(data)
+
+    @property
+    def calibration_hash(self):
+        return hashing.hash_data(self._calibration)
 
     def __eq__(self, protocol):
         return self.hash == protocol.hash
@@ -167,6 +191,7 @@ class Protocol():
         # Second info supercedes first.
         self.set_info(**b.info)
         # Add the containers from second.
+        self._registry.update(b._registry)
         for slot, name in b._containers.items():
             if slot in self._containers and self._containers[slot] != name:
                 raise x.ContainerConflict(
@@ -199,6 +224,23 @@ class Protocol():
                     "Axis {} already allocated to {}".format(axis, name)
                 )
             self.add_instrument(axis, name)
+        # Add the ingredients from second.
+        for (slot, well), (name, volume) in sorted(b._ingredients.items()):
+            address = "{}:{}".format(
+                humanize_position(slot), humanize_position(well)
+            )
+            if (slot, well) in self._ingredients:
+                if self._ingredients[(slot, well)] != (name, volume):
+                    raise x.LiquidMismatch(
+                        "Conflicting ingredients at {}: {} vs {}".format(
+                            address, self._ingredients[(slot, well)][0], name
+                        )
+                    )
+                continue
+            self.add_ingredient(address, name, ul=volume or None)
+        # Second tip policy supercedes first.
+        if b._tip_policy is not None:
+            self.set_tip_policy(b._tip_policy)
         # Rerun command definitions from second.
         for command in b.actions:
             c = copy.deepcopy(command)
@@ -221,6 +263,25 @@ class Protocol():
         self._context_handler.add_container(slot, name)
         self._containers[slot] = name
 
+    def add_custom_container(self, data, name):
+        """
+        Defines a container (and any subsets) for this protocol only, from
+        a dict in the format of the container files; see
+        containers.add_custom_container.  Returns its class.
+        """
+        return self._registry.add_custom_container(dict(data), name=name)
+
+    def add_ingredient(self, address, name, ul=None, ml=None):
+        """
+        Names the liquid that starts out in a well, optionally with its
+        volume.  Liquid drawn from the well is tracked under that name,
+        which is what the 'per-liquid' tip policy goes by.
+        """
+        address = self._normalize_address(address)
+        volume = self._normalize_volume(ul, ml, skip_raise=True) or 0
+        self._context_handler.add_ingredient(address, name, volume)
+        self._ingredients[address] = (name, volume)
+
     def add_instrument(self, axis, name):
         self._head[axis] = name
         self._context_handler.add_instrument(axis, name)
@@ -238,12 +299,107 @@ class Protocol():
             axis, top=top, blowout=blowout, droptip=droptip
         )
 
+    def use_affine_calibration(self, axis=None, enabled=True):
+        """
+        Fits an affine model of the deck (rotation, skew and scale) to the
+        calibrated slots and wells on the axis, and works out coordinates
+        from it.  Wells are placed with the deck's rotation, and slots that
+        were never calibrated are filled in from the model, taking their
+        top and bottom from the nearest calibrated container of the same
+        kind.  See protocol.calibration.
+        """
+        if axis is None:
+            instrument = self._context_handler.get_only_instrument()
+            if instrument is None:
+                raise x.DataMissing(
+                    "Calibration axis must be specified when multiple " +
+                    "instruments are loaded."
+                )
+            axis = instrument.axis
+        self._context_handler.use_affine(axis, enabled=enabled)
+
+    def set_tip_policy(self, policy):
+        """
+        Sets when pipettes change tips between commands:
+
+        * 'always': a fresh tip for every command (the default).
+        * 'per-source': reuse the tip while drawing from the same well.
+        * 'per-liquid': reuse the tip while drawing the same named liquid.
+        * 'never': one tip per pipette for the whole protocol.
+
+        Commands that handle several wells at once (transfer_group, and
+        multi distribute and consolidate) always start on a fresh tip.
+        """
+        TipTracker(policy)  # Raises ValueError if unknown.
+        self._tip_policy = None if policy == 'always' else policy
+
+    @property
+    def tip_policy(self):
+        return self._tip_policy or 'always'
+
     def add_command(self, command, **kwargs):
-        self._run_in_context_handler(command, **kwargs)
         d = {'command': command}
         d.update(**kwargs)
+        if command in plates.PLATE_COMMANDS:
+            # Plate commands are only expanded when they're run.
+            plates.check(d, self._context_handler)
+        else:
+            self._run_in_context_handler(command, **kwargs)
         self._commands.append(d)
 
+    def _replace_commands(self, commands):
+        """
+        Replaces all the commands in the protocol, rerunning them on a
+        fresh context so liquid tracking matches the new order.
+
+        If any of the commands fail, the protocol is left as it was.
+        """
+        old_commands = self._commands
+        old_context = self._context_handler
+        self._commands = []
+        self._context_handler = self.initialize_context()
+        try:
+            for command in commands:
+                c = copy.deepcopy(command)
+                self.add_command(c.pop('command'), **c)
+        except Exception:
+            self._commands = old_commands
+            self._context_handler = old_context
+            raise
+        for h in self._handlers:
+            h.set_context(self._context_handler)
+
+    def optimize_routes(self):
+        """
+        Reorders the transfers within each transfer_group, and each
+        distribute and consolidate with multi set, to cut down gantry
+        travel, wherever that doesn't change which liquid ends up where.
+
+        Returns a RouteReport with the x/y travel before and after.
+        """
+        return optimizers.optimize_routes(self)
+
+    def lower_multichannel(self):
+        """
+        Replaces runs of single-well transfers that cover a whole column
+        (or row) of a plate with one transfer on a multichannel pipette,
+        where one is on the head.
+
+        Returns a LoweringReport of the transfers that were merged.
+        """
+        return optimizers.lower_multichannel(self)
+
+    def optimize_layout(self, fixed=None):
+        """
+        Searches for slot assignments that cut down gantry travel, keeping
+        the containers in the given fixed slots (like 'A1') where they are.
+
+        Returns a LayoutReport; its protocol attribute holds a copy of this
+        Protocol with the containers moved.  Moved containers will need to
+        be calibrated again.
+        """
+        return optimizers.optimize_layout(self, fixed=fixed)
+
     def transfer(self, start, end, ul=None, ml=None,
                  blowout=True, touchtip=True, tool=None):
         volume = self._normalize_volume(ul, ml)
@@ -271,30 +427,48 @@ class Protocol():
             transfers=transfers
         )
 
-    def distribute(self, start, *wells, tool=None, **defaults):
+    def distribute(self, start, *wells, tool=None, multi=False, **defaults):
+        """
+        Transfers from one well to many.
+
+        With multi=True, each aspirate takes up enough liquid for as many
+        destinations as the pipette can hold, and a single tip is used
+        throughout.
+        """
         transfers, min_vol, max_vol = self._make_transfer_group(
             wells, ['end'], defaults
         )
         tool = self.get_tool(
             name=tool, has_volumes=(min_vol, max_vol)
         )
+        kwargs = {'multi': True} if multi else {}
         self.add_command(
             'distribute',
             tool=tool.name,
             start=self._normalize_address(start),
-            transfers=transfers
+            transfers=transfers,
+            **kwargs
         )
 
-    def consolidate(self, end, *wells, tool=None, **defaults):
+    def consolidate(self, end, *wells, tool=None, multi=False, **defaults):
+        """
+        Transfers from many wells to one.
+
+        With multi=True, the pipette aspirates from as many sources as it
+        can hold before each dispense.  Tips are changed between
+        dispenses unless every source holds the same liquid.
+        """
         transfers, min_vol, max_vol = self._make_transfer_group(
             wells, ['start'], defaults
         )
         tool = self.get_tool(name=tool, has_volumes=(min_vol, max_vol))
+        kwargs = {'multi': True} if multi else {}
         self.add_command(
             'consolidate',
             tool=tool.name,
             end=self._normalize_address(end),
-            transfers=transfers
+            transfers=transfers,
+            **kwargs
         )
 
     def mix(self, start, ml=None, ul=None, repetitions=None, tool=None,
@@ -311,6 +485,69 @@ class Protocol():
             reps=repetitions
         )
 
+    def stamp(self, start, end, ul=None, ml=None, region=None, tool=None,
+              multichannel=False, blowout=True, touchtip=True):
+        """
+        Transfers from every well of one container into the same well of
+        another.  Containers are given by slot ('A1') or label, and a
+        region (opposite corners, like ('A1', 'H6')) limits the stamp to
+        part of the plate.
+
+        The stamp is kept as one command and only expanded into transfers
+        when the protocol is run; see plates.expand.  With
+        multichannel=True, whole columns (or rows) are moved with a
+        multichannel pipette where there's one on the head.
+        """
+        volume = self._normalize_volume(ul, ml)
+        tool = self.get_tool(name=tool, has_volume=volume, channels=1)
+        kwargs = {'multichannel': True} if multichannel else {}
+        if region is not None:
+            kwargs['region'] = self._normalize_region(region)
+        self.add_command(
+            'stamp',
+            tool=tool.name,
+            volume=volume,
+            source=self._normalize_slot(start),
+            destination=self._normalize_slot(end),
+            blowout=blowout,
+            touchtip=touchtip,
+            **kwargs
+        )
+
+    def replicate(self, start, *ends, ul=None, ml=None, to_column=None,
+                  tool=None, multichannel=False, blowout=True,
+                  touchtip=True):
+        """
+        Transfers from every well in one column of a container into the
+        same column (or to_column) of each of the end containers.  The
+        column is given like an address, as 'Samples:A'.
+
+        Like stamp, this is one command until the protocol is run.
+        """
+        if ':' not in start:
+            raise ValueError(
+                "Column must be in the form of 'container:column'."
+            )
+        container, column = start.split(':')
+        column = normalize_column(column)
+        if to_column is not None:
+            to_column = normalize_column(to_column)
+        volume = self._normalize_volume(ul, ml)
+        tool = self.get_tool(name=tool, has_volume=volume, channels=1)
+        kwargs = {'multichannel': True} if multichannel else {}
+        self.add_command(
+            'replicate',
+            tool=tool.name,
+            volume=volume,
+            source=self._normalize_slot(container),
+            column=column,
+            plates=[self._normalize_slot(end) for end in ends],
+            to_column=column if to_column is None else to_column,
+            blowout=blowout,
+            touchtip=touchtip,
+            **kwargs
+        )
+
     def _make_transfer_group(self, wells, arg_names, defaults):
         vols = []
         transfers = []
@@ -409,19 +646,45 @@ class Protocol():
         container, well = address.split(':')
         well = normalize_position(well)
 
+        # Labels come first; one like "TALE1" is also a valid position
+        # now that columns can have more than one letter.
+        if container.lower() in self._container_labels:
+            return (self._container_labels[container.lower()], well)
+
         try:
             container = normalize_position(container)
         except ValueError:
-            # Try to find the slot as a label.
-            container = container.lower()
-            if container not in self._container_labels:
-                raise x.ContainerMissing(
-                    "Container not found: {}".format(address)
-                )
-            container = self._container_labels[container]
+            raise x.ContainerMissing(
+                "Container not found: {}".format(address)
+            )
 
         return (container, well)
 
+    def _normalize_slot(self, name):
+        """
+        Takes a container's slot ('A1') or label and returns its slot as a
+        tuple like (0, 0).
+        """
+        if isinstance(name, str) and name.lower() in self._container_labels:
+            return self._container_labels[name.lower()]
+        try:
+            return normalize_position(name)
+        except ValueError:
+            raise x.ContainerMissing("Container not found: {}".format(name))
+
+    def _normalize_region(self, region):
+        """ Takes opposite corners like ('A1', 'H6') and normalizes them. """
+        if len(region) != 2:
+            raise ValueError("Region must be given as two opposite wells.")
+        return tuple(normalize_position(well) for well in region)
+
+    def humanize_slot(self, slot):
+        """
+        Returns the label of the container in a slot, or the slot's name
+        ('A1') if it has no label.
+        """
+        return self.get_container_label(slot) or humanize_position(slot)
+
     def humanize_address(self, address):
         """
         Returns a human-readable string for a particular address.
@@ -433,12 +696,14 @@ class Protocol():
         the first provided capitalization, for example "LaBeL:B1".
         """
         start, end = address
+        if isinstance(start, str) and start.lower() in self._container_labels:
+            start = self._label_case.get(start.lower(), start)
+            return "{}:{}".format(start, humanize_position(end))
         try:
             start = normalize_position(start)  # Try to convert 'A1'.
             # Find a label for that tuple position.
             label = self.get_container_label(start)
-            if label is not None:
-                start = label
+            start = label or humanize_position(start)
         except ValueError:
             # If it's not a tuple position, it's a string label.
             if start.lower() not in self._container_labels:
@@ -464,22 +729,49 @@ class Protocol():
             )
         return tool
 
-    def run(self):
+    def run(self, eta=False):
         """
         A generator that runs each command and yields the current command
         index and the number of total commands.
+
+        If eta is True, the protocol's duration is estimated up front (see
+        estimate_duration) and the estimated number of seconds remaining
+        is yielded as a third item.
         """
-        self.validate("Can't run an incomplete PartialProtocol.")
-        # Reset our local context.
-        self._context_handler = self.initialize_context()
-        for h in self._handlers:
-            h.set_context(self._context_handler)
-        i = 0
-        yield(0, len(self._commands))
-        while i < len(self._commands):
-            self._run(i)
-            i += 1
-            yield (i, len(self._commands))
+        estimate = self.estimate_duration() if eta else None
+        self._start_run()
+        total = len(self._commands)
+        try:
+            for i in range(total):
+                yield self._progress(i, total, estimate)
+                self._run(i)
+        finally:
+            # Handlers tear down even if a command fails, the run is
+            # stopped early or there are no commands at all.
+            self._teardown()
+        yield self._progress(total, total, estimate)
+
+    def _progress(self, current, total, estimate=None):
+        if estimate is None:
+            return (current, total)
+        return (current, total, estimate.remaining(current))
+
+    def run_async(self):
+        """
+        Asynchronous version of run, for use with `async for`.
+
+        Handler methods which return awaitables (such as the
+        MotorControlHandler attached to an async transport) are awaited,
+        so serial waits don't block the event loop.
+        """
+        return AsyncProtocolRun(self)
+
+    async def run_all_async(self):
+        """
+        Convenience coroutine to run every command in a protocol.
+        """
+        async for _ in self.run_async():
+            pass
 
     def run_all(self):
         """
@@ -501,6 +793,9 @@ class Protocol():
         # Instruments
         for axis, name in self._head.items():
             ch.add_instrument(axis, name)
+        # Ingredients
+        for address, (name, volume) in sorted(self._ingredients.items()):
+            ch.add_ingredient(address, name, volume)
         return ch
 
     def _run_in_context_handler(self, command, **kwargs):
@@ -518,20 +813,59 @@ class Protocol():
             raise x.MissingCommand("Command not defined: " + command)
         method(**kwargs)
 
+    def _start_run(self):
+        self.validate("Can't run an incomplete PartialProtocol.")
+        # Reset our local context.
+        self._context_handler = self.initialize_context()
+        for h in self._handlers:
+            h.set_context(self._context_handler)
+
     def _run(self, index):
-        kwargs = copy.deepcopy(self._commands[index])
-        command = kwargs.pop('command')
-        self._run_in_context_handler(command, **kwargs)
+        for result in self._handler_calls(index):
+            self._assert_sync(result)
+
+    def _teardown(self):
         for h in self._handlers:
-            debug(
-                "Protocol",
-                "{}.{}: {}"
-                .format(type(h).__name__, command, kwargs)
+            self._assert_sync(h.teardown())
+
+    def _assert_sync(self, result):
+        if isinstance(result, Awaitable):
+            result.close()
+            raise RuntimeError(
+                "An attached handler is asynchronous; use run_async."
             )
-            h.before_each()
-            method = getattr(h, command)
-            method(**kwargs)
-            h.after_each()
+
+    def _handler_calls(self, index):
+        """
+        Runs a command on the context and every attached handler, yielding
+        the return value of each handler call so that the caller can wait
+        on it if needed.
+
+        Plate commands are expanded into their transfers here, which the
+        handlers see as a single command, like a transfer_group.  Each
+        transfer runs on the context just before the handlers see it, so
+        their tip decisions match those of separate transfers.  A handler's
+        before_each comes just before its first call for the command, and
+        its after_each just after its last.
+        """
+        steps = plates.expand(self._commands[index], self._context_handler)
+        last = len(steps) - 1
+        for n, step in enumerate(steps):
+            kwargs = copy.deepcopy(step)
+            command = kwargs.pop('command')
+            self._run_in_context_handler(command, **kwargs)
+            for h in self._handlers:
+                debug(
+                    "Protocol",
+                    "{}.{}: {}"
+                    .format(type(h).__name__, command, kwargs)
+                )
+                if n == 0:
+                    yield h.before_each()
+                method = getattr(h, command)
+                yield method(**kwargs)
+                if n == last:
+                    yield h.after_each()
 
     def _virtual_run(self):
         """
@@ -545,15 +879,14 @@ class Protocol():
         self._handler_runthrough(new_motor)
         if old_motor:
             self._motor_handler = old_motor
-        logger.disabled = False
+        log.set_disabled(False)
 
     def _handler_runthrough(self, handler):
         """
         Runs protocol on a virtualized handler.
         """
         # Disable logger.
-        logger = logging.getLogger()
-        logger.disabled = True
+        log.set_disabled(True)
         # Disable the other handlers.
         old_handlers = self._handlers
         self._handlers = []
@@ -562,7 +895,7 @@ class Protocol():
             self.run_all()
         finally:
             # Put everything back the way it was.
-            logger.disabled = False
+            log.set_disabled(False)
             self._handlers = old_handlers
         return handler
 
@@ -580,7 +913,7 @@ class Protocol():
         from ProtocolHandler and you'll be fine; empty methods are stubbed
         out for all supported commands.
         """
-        if inspect.isclass(handler):
+        if isinstance(handler, type):
             handler = handler(self)
         handler.set_context(self._context_handler)
         handler.setup()
@@ -604,9 +937,19 @@ class Protocol():
         f = Formatter(self, **kwargs)
         return f.export()
 
-    def attach_motor(self, port=None):
+    def attach_motor(self, port=None, transport=None, **kwargs):
+        """
+        Attaches a MotorControlHandler.
+
+        With a port, the handler drives the robot over a blocking serial
+        connection.  With a transport (see drivers.async_motor), it uses
+        the asyncio driver instead, and the Protocol must be run with
+        run_async.  With neither, movements are only logged.
+        """
         self._motor_handler = self.attach_handler(MotorControlHandler)
-        if port is not None:
+        if transport is not None:
+            self._motor_handler.use_transport(transport, **kwargs)
+        elif port is not None:
             self._motor_handler.connect(port)
         else:
             self._motor_handler.simulate()
@@ -636,11 +979,217 @@ class Protocol():
         """
         return PartialProtocol(Protocol(*args, **kwargs), x.ProtocolException)
 
+    def compile_gcode(self, path, force=False):
+        """
+        Runs the protocol on a virtual robot and writes the resulting
+        G-code to a file, which can be sent to the robot with run_gcode
+        without going through the handlers again.
+
+        The file records the hashes of the protocol and calibration it was
+        compiled from; if it's already up to date, it isn't compiled again
+        unless force is True.
+
+        Returns True if the file was (re)compiled.
+        """
+        header = {
+            'protocol': self.hash,
+            'calibration': self.calibration_hash,
+            'commands': len(self._commands)
+        }
+        current = {k: str(v) for k, v in header.items()}
+        if force is False and gcode.read_header(path) == current:
+            return False
+        # Write to a temporary file so a failed compile doesn't leave a
+        # truncated file that looks up to date.
+        partial = path + '.partial'
+        try:
+            with open(partial, 'w') as f:
+                handler = GCodeCompilerHandler(self)
+                handler.compile_to(gcode.GCodeWriter(f, **header))
+                self._handler_runthrough(handler)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return True
+
+    def run_gcode(self, path, start=0):
+        """
+        A generator that sends a file written by compile_gcode to the
+        attached motor, yielding the current command index and the number
+        of total commands like run().
+
+        To resume after a fault, pass the index of the command that was
+        running as `start`.  Under a tip policy other than 'always', a
+        command that reuses a tip kept from an earlier one can't be
+        resumed from; ResumeUnsafe names the command to resume from
+        instead.
+        """
+        header = gcode.read_header(path)
+        if header is None:
+            raise x.CompiledGCodeMismatch(
+                "{} is not a compiled G-code file.".format(path)
+            )
+        if header.get('protocol') != self.hash or \
+           header.get('calibration') != self.calibration_hash:
+            raise x.CompiledGCodeMismatch(
+                "{} was compiled from a different protocol or calibration."
+                .format(path)
+            )
+        if self._motor_handler is None:
+            raise x.DataMissing("No motor attached.")
+        total = int(header['commands'])
+        if start:
+            gcode.check_resume(start, gcode.resume_point(path, start))
+        yield (start, total)
+        for i in self._motor_handler.stream_gcode(path, start=start):
+            if i > start:
+                yield (i, total)
+        yield (total, total)
+
+    def compile_ir(self, optimize=False):
+        """
+        Lowers the protocol to a MotionIR: the flat list of moves the robot
+        will make, each tagged with its primitive operation (move, pickup,
+        drop, aspirate, dispense, blowout) and the command it's from.
+
+        If optimize is True, redundant moves are removed with the peephole
+        passes in optimizers.peephole.
+
+        The result is cached until the protocol or calibration changes.
+        When only slot calibration has changed, the cached program is
+        relinked (see MotionIR.relink) rather than compiled again.
+        """
+        key = (self.hash, self.calibration_hash)
+        if self._compiled is None:
+            self._compiled = {}
+        cached = self._compiled.get(optimize)
+        if cached is not None and cached[:2] == key:
+            return cached[2]
+        program = None
+        if optimize:
+            program = optimizers.optimize_ir(self.compile_ir()).program
+        elif cached is not None and cached[0] == key[0]:
+            # Only the calibration changed; try translating the moves.
+            program = cached[2].relink(self._calibration, key[1])
+        if program is None:
+            program = MotionIR(*key)
+            handler = IRCompilerHandler(self)
+            handler.compile_to(program)
+            self._handler_runthrough(handler)
+            program.set_commands(len(self._commands))
+            program.calibration = copy.deepcopy(self._calibration)
+        self._compiled[optimize] = key + (program,)
+        return program
+
+    def run_ir(self, start=0, optimize=False):
+        """
+        A generator that replays the compiled MotionIR (see compile_ir) on
+        the attached motor, yielding the current command index and the
+        number of total commands like run().
+
+        To resume after a fault, pass the index of the command that was
+        running as `start`.  As with run_gcode, a command that reuses a
+        tip kept from an earlier one can't be resumed from.
+        """
+        if self._motor_handler is None:
+            raise x.DataMissing("No motor attached.")
+        program = self.compile_ir(optimize=optimize)
+        total = program.commands
+        gcode.check_resume(start, program.resume_point(start))
+        yield (start, total)
+        for i in self._motor_handler.replay_ir(program, start=start):
+            if i > start:
+                yield (i, total)
+        yield (total, total)
+
+    def estimate_duration(self, **kwargs):
+        """
+        Runs the protocol on a virtual robot and returns a DurationEstimate
+        with the expected number of seconds for the whole protocol and for
+        each command.
+
+        Keyword arguments are passed on to DurationHandler.configure, so
+        the motion model and dwell times can be adjusted to match your
+        robot.
+
+        If the protocol uses more tips than are on the deck, it's assumed
+        that the racks are replaced when they run out; the number of
+        refills is recorded on the estimate.
+        """
+        handler = DurationHandler(self)
+        handler.configure(**kwargs)
+        return self._handler_runthrough(handler).estimate
+
+    def lint(self):
+        """
+        Checks every command against the deck and head without running the
+        protocol, and returns a LintProblem for each mistake found; see
+        protocol.lint.
+        """
+        return lint.lint(self)
+
+    def bill_of_materials(self):
+        """
+        Returns a BillOfMaterials: the tips each pipette size uses, the
+        volume drawn from each well and the wells used in each container.
+        It's worked out in one pass over the commands, without running
+        the protocol; see protocol.materials.
+        """
+        return materials.bill_of_materials(self)
+
     @property
     def run_requirements(self):
         req_handler = self._handler_runthrough(RequirementsHandler)
         return req_handler.requirements
 
 
+class AsyncProtocolRun():
+
+    """
+    Asynchronous iterator returned by Protocol.run_async.
+
+    Yields the same (current, total) progress tuples as Protocol.run.
+    """
+
+    _protocol = None
+    _index = None  # Index of the next command to run.
+
+    def __init__(self, protocol):
+        self._protocol = protocol
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        protocol = self._protocol
+        total = len(protocol._commands)
+        if self._index is None:
+            protocol._start_run()
+            self._index = 0
+            if total == 0:
+                await self._teardown()
+            return (0, total)
+        if self._index >= total:
+            raise StopAsyncIteration
+        try:
+            for result in protocol._handler_calls(self._index):
+                if isinstance(result, Awaitable):
+                    await result
+        except BaseException:
+            await self._teardown()
+            raise
+        self._index += 1
+        if self._index == total:
+            await self._teardown()
+        return (self._index, total)
+
+    async def _teardown(self):
+        for h in self._protocol._handlers:
+            result = h.teardown()
+            if isinstance(result, Awaitable):
+                await result
+
+
 class PartialProtocol(ExceptionProxy):
     pass
@@ -118,3 +118,17 @@ class LiquidMismatch(LiquidException):
     Raised when the volume specified is of a different type than what is
     available in a particular container.
     """
+
+
+class CompiledGCodeMismatch(ProtocolException):
+    """
+    Raised when a compiled G-code file doesn't match the Protocol or
+    calibration it's being run with.
+    """
+
+
+class ResumeUnsafe(ProtocolException):
+    """
+    Raised when a compiled run is resumed from a command that relies on
+    a tip kept from an earlier command.
+    """
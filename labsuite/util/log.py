@@ -1,7 +1,21 @@
-import logging
 import labsuite
 import os
 
+# The logging module is only imported (and the default log file set up)
+# the first time something is logged, so importing labsuite doesn't pay
+# for it.
+_logging = None
+
+
+def _get_logging():
+    global _logging
+    if _logging is None:
+        import logging
+        _logging = logging
+        if os.path.isdir(log_path):
+            set_log_file(os.path.join(log_path, 'labsuite.log'))
+    return _logging
+
 
 def set_log_file(filename):
     """
@@ -11,6 +25,7 @@ def set_log_file(filename):
     logging.basicConfig can always be used on its own to specify any logging
     conditions desired.
     """
+    import logging
     logging.basicConfig(
         level=logging.DEBUG,
         format='%(asctime)s %(levelname)-8s %(message)s',
@@ -19,20 +34,25 @@ def set_log_file(filename):
     )
 
 
+def set_disabled(disabled):
+    """ Turns the root logger off (or back on). """
+    _get_logging().getLogger().disabled = disabled
+
+
 def debug(system, message):
-    logging.debug("[{}] {}".format(system, message))
+    _get_logging().debug("[{}] {}".format(system, message))
 
 
 def info(system, message):
-    logging.info("[{}] {}".format(system, message))
+    _get_logging().info("[{}] {}".format(system, message))
 
 
 def error(system, message):
-    logging.error("[{}] {}".format(system, message))
+    _get_logging().error("[{}] {}".format(system, message))
 
 
 def warn(system, message):
-    logging.warning("[{}] {}".format(system, message))
+    _get_logging().warning("[{}] {}".format(system, message))
 
 
 log_path = os.path.join(
@@ -40,6 +60,3 @@ log_path = os.path.join(
     '..',
     'logs'
 )
-
-if os.path.isdir(log_path):
-    set_log_file(os.path.join(log_path, 'labsuite.log'))
@@ -0,0 +1,123 @@
+"""
+Measures how long it takes to start using labsuite.
+
+Every measurement runs in a fresh interpreter, so nothing is already
+imported.  import_times() runs Python with -X importtime and reports
+what each module cost to import; startup_time() times a snippet of code
+(by default, importing labsuite.protocol and creating a Protocol).
+
+Both take the best of several runs, which is the least noisy figure on
+a shared machine.  See benchmarks/startup.py.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+# import time:  self [us] | cumulative | imported package
+_IMPORTTIME = re.compile(r'^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)')
+
+STARTUP_CODE = """
+from labsuite.protocol import Protocol
+Protocol()
+"""
+
+_TIMER = """
+import json, time
+start = time.perf_counter()
+exec(compile({code!r}, '<startup>', 'exec'))
+end = time.perf_counter()
+import sys
+print(json.dumps({{'seconds': end - start, 'modules': sorted(sys.modules)}}))
+"""
+
+
+class ImportTime():
+
+    """ What one module cost to import, in microseconds. """
+
+    module = None
+    self_us = None  # Not counting the modules it imported.
+    cumulative_us = None
+    depth = None  # How deep in the import tree; 0 for the top.
+
+    def __init__(self, module, self_us, cumulative_us, depth=0):
+        self.module = module
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.depth = depth
+
+    def __repr__(self):
+        return "<ImportTime {} {}us ({}us)>".format(
+            self.module, self.self_us, self.cumulative_us
+        )
+
+
+def parse_importtime(text):
+    """
+    Returns an ImportTime for each line of -X importtime output in the
+    text, in the order they were printed.  Other lines are skipped.
+    """
+    out = []
+    for line in text.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        # Each level of nesting is indented by two more spaces.
+        depth = max(len(indent) - 1, 0) // 2
+        out.append(
+            ImportTime(module, int(self_us), int(cumulative_us), depth)
+        )
+    return out
+
+
+def _environ():
+    """ Environment for a subprocess that imports this copy of labsuite. """
+    import labsuite
+    package = os.path.dirname(os.path.abspath(labsuite.__file__))
+    root = os.path.dirname(package)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p]
+    )
+    return env
+
+
+def import_times(module='labsuite.protocol', repeat=5):
+    """
+    Imports the module in `repeat` fresh interpreters and returns
+    {module name: ImportTime}, keeping the fastest run of each module.
+    """
+    best = {}
+    command = [sys.executable, '-X', 'importtime', '-c',
+               'import {}'.format(module)]
+    for _ in range(repeat):
+        result = subprocess.run(
+            command, env=_environ(), check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        for item in parse_importtime(result.stderr.decode('utf-8')):
+            seen = best.get(item.module)
+            if seen is None or item.cumulative_us < seen.cumulative_us:
+                best[item.module] = item
+    return best
+
+
+def run_startup(code=STARTUP_CODE):
+    """
+    Runs the code in a fresh interpreter and returns (seconds, modules),
+    the time it took and the names of every module imported by the end.
+    """
+    out = subprocess.check_output(
+        [sys.executable, '-c', _TIMER.format(code=code)], env=_environ()
+    )
+    result = json.loads(out.decode('utf-8'))
+    return result['seconds'], set(result['modules'])
+
+
+def startup_time(code=STARTUP_CODE, repeat=5):
+    """ Returns the fastest of `repeat` runs of the code, in seconds. """
+    return min(run_startup(code)[0] for _ in range(repeat))
@@ -6,6 +6,8 @@ config = {
     'url': 'http://opentrons.com',
     'version': '0.4',
     'install_requires': ['pyyaml', 'pyserial'],
+    # Protocol.run_async and the asyncio drivers use async/await.
+    'python_requires': '>=3.5',
     'packages': find_packages(exclude=["tests"]),
     'package_data': {
         "labsuite": [
@@ -14,7 +16,9 @@ config = {
         ]
     },
     'scripts': [
-        'bin/labsuite-compile'
+        'bin/labsuite-compile',
+        'bin/labsuite-bundle',
+        'bin/labsuite-lint'
     ],
     'name': 'labsuite',
     'test_suite': 'nose.collector',
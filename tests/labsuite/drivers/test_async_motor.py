@@ -0,0 +1,169 @@
+import asyncio
+import os
+import threading
+import unittest
+
+from labsuite.protocol import Protocol
+from labsuite.drivers.async_motor import (
+    AsyncOpenTrons, MemoryTransport, PTYTransport
+)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(asyncio.sleep(0))  # Let cancellations land.
+        loop.close()
+
+
+class AsyncOpenTronsTest(unittest.TestCase):
+
+    async def drain(self, motor):
+        await motor.drain()
+        motor.disconnect()
+
+    def test_queue_without_blocking(self):
+        """ Lines are queued until the writer task sends them. """
+        transport = MemoryTransport()
+        motor = AsyncOpenTrons(transport, stat=False)
+        motor.move(x=1)
+        motor.move(y=2)
+        self.assertEqual(transport.written, [])
+        self.assertEqual(motor.pending, 4)  # G90 before each move.
+        run(self.drain(motor))
+        self.assertEqual(transport.written, ['G90', 'G0 X1', 'G90', 'G0 Y2'])
+        self.assertEqual(motor.pending, 0)
+
+    def test_wait_for_stat(self):
+        """ Wait for the stat line after debug mode is turned on. """
+        stat = '{"stat":0}'
+        transport = MemoryTransport(
+            responder=lambda line: ['ok', 'busy', stat]
+        )
+        motor = AsyncOpenTrons(transport)
+        motor.home()
+        run(self.drain(motor))
+        self.assertEqual(transport.written, ['M62', 'G28'])
+
+    def test_throttle(self):
+        """ Throttle keeps a bounded number of commands in flight. """
+        transport = MemoryTransport()
+        motor = AsyncOpenTrons(transport, stat=False)
+
+        async def go():
+            motor.home()
+            motor.mark()
+            motor.home()
+            motor.mark()
+            await motor.throttle(1)
+            # The first command is done; the second may still be pending.
+            self.assertTrue(len(transport.written) >= 1)
+            await self.drain(motor)
+
+        run(go())
+        self.assertEqual(transport.written, ['G28', 'G28'])
+
+    def test_pty_transport(self):
+        """ Talk to a PTY with a fake controller on the other end. """
+        master, slave = os.openpty()
+        lines = []
+
+        def controller():
+            buf = b''
+            while len(lines) < 2:
+                buf += os.read(master, 1024)
+                while b'\n' in buf:
+                    line, buf = buf.split(b'\n', 1)
+                    lines.append(line.strip())
+                    os.write(master, b'ok\n')
+
+        thread = threading.Thread(target=controller, daemon=True)
+        thread.start()
+        transport = PTYTransport(os.ttyname(slave))
+        motor = AsyncOpenTrons(transport, stat=False)
+
+        async def go():
+            motor.home()
+            motor.halt()
+            await motor.drain()
+            motor.disconnect()
+
+        run(go())
+        thread.join(1)
+        os.close(master)
+        os.close(slave)
+        self.assertEqual(lines, [b'G28', b'M112'])
+
+
+class AsyncProtocolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'tiprack.p200')
+        self.protocol.add_container('C1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('B1', x=10, y=20, top=30)
+        self.protocol.calibrate('C1', x=50, y=60, top=70)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.transfer('A1:A1', 'A1:A2', ul=100)
+        self.protocol.transfer('A1:A2', 'A1:A3', ul=80)
+
+    def test_run_async(self):
+        """ Async run sends the same G-code as the synchronous driver. """
+        sync_motor = self.protocol.attach_motor()
+        self.protocol.run_all()
+        self.protocol._handlers.remove(sync_motor)
+        expected = [
+            l.decode().strip()
+            for l in sync_motor._driver.motor.connection.write_buffer
+        ]
+
+        transport = MemoryTransport()
+        self.protocol.attach_motor(transport=transport, stat=False)
+        progress = []
+
+        async def go():
+            async for p in self.protocol.run_async():
+                progress.append(p)
+            self.protocol.disconnect()
+
+        run(go())
+        self.assertEqual(progress, [(0, 2), (1, 2), (2, 2)])
+        self.assertEqual(transport.written, expected)
+
+    def test_sync_run_with_async_driver(self):
+        """ Refuse to run an async driver synchronously. """
+        self.protocol.attach_motor(transport=MemoryTransport(), stat=False)
+        with self.assertRaises(RuntimeError):
+            self.protocol.run_all()
+
+    def test_event_loop_not_blocked(self):
+        """ Other tasks keep running while the robot is busy. """
+        ticks = []
+        transport = MemoryTransport()
+        transport.write = self._delayed(transport.write)
+        self.protocol.attach_motor(transport=transport, stat=False)
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        async def go():
+            task = asyncio.ensure_future(ticker())
+            await self.protocol.run_all_async()
+            self.protocol.disconnect()
+            task.cancel()
+
+        run(go())
+        self.assertTrue(len(ticks) > 10)
+
+    def _delayed(self, write):
+        async def delayed(data):
+            await asyncio.sleep(0)
+            await write(data)
+        return delayed
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+
+from labsuite.protocol import Protocol
+from labsuite.drivers.motor import GCodeLogger, MoveLogger
+from labsuite.drivers.movelog import (
+    MoveRing, MoveFile, MoveFileReader, pack_move, unpack_move
+)
+
+
+class MoveRecordTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        move = {'x': 1.5, 'b': -2}
+        self.assertEqual(unpack_move(pack_move(move)), move)
+        self.assertEqual(unpack_move(pack_move({'z': 0})), {'z': 0})
+
+    def test_uppercase_axis(self):
+        self.assertEqual(unpack_move(pack_move({'X': 1})), {'x': 1})
+
+    def test_unknown_axis(self):
+        with self.assertRaises(ValueError):
+            pack_move({'q': 1})
+
+
+class MoveRingTest(unittest.TestCase):
+
+    def test_wraparound(self):
+        ring = MoveRing(3)
+        for n in range(5):
+            ring.append({'x': n})
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.total, 5)
+        self.assertEqual(ring.dropped, 2)
+        self.assertEqual(list(ring), [{'x': 2}, {'x': 3}, {'x': 4}])
+        self.assertEqual(ring[-1], {'x': 4})
+        self.assertEqual(ring.page(1, 5), [{'x': 3}, {'x': 4}])
+        with self.assertRaises(IndexError):
+            ring[3]
+
+
+class MoveFileTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_chunked_writes(self):
+        """ Moves are written out in chunks. """
+        sink = MoveFile(self.path, chunk_size=2)
+        sink.append({'x': 1})
+        with MoveFileReader(self.path) as moves:
+            self.assertEqual(len(moves), 0)
+        sink.append({'y': 2})
+        sink.append({'z': 3})
+        with MoveFileReader(self.path) as moves:
+            self.assertEqual(list(moves), [{'x': 1}, {'y': 2}])
+        sink.close()
+        with MoveFileReader(self.path) as moves:
+            self.assertEqual(len(moves), 3)
+            self.assertEqual(moves[2], {'z': 3})
+            self.assertEqual(moves[-2:], [{'y': 2}, {'z': 3}])
+
+    def test_not_a_move_log(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'G0 X1 Y2\n')
+        with self.assertRaises(ValueError):
+            MoveFileReader(self.path)
+
+    def test_protocol_run(self):
+        """ Log a protocol run to a file. """
+        protocol = Protocol()
+        protocol.add_instrument('B', 'p200')
+        protocol.add_container('A1', 'microplate.96')
+        protocol.add_container('B1', 'tiprack.p200')
+        protocol.add_container('C1', 'point.trash')
+        protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        protocol.calibrate('B1', x=10, y=20, top=30)
+        protocol.calibrate('C1', x=50, y=60, top=70)
+        protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        protocol.transfer('A1:A1', 'A1:A2', ul=100)
+        motor = protocol.attach_motor()
+        protocol.run_all()
+        protocol._handlers.remove(motor)
+        expected = motor._driver.movements
+        sink = MoveFile(self.path)
+        protocol.attach_motor().simulate(sink=sink)
+        protocol.run_all()
+        with sink.reader() as moves:
+            self.assertEqual(list(moves), expected)
+        sink.close()
+
+
+class LoggerTest(unittest.TestCase):
+
+    def test_movements_not_shared(self):
+        self.assertIsNot(MoveLogger().movements, MoveLogger().movements)
+
+    def test_gcode_maxlen(self):
+        logger = GCodeLogger(maxlen=2)
+        for line in [b'G28', b'G90', b'G0 X1']:
+            logger.write(line)
+        self.assertEqual(list(logger.write_buffer), [b'G90', b'G0 X1'])
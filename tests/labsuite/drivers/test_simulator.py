@@ -0,0 +1,159 @@
+import asyncio
+import unittest
+
+from labsuite.protocol import Protocol
+from labsuite.drivers.motor import OpenTrons
+from labsuite.drivers.async_motor import AsyncOpenTrons, PTYTransport
+from labsuite.drivers.simulator import (
+    axis_time, MotionModel, FirmwareSimulator, SimulatorTransport,
+    SimulatorPTY
+)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+
+
+class MotionModelTest(unittest.TestCase):
+
+    def test_axis_time(self):
+        """ Trapezoidal profile for long moves, triangular for short. """
+        self.assertEqual(axis_time(0, 50, 100), 0)
+        self.assertEqual(axis_time(100, 50, 100), 2.5)
+        self.assertEqual(axis_time(-100, 50, 100), 2.5)
+        self.assertEqual(axis_time(4, 50, 100), 0.4)
+        self.assertEqual(axis_time(100, 50, None), 2)
+
+    def test_slowest_axis(self):
+        """ A move takes as long as its slowest axis. """
+        model = MotionModel(axes={'x': (10, None), 'y': (5, None)})
+        self.assertEqual(model.move_time({}, {'x': 10, 'y': 10}), 2)
+        self.assertEqual(model.move_time({'y': 10}, {'x': 10, 'y': 10}), 1)
+
+
+class FirmwareSimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        model = MotionModel(
+            axes={'x': (10, None), 'y': (10, None), 'z': (5, None)},
+            latency=0.5
+        )
+        self.sim = FirmwareSimulator(model, record=True)
+
+    def test_absolute_move(self):
+        responses, duration = self.sim.handle('G0 X20 Y10')
+        self.assertEqual(responses, ['ok'])
+        self.assertEqual(duration, 2.5)
+        self.assertEqual(self.sim.position, {'x': 20, 'y': 10})
+
+    def test_relative_move(self):
+        self.sim.handle('G0 X20')
+        self.sim.handle('G91')
+        self.sim.handle('G0 X-5 Z5')
+        self.assertEqual(self.sim.position, {'x': 15, 'z': 5})
+
+    def test_feedrate(self):
+        """ Feedrate (mm/min) caps axis velocity. """
+        _, duration = self.sim.handle('G1 X10 F60')
+        self.assertEqual(duration, 10.5)
+
+    def test_dwell(self):
+        _, duration = self.sim.handle('G4 P1500')
+        self.assertEqual(duration, 2)
+
+    def test_home(self):
+        self.sim.handle('G0 X20 Z5')
+        _, duration = self.sim.handle('G28')
+        self.assertEqual(self.sim.position, {'x': 0, 'z': 0})
+        self.assertEqual(duration, 2.5)
+
+    def test_clock(self):
+        self.sim.handle('G0 X10')
+        self.sim.handle('G0 X0 ; back again')
+        self.assertEqual(self.sim.clock, 3)
+        self.assertEqual(self.sim.count, 2)
+        self.assertEqual(
+            [h[0] for h in self.sim.history], ['G0 X10', 'G0 X0 ; back again']
+        )
+        self.assertEqual([h[2] for h in self.sim.history], [1.5, 3])
+
+    def test_halt(self):
+        """ Moves are ignored while halted. """
+        self.sim.handle('M112')
+        self.sim.handle('G0 X10')
+        self.sim.handle('M999')
+        self.sim.handle('G0 Y10')
+        self.assertEqual(self.sim.position, {'y': 10})
+
+    def test_stat(self):
+        """ Debug mode adds stat responses. """
+        self.assertEqual(self.sim.handle('M62')[0], ['ok'])
+        self.assertEqual(self.sim.handle('G28')[0], ['ok', '{"stat":0}'])
+        self.assertEqual(self.sim.handle('M63')[0], ['ok', '{"stat":0}'])
+        self.assertEqual(self.sim.handle('G28')[0], ['ok'])
+
+    def test_serial_driver(self):
+        """ Stands in for the serial connection on the sync driver. """
+        motor = OpenTrons()
+        motor.connection = self.sim
+        motor.wait_for_stat()
+        motor.move(x=10, y=20)
+        self.assertEqual(self.sim.position, {'x': 10, 'y': 20})
+        self.assertEqual(self.sim.readline(), b'')  # Nothing left to read.
+
+    def test_async_transport(self):
+        motor = AsyncOpenTrons(SimulatorTransport(self.sim))
+
+        async def go():
+            motor.move(x=10)
+            await motor.drain()
+            motor.disconnect()
+
+        run(go())
+        self.assertEqual(self.sim.position, {'x': 10})
+        self.assertTrue(self.sim.debug)
+
+    def test_pty(self):
+        pty = SimulatorPTY(self.sim).start()
+        motor = AsyncOpenTrons(PTYTransport(pty.port))
+
+        async def go():
+            motor.move(y=10)
+            await motor.drain()
+            motor.disconnect()
+
+        try:
+            run(go())
+        finally:
+            pty.stop()
+        self.assertEqual(self.sim.position, {'y': 10})
+
+
+class SimulatedProtocolTest(unittest.TestCase):
+
+    def test_protocol_timing(self):
+        """ Time a protocol run on the simulator. """
+        protocol = Protocol()
+        protocol.add_instrument('B', 'p200')
+        protocol.add_container('A1', 'microplate.96')
+        protocol.add_container('B1', 'tiprack.p200')
+        protocol.add_container('C1', 'point.trash')
+        protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        protocol.calibrate('B1', x=10, y=20, top=30)
+        protocol.calibrate('C1', x=50, y=60, top=70)
+        protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        protocol.transfer('A1:A1', 'A1:A2', ul=100)
+        sim = FirmwareSimulator()
+        motor = protocol.attach_motor()
+        motor.simulate(sim)
+        protocol.run_all()
+        moves = len(motor._driver.movements)
+        self.assertEqual(sim.count, moves * 2)  # G90 before every move.
+        self.assertEqual(sim.position['x'], 50)
+        self.assertEqual(sim.position['b'], 0)
+        self.assertTrue(sim.clock > moves * sim.model.latency * 2)
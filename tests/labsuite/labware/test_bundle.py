@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from labsuite.labware import bundle, containers
+
+
+class BundleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.names = []
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        for name in self.names:
+            containers._index.pop(name, None)
+            containers._containers.pop(name, None)
+            containers._bundled.pop(name, None)
+
+    def write(self, path, text):
+        path = os.path.join(self.folder, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_stock_containers(self):
+        """ The bundled container files are all valid. """
+        compiled = bundle.compile_containers()
+        self.assertEqual(compiled.errors, [])
+        self.assertIn('microplate.example_plate.deepwell.red', compiled.index)
+        self.assertIn('legacy.tube-rack-15/50ml', compiled.index)
+        for name, position in compiled.index.items():
+            definition = compiled.definitions[position]
+            self.assertIn(name, [definition[0], 'legacy.' + str(
+                definition[2].get('legacy_name'))])
+
+    def test_every_error(self):
+        bad = self.write('bad.yml', (
+            "type: spaceship\n"
+            "rows: twelve\n"
+            "colour: red\n"
+            "custom_wells:\n"
+            "  A1: {x: 1, shape: round}\n"
+            "  7Z: {y: 2}\n"
+            "subsets:\n"
+            "  tall:\n"
+            "    height: true\n"
+        ))
+        self.write('broken.yml', "rows: [1\n")
+        self.write('plate.yml', "type: microplate\nrows: 2\ncols: 2\n")
+        self.write('more/plate.yml', "type: microplate\nrows: 4\n")
+        compiled = bundle.compile_containers(self.folder)
+        keys = [e.key for e in compiled.errors if e.path == bad]
+        self.assertEqual(sorted(keys), [
+            'colour', 'custom_wells.7Z', 'custom_wells.A1.shape', 'rows',
+            'subsets.tall.height', 'type'
+        ])
+        messages = [str(e) for e in compiled.errors if e.path != bad]
+        self.assertEqual(len(messages), 2)
+        self.assertIn("already defined", messages[1])
+        self.assertEqual(list(compiled.index), ['microplate.plate'])
+        with self.assertRaises(bundle.BundleError) as e:
+            compiled.save(os.path.join(self.folder, 'out.json'))
+        self.assertEqual(len(e.exception.errors), 8)
+
+    def test_load(self):
+        self.write('bundled_plate.yml', (
+            "type: microplate\nrows: 3\ncols: 2\nspacing: 5\n"
+            "legacy_name: bundled-legacy\n"
+            "custom_wells:\n  A2: {y: 7}\n"
+            "subsets:\n  deep:\n    well_depth: 20\n"
+        ))
+        self.names = [
+            'microplate.bundled_plate', 'microplate.bundled_plate.deep',
+            'legacy.bundled-legacy'
+        ]
+        compiled = bundle.compile_containers(self.folder)
+        path = os.path.join(self.folder, 'containers.bundle.json')
+        compiled.save(path)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['index'], compiled.index)
+        containers.load_bundle(path)
+        for name in self.names:
+            self.assertIn(name, containers.list_containers())
+        self.assertNotIn('microplate.bundled_plate', containers._containers)
+        plate = containers.load_container('microplate.bundled_plate')
+        self.assertEqual(plate.coordinates('A2'), (0, 7))
+        deep = containers.load_container('microplate.bundled_plate.deep')
+        self.assertEqual((deep.rows, deep.depth), (3, 20))
+        # Subsets inherit the legacy name, as with container files.
+        self.assertIs(containers.load_container('bundled-legacy'), deep)
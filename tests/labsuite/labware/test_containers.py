@@ -1,3 +1,7 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 from labsuite.labware import containers, microplates, tipracks
@@ -212,7 +216,7 @@ class ContainerTest(unittest.TestCase):
         self.assertDictEqual(result, expected)
 
         # Make sure the YAML works, too.
-        result = yaml.load(containers.legacy_json_to_yaml(data))
+        result = yaml.safe_load(containers.legacy_json_to_yaml(data))
 
         expected['spacing'] = 0
         result['well_depth'] = result.pop('depth')
@@ -315,3 +319,335 @@ class ContainerTest(unittest.TestCase):
         self.assertEqual(also_a4, rack.coordinates('a4'))
         self.assertEqual(also_a5, rack.coordinates('a5'))
 
+
+
+class LazyRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'lazy_plate.yml')
+        with open(self.path, 'w') as f:
+            f.write(
+                "type: microplate  # A plate.\n"
+                "rows: 4\ncols: 2\n"
+                "legacy_name: 'lazy-legacy'\n"
+                "subsets:\n"
+                "  deep:\n"
+                "    well_depth: 20\n"
+                "    subsets:\n"
+                "      red:\n"
+                "        volume: 5\n"
+                "  shallow:\n"
+                "    well_depth: 2\n"
+            )
+        containers.load_custom_containers(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        for name in containers.list_containers():
+            if 'lazy' in name:
+                containers._index.pop(name, None)
+                containers._containers.pop(name, None)
+
+    def test_indexed_not_parsed(self):
+        inv = containers.list_containers()
+        for name in ['microplate.lazy_plate', 'microplate.lazy_plate.deep',
+                     'microplate.lazy_plate.deep.red',
+                     'microplate.lazy_plate.shallow', 'legacy.lazy-legacy']:
+            self.assertIn(name, inv)
+        self.assertNotIn(self.path, containers._loaded)
+        self.assertNotIn('microplate.lazy_plate', containers._containers)
+
+    def test_loaded_on_demand(self):
+        red = containers.load_container('microplate.lazy_plate.deep.red')
+        self.assertEqual((red.rows, red.depth, red.volume), (4, 20, 5))
+        self.assertIn(self.path, containers._loaded)
+        # The whole file was built at once.
+        self.assertIn('microplate.lazy_plate.shallow', containers._containers)
+        self.assertEqual(
+            containers.load_container('lazy-legacy').rows, 4
+        )
+
+    def write(self, name, text):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_scan_matches_parser(self):
+        """ Skimming finds the names the YAML parser would. """
+        folder = os.path.join(
+            os.path.dirname(containers.labware.__file__),
+            '..', 'config', 'containers'
+        )
+        paths = [self.path, self.write('lazy_indent.yml', (
+            "type: microplate\n"
+            "subsets:    # Four spaces.\n"
+            "    deep:   # Comment after a key.\n"
+            "        well_depth: -20\n"
+            "        legacy_name: lazy-indent  # The old name.\n"
+        ))]
+        for root, _, files in os.walk(folder):
+            paths.extend(
+                os.path.join(root, f) for f in files if f.endswith('.yml')
+            )
+        for path in paths:
+            names = containers._scan_container_file(path)
+            self.assertIsNotNone(names, path)
+            definitions = containers._parse_container_file(path)
+            self.assertEqual(
+                sorted(names),
+                sorted(containers._definition_names(definitions)),
+                path
+            )
+
+    def test_quoted_and_flow(self):
+        """ Files the scan can't be sure of are parsed straight away. """
+        path = self.write('lazy_flow.yml', (
+            "type: microplate\n"
+            "'rows': 4\n"
+            "cols: 2\n"
+            "subsets: {deep: {well_depth: 20}, \"tall\": {height: 50}}\n"
+            "legacy_name: \"lazy-flow\"  # Quoted.\n"
+        ))
+        self.assertIsNone(containers._scan_container_file(path))
+        containers.load_custom_containers(self.folder)
+        inv = containers.list_containers()
+        for name in ['microplate.lazy_flow', 'microplate.lazy_flow.deep',
+                     'microplate.lazy_flow.tall', 'legacy.lazy-flow']:
+            self.assertIn(name, inv)
+        deep = containers.load_container('microplate.lazy_flow.deep')
+        self.assertEqual((deep.rows, deep.depth), (4, 20))
+        self.assertEqual(containers.load_container('lazy-flow').rows, 4)
+        # The plain file is still only indexed.
+        self.assertNotIn(self.path, containers._loaded)
+
+    def test_direct_definition_wins(self):
+        containers.add_custom_container(
+            {'type': 'microplate', 'rows': 9}, name='lazy_plate'
+        )
+        containers.load_container('microplate.lazy_plate.deep')
+        self.assertEqual(
+            containers.load_container('microplate.lazy_plate').rows, 9
+        )
+
+
+class DefinitionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'cached_plate.yml')
+        self.write("type: microplate\nrows: 4\ncols: 2\n")
+        self.cache = os.path.join(self.folder, 'cache', 'containers.json')
+        self.previous = containers._cache_file
+        containers.set_definition_cache(self.cache)
+        self.parsed = 0
+        self.parse = containers._parse_container_file
+
+        def counting(path):
+            self.parsed += 1
+            return self.parse(path)
+        containers._parse_container_file = counting
+
+    def tearDown(self):
+        containers._parse_container_file = self.parse
+        containers.set_definition_cache(self.previous)
+        shutil.rmtree(self.folder)
+        for name in containers.list_containers():
+            if 'cached_plate' in name:
+                containers._index.pop(name, None)
+                containers._containers.pop(name, None)
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def load(self):
+        """ Loads the plate as a new process would. """
+        containers.save_definition_cache()
+        containers._cache = None
+        containers.load_custom_containers(self.folder)
+        return containers.load_container('microplate.cached_plate')
+
+    def test_cached(self):
+        self.assertEqual(self.load().rows, 4)
+        self.assertEqual(self.load().rows, 4)
+        self.assertEqual(self.parsed, 1)
+        with open(self.cache, 'r') as f:
+            self.assertIn(self.path, json.load(f)['entries'])
+
+    def test_saved_once(self):
+        """ Nothing is written until the cache is saved. """
+        containers.load_custom_containers(self.folder)
+        containers.load_container('microplate.cached_plate')
+        containers.load_legacy_containers_file()
+        self.assertFalse(os.path.exists(self.cache))
+        containers.save_definition_cache()
+        self.assertEqual(len(containers._read_cache()), 2)
+
+    def test_off_by_default(self):
+        if not os.environ.get('LABSUITE_CACHE'):
+            self.assertIsNone(self.previous)
+
+    def test_bad_entries(self):
+        os.makedirs(os.path.dirname(self.cache))
+        with open(self.cache, 'w') as f:
+            json.dump({'version': containers._cache_version, 'entries': {
+                self.path: [[0, 0], [['x', 'exec', {}, None]]]
+            }}, f)
+        self.assertEqual(containers._read_cache(), {})
+        with open(self.cache, 'w') as f:
+            f.write("not json")
+        self.assertEqual(self.load().rows, 4)
+
+    def test_invalidated(self):
+        self.load()
+        self.write("type: microplate\nrows: 16\ncols: 24\n")
+        self.assertEqual(self.load().rows, 16)
+        self.assertEqual(self.parsed, 2)
+
+    def test_disabled(self):
+        containers.set_definition_cache(None)
+        self.load()
+        self.load()
+        self.assertEqual(self.parsed, 2)
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_legacy_file(self):
+        containers.load_legacy_containers_file()
+        containers.save_definition_cache()
+        containers._cache = None
+        containers.load_legacy_containers_file()
+        self.assertEqual(len(containers._read_cache()), 1)
+        self.assertIn('legacy.24-plate', containers.list_containers())
+
+
+class ContainerRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = containers.ContainerRegistry(
+            containers.default_registry
+        )
+
+    def test_scoped(self):
+        plate = self.registry.add_custom_container(
+            {'type': 'microplate', 'rows': 2, 'cols': 3,
+             'subsets': {'deep': {'well_depth': 20}}},
+            name='scoped_plate'
+        )
+        self.assertEqual(
+            self.registry.load_container('microplate.scoped_plate'), plate
+        )
+        deep = self.registry.load_container('microplate.scoped_plate.deep')
+        self.assertEqual(deep.depth, 20)
+        self.assertNotIn(
+            'microplate.scoped_plate', containers.list_containers()
+        )
+        with self.assertRaises(KeyError):
+            containers.load_container('microplate.scoped_plate')
+        # Everything else comes from the default registry.
+        self.assertIs(
+            self.registry.get_definition('microplate.96'),
+            containers.default_registry.get_definition('microplate.96')
+        )
+
+    def test_immutable(self):
+        self.registry.add_custom_container(
+            {'type': 'microplate', 'rows': 2, 'cols': 2,
+             'custom_wells': {'A1': {'x': 5, 'y': 6}}},
+            name='frozen_plate'
+        )
+        definition = self.registry.get_definition('microplate.frozen_plate')
+        self.assertEqual(definition.properties['rows'], 2)
+        with self.assertRaises(TypeError):
+            definition.properties['rows'] = 3
+        with self.assertRaises(TypeError):
+            definition.custom_wells[(0, 0)]['x'] = 1
+        with self.assertRaises(AttributeError):
+            definition.name = 'other'
+        plate = definition.container_class
+        self.assertEqual(plate.coordinates('A1'), (5, 6))
+
+    def test_shared_instance(self):
+        """ Subclasses don't use their parent's coordinate instance. """
+        microplates.Microplate.coordinates('A1')
+        custom = containers.add_custom_container(
+            {'type': 'microplate', 'spacing': 20}
+        )
+        self.assertEqual(custom.coordinates('B1'), (20, 0))
+        self.assertIsInstance(custom._get_instance(), custom)
+
+
+class LegacyLibraryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'containers.json')
+        wells = {
+            '{}{}'.format(col, row): {
+                'x': (ord(col) - ord('A')) * 9, 'y': (row - 1) * 9,
+                'depth': 10, 'diameter': 6, 'total-liquid-volume': 200
+            }
+            for col in 'AB' for row in range(1, 11)
+        }
+        library = {
+            'plate 10': {'origin-offset': {'x': 5, 'y': 6},
+                         'locations': wells},
+            'plate/10': {'locations': wells},  # Same file name.
+            'broken': {'locations': {}},
+        }
+        with open(self.path, 'w') as f:
+            json.dump({'containers': library}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def convert(self, name, workers):
+        out = os.path.join(self.folder, name)
+        report = containers.convert_legacy_library(
+            out, path=self.path, workers=workers
+        )
+        files = {}
+        for fname in sorted(os.listdir(out)):
+            with open(os.path.join(out, fname)) as f:
+                files[fname] = f.read()
+        return report, files
+
+    def test_convert(self):
+        report, files = self.convert('serial', workers=1)
+        self.assertEqual(sorted(files), ['plate_10.yml'])
+        self.assertEqual(sorted(report.failed), ['broken', 'plate/10'])
+        data = yaml.safe_load(files['plate_10.yml'])
+        self.assertEqual((data['rows'], data['cols']), (10, 2))
+        self.assertEqual(data['legacy_name'], 'plate 10')
+        self.assertEqual(
+            report.summary().split('\n')[0],
+            "Converted 1 containers (1 written, 0 unchanged), 2 failed."
+        )
+
+    def test_streamed(self):
+        """ Containers are read from the file one at a time. """
+        with open(self.path, 'w') as f:
+            f.write(
+                '{"version": 123456, "containers": {\n'
+                '  "a": {"locations": {"A1": {"x": 0.125, "y": -1e3}}},\n'
+                '  "b \\"quoted\\"": {"locations": {}}\n'
+                '}, "other": [1, {"containers": 2}]}'
+            )
+        with open(self.path) as f:
+            expected = list(json.load(f)['containers'].items())
+        for chunk_size in (1, 7, 65536):
+            self.assertEqual(
+                list(containers._legacy_items(self.path, chunk_size)),
+                expected
+            )
+        items = containers._legacy_items(self.path, 16)
+        self.assertEqual(next(items)[0], 'a')
+
+    def test_deterministic(self):
+        first, files = self.convert('out', workers=1)
+        self.assertEqual(len(first.written), 1)
+        again, same = self.convert('out', workers=2)
+        self.assertEqual((again.written, len(again.unchanged)), ([], 1))
+        self.assertEqual(files, same)
+        self.assertEqual(self.convert('pool', workers=2)[1], files)
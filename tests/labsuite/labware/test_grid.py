@@ -93,6 +93,21 @@ class GridTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             normalize_position('11')
 
+    def test_double_letter_column(self):
+        """
+        Columns past Z use double letters ('AA1').
+        """
+        self.assertEqual(normalize_position('Z1'), (25, 0))
+        self.assertEqual(normalize_position('AA1'), (26, 0))
+        self.assertEqual(normalize_position('af48'), (31, 47))
+        self.assertEqual(normalize_position('ZZ2'), (701, 1))
+        self.assertEqual(normalize_position('AAA1'), (702, 0))
+        for col in [0, 25, 26, 51, 52, 701, 702, 1000]:
+            name = humanize_position((col, 3))
+            self.assertEqual(normalize_position(name), (col, 3))
+        with self.assertRaises(ValueError):
+            normalize_position('A]1')
+
     def test_tuple(self):
         """
         Passthrough normalization of 2-member tuple.
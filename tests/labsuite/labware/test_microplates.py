@@ -143,3 +143,21 @@ class MicroplateWellTest(unittest.TestCase):
         """ml to µl conversion."""
         self.well.allocate(water=.1, ml=True)
         self.assertEqual(self.well.get_volume(), 100)
+
+
+class HighDensityPlateTest(unittest.TestCase):
+
+    def test_1536(self):
+        from labsuite.labware import containers
+        plate = containers.load_container('microplate.1536')()
+        self.assertEqual(plate.total_wells, 1536)
+        last = plate.well('AF48')
+        self.assertEqual(last.address, [(31, 47)])
+        self.assertEqual(last.human_address, 'AF48')
+        self.assertEqual(len(plate.col('AF')), 48)
+        self.assertEqual(len(plate.row(47)), 32)
+        col, row = plate.coordinates('AB2')
+        self.assertAlmostEqual(col, 27 * 2.25)
+        self.assertAlmostEqual(row, 2.25)
+        with self.assertRaises(x.SlotMissing):
+            plate.well('AG1')
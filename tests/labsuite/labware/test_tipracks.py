@@ -112,6 +112,15 @@ class TiprackTest(unittest.TestCase):
         self.rack.set_tips_used(96)
         self.assertEqual(self.rack.has_tips, False)
 
+    def test_refill(self):
+        self.rack.set_tips_used(96)
+        self.rack.refill()
+        self.assertEqual(self.rack.tips_used, 0)
+        self.assertEqual(
+            self.rack.tip('A1').position,
+            self.rack.get_next_tip().position
+        )
+
     def test_slot_row_col_exceptions(self):
         tip = self.rack.tip('A1')
         tip.set_used()
@@ -0,0 +1,156 @@
+import math
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol.calibration import AffineModel, fit_affine
+from labsuite.util import exceptions as x
+
+
+class AffineFitTest(unittest.TestCase):
+
+    def setUp(self):
+        # Deck turned by one degree, stretched and shifted.
+        r = math.radians(1)
+        self.true = AffineModel(
+            1.01 * math.cos(r), -math.sin(r), 12,
+            math.sin(r), 0.99 * math.cos(r), -7
+        )
+
+    def pairs(self, *points):
+        return [(p, self.true.apply(*p)) for p in points]
+
+    def test_affine(self):
+        pairs = self.pairs((0, 0), (400, 0), (0, 200), (400, 200))
+        model = fit_affine(pairs)
+        self.assertEqual(model.points, 4)
+        for (a, b) in zip(model.matrix, self.true.matrix):
+            for u, v in zip(a, b):
+                self.assertAlmostEqual(u, v)
+        self.assertTrue(all(r < 1e-9 for r in model.residuals(pairs)))
+
+    def test_two_points(self):
+        """ Points in a line give rotation, scale and translation. """
+        model = fit_affine(self.pairs((0, 0), (400, 0)))
+        for p in [(0, 0), (400, 0)]:
+            fitted, true = model.apply(*p), self.true.apply(*p)
+            self.assertAlmostEqual(fitted[0], true[0])
+            self.assertAlmostEqual(fitted[1], true[1])
+
+    def test_one_point(self):
+        model = fit_affine([((10, 10), (15, 20))])
+        self.assertEqual(model.apply(20, 30), (25, 40))
+
+    def test_no_points(self):
+        with self.assertRaises(x.CalibrationMissing):
+            fit_affine([])
+
+    def test_apply_many(self):
+        points = [(i, 2 * i) for i in range(10)]
+        self.assertEqual(
+            self.true.apply_many(points),
+            [self.true.apply(*p) for p in points]
+        )
+
+
+class AffineCalibrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        for slot in ('A1', 'C1', 'A3', 'B2'):
+            self.protocol.add_container(slot, 'microplate.96')
+        self.protocol.add_container('E3', 'tiprack.p200')
+        self.context = self.protocol._context_handler
+        deck = self.context._deck
+        r = math.radians(0.5)
+        self.true = AffineModel(
+            math.cos(r), -math.sin(r), 5, math.sin(r), math.cos(r), 3
+        )
+        for slot, top in (('A1', 10), ('C1', 12), ('A3', 14)):
+            sx, sy = deck.slot_offset(slot)
+            x, y = self.true.apply(sx, sy)
+            self.protocol.calibrate(slot, x=x, y=y, top=top, bottom=top + 10)
+
+    def test_off_by_default(self):
+        with self.assertRaises(x.CalibrationMissing):
+            self.protocol._context_handler.get_coordinates(
+                ((1, 1), (0, 0)), axis='B'
+            )
+
+    def test_fills_in_slots(self):
+        self.protocol.use_affine_calibration()
+        coords = self.context.get_coordinates(((1, 1), (2, 3)), axis='B')
+        sx, sy = self.context._deck.slot_offset('B2')
+        ox, oy = self.context._deck.slot('B2').get_child_coordinates((2, 3))
+        x, y = self.true.apply(sx + ox, sy + oy)
+        self.assertAlmostEqual(coords['x'], x)
+        self.assertAlmostEqual(coords['y'], y)
+        # Nearest calibrated plate is A1 (C1 and A3 are further).
+        self.assertEqual((coords['top'], coords['bottom']), (10, 20))
+
+    def test_calibrated_slot(self):
+        """ Calibrated A1s are kept; wells are turned with the deck. """
+        self.protocol.use_affine_calibration()
+        a1 = self.protocol._normalize_address('A1:A1')
+        cal = self.protocol._calibration['B'][a1[0]]
+        coords = self.context.get_coordinates(a1, axis='B')
+        self.assertEqual((coords['x'], coords['y']), (cal['x'], cal['y']))
+        h12 = self.context.get_coordinates(((0, 0), (7, 11)), axis='B')
+        ox, oy = self.context._deck.slot('A1').get_child_coordinates((7, 11))
+        self.assertAlmostEqual(h12['x'], self.true.apply(ox, oy)[0])
+        self.assertAlmostEqual(h12['y'], self.true.apply(ox, oy)[1])
+
+    def test_mixed_containers(self):
+        """ Each container's A1 offset is part of its nominal position. """
+        self.protocol.add_container('B1', 'reservoir.12')
+        deck = self.context._deck
+        for slot in ('A1', 'C1', 'E3', 'B1'):
+            container = deck.slot(slot)
+            sx, sy = deck.slot_offset(slot)
+            x, y = self.true.apply(
+                sx + (container.a1_x or 0), sy + (container.a1_y or 0)
+            )
+            self.protocol.calibrate(slot, x=x, y=y, top=10, bottom=20)
+        del self.protocol._calibration['B'][(0, 2)]  # A3
+        self.protocol.use_affine_calibration()
+        plate = deck.slot('B2')
+        sx, sy = deck.slot_offset('B2')
+        ox, oy = plate.get_child_coordinates((2, 3))
+        x, y = self.true.apply(sx + plate.a1_x + ox, sy + plate.a1_y + oy)
+        coords = self.context.get_coordinates(((1, 1), (2, 3)), axis='B')
+        self.assertAlmostEqual(coords['x'], x)
+        self.assertAlmostEqual(coords['y'], y)
+
+    def test_refit(self):
+        self.protocol.use_affine_calibration()
+        model = self.context.get_affine_model('B')
+        self.assertIs(self.context.get_affine_model('B'), model)
+        self.protocol.calibrate('C1', x=1)
+        self.assertIsNot(self.context.get_affine_model('B'), model)
+        self.protocol.use_affine_calibration(enabled=False)
+        self.assertIsNone(self.context.get_affine_model('B'))
+
+    def test_container_coordinates(self):
+        for enabled in (False, True):
+            self.protocol.use_affine_calibration(enabled=enabled)
+            self.protocol.calibrate('A3:B2', x=100, y=200)
+            wells = self.context.get_container_coordinates((0, 2), axis='B')
+            self.assertEqual(len(wells), 96)
+            for well, coords in wells.items():
+                self.assertEqual(
+                    coords,
+                    self.context.get_coordinates(((0, 2), well), axis='B')
+                )
+
+    def test_compile_recompiles(self):
+        self.protocol.transfer('A1:A1', 'B2:A1', ul=100)
+        self.protocol.add_container('E1', 'point.trash')
+        self.protocol.calibrate('E3', x=400, y=200, top=5)
+        self.protocol.calibrate('E1', x=400, y=0, top=5)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.use_affine_calibration()
+        program = self.protocol.compile_ir()
+        self.protocol.calibrate('C1', x=50)
+        self.assertIsNone(program.relink(self.protocol._calibration))
+        after = self.protocol.compile_ir()
+        changed = [i for i in range(len(program)) if after[i] != program[i]]
+        self.assertTrue(changed)  # B2 moved with the model.
@@ -0,0 +1,89 @@
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol.optimizers.clearance import ClearancePlanner
+from labsuite.drivers.simulator import FirmwareSimulator
+
+
+class ClearancePlannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'microplate.96')
+        self.protocol.add_container('A2', 'microplate.96.pcr.flat')
+        self.protocol.add_container('C1', 'tiprack.p200')
+        self.protocol.add_container('D1', 'point.trash')
+        self.protocol.calibrate('A1', x=10, y=10, top=40, bottom=50)
+        self.protocol.calibrate('B1', x=150, y=10, top=40, bottom=50)
+        self.protocol.calibrate('C1', x=290, y=10, top=30)
+        self.protocol.calibrate('D1', x=400, y=200, top=10)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        context = self.protocol._context_handler
+        self.planner = ClearancePlanner(context, margin=5)
+
+    def test_same_plate(self):
+        self.assertEqual(self.planner.travel_height('B', (10, 10)), 35)
+
+    def test_plate_to_plate(self):
+        height = self.planner.travel_height('B', (10, 10), (150, 10))
+        self.assertEqual(height, 35)
+
+    def test_inferred_height(self):
+        """ Uncalibrated containers are placed on the inferred deck. """
+        # Deep well plates are 33.5mm high, PCR plates 10.4mm.
+        a2 = self.planner.travel_height('B', (40, 150))
+        self.assertAlmostEqual(a2, 40 + 33.5 - 10.4 - 5)
+        # Crossing both, the deep well plate is the one to clear.
+        height = self.planner.travel_height('B', (10, 10), (40, 150))
+        self.assertEqual(height, 35)
+
+    def test_tiprack_unknown(self):
+        """ Tipracks have tips sticking up, so retract fully. """
+        height = self.planner.travel_height('B', (10, 10), (290, 10))
+        self.assertEqual(height, 0)
+
+    def test_unknown_position(self):
+        self.assertEqual(self.planner.travel_height('B', None, (10, 10)), 0)
+
+
+class ClearanceRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('C1', 'tiprack.p200')
+        self.protocol.add_container('D1', 'point.trash')
+        self.protocol.calibrate('A1', x=10, y=10, top=40, bottom=50)
+        self.protocol.calibrate('C1', x=290, y=10, top=30)
+        self.protocol.calibrate('D1', x=400, y=200, top=10)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.transfer_group(
+            ('A1:A1', 'A1:A2'),
+            ('A1:A3', 'A1:A4'),
+            ul=100
+        )
+
+    def run_on_simulator(self, clearance):
+        sim = FirmwareSimulator()
+        motor = self.protocol.attach_motor()
+        motor.simulate(sim)
+        motor.plan_clearance(clearance)
+        self.protocol.run_all()
+        self.protocol._handlers.remove(motor)
+        return motor._driver.movements, sim.clock
+
+    def test_off_by_default(self):
+        moves, _ = self.run_on_simulator(False)
+        self.assertEqual(moves[2], {'z': 0})
+
+    def test_time_saved(self):
+        """ Hops within a plate don't go all the way up. """
+        _, full = self.run_on_simulator(False)
+        moves, planned = self.run_on_simulator(True)
+        self.assertTrue(planned < full)
+        self.assertIn({'z': 35}, moves)
+        # Still clears the tiprack on the way to the trash.
+        trash = moves.index({'x': 400, 'y': 200})
+        self.assertEqual(moves[trash - 1], {'z': 0})
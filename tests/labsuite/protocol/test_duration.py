@@ -0,0 +1,83 @@
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol.handlers.duration import DurationEstimate
+from labsuite.drivers.simulator import FirmwareSimulator, MotionModel
+
+
+class DurationEstimateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'tiprack.p200')
+        self.protocol.add_container('C1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('B1', x=10, y=20, top=30)
+        self.protocol.calibrate('C1', x=50, y=60, top=70)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.transfer('A1:A1', 'A1:A2', ul=100)
+        self.protocol.transfer('A1:A2', 'A1:A3', ul=80)
+
+    def test_remaining(self):
+        estimate = DurationEstimate([1.0, 2.0, 3.0])
+        self.assertEqual(estimate.total, 6)
+        self.assertEqual(estimate.remaining(0), 6)
+        self.assertEqual(estimate.remaining(1), 5)
+        self.assertEqual(estimate.remaining(3), 0)
+        self.assertEqual(estimate.remaining(4), 0)
+
+    def test_matches_simulator(self):
+        """ Without dwell, the estimate matches the firmware simulator. """
+        estimate = self.protocol.estimate_duration(
+            pickup_dwell=0, blowout_dwell=0
+        )
+        sim = FirmwareSimulator()
+        self.protocol.attach_motor().simulate(sim)
+        self.protocol.run_all()
+        self.assertEqual(len(estimate.commands), 2)
+        self.assertEqual(estimate.moves * 2, sim.count)
+        self.assertAlmostEqual(estimate.total, sim.clock)
+
+    def test_dwell(self):
+        """ Tip pickup and blowout add dwell time. """
+        model = MotionModel()
+        plain = self.protocol.estimate_duration(
+            model=model, pickup_dwell=0, blowout_dwell=0
+        )
+        dwell = self.protocol.estimate_duration(
+            model=model, pickup_dwell=2, blowout_dwell=1
+        )
+        self.assertAlmostEqual(dwell.total - plain.total, 6)
+
+    def test_slower_robot(self):
+        fast = self.protocol.estimate_duration()
+        slow = self.protocol.estimate_duration(
+            axes={'x': (10, 100), 'y': (10, 100)}
+        )
+        self.assertTrue(slow.total > fast.total)
+
+    def test_no_side_effects(self):
+        """ Estimating doesn't touch attached handlers. """
+        motor = self.protocol.attach_motor()
+        self.protocol.estimate_duration()
+        self.assertEqual(motor._driver.movements, [])
+        self.assertEqual(self.protocol._handlers, [motor])
+
+    def test_tiprack_refill(self):
+        """ Running out of tips assumes the racks get replaced. """
+        for n in range(100):
+            self.protocol.mix('A1:A1', repetitions=1, ul=50)
+        estimate = self.protocol.estimate_duration()
+        self.assertEqual(estimate.refills, 1)
+        self.assertEqual(len(estimate.commands), 102)
+
+    def test_run_eta(self):
+        """ Run progress can include the estimated time remaining. """
+        estimate = self.protocol.estimate_duration()
+        progress = list(self.protocol.run(eta=True))
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(progress[0], (0, 2, estimate.total))
+        self.assertEqual(progress[1][:2], (1, 2))
+        self.assertAlmostEqual(progress[1][2], estimate.commands[1])
+        self.assertEqual(progress[2], (2, 2, 0))
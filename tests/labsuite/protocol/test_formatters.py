@@ -219,3 +219,46 @@ class ProtocolFormatterTest(unittest.TestCase):
         p.add_instrument('B', 'p20')
         # Hashes are different.
         self.assertNotEqual(self.protocol, p)
+
+
+class CustomContainerExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_custom_container(
+            {
+                'type': 'microplate', 'rows': 3, 'cols': 2, 'spacing': 30,
+                'custom_wells': {'B2': {'x': 40, 'y': 35}}
+            },
+            name='pair'
+        )
+        self.protocol.add_container('A1', 'microplate.pair', 'Tubes')
+        self.protocol.add_container('B1', 'microplate.96')
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.transfer('Tubes:B2', 'B1:A1', ul=20)
+
+    def test_round_trip(self):
+        """ Protocol-scoped containers are exported and loaded back. """
+        dump = self.protocol.export(JSONFormatter)
+        result = json.loads(dump)
+        self.assertEqual(list(result['custom_containers']), ['pair'])
+        protocol = JSONLoader(dump).protocol
+        again = json.loads(protocol.export(JSONFormatter))
+        again['info'] = result['info'] = ""
+        self.assertEqual(again, result)
+        for p in (self.protocol, protocol):
+            p.add_container('C1', 'tiprack.p200')
+            p.add_container('D1', 'point.trash')
+            p.calibrate('A1', x=0, y=0, top=0, bottom=10)
+            p.calibrate('B1', x=100, y=0, top=0, bottom=10)
+            p.calibrate('C1', x=200, y=0, top=0)
+            p.calibrate('D1', x=300, y=0, top=0)
+            p.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.assertEqual(
+            list(protocol.compile_ir()), list(self.protocol.compile_ir())
+        )
+
+    def test_without_custom(self):
+        """ Protocols without their own containers export as before. """
+        dump = Protocol().export(JSONFormatter)
+        self.assertNotIn('custom_containers', json.loads(dump))
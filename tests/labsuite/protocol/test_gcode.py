@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.drivers import gcode
+from labsuite.drivers.simulator import FirmwareSimulator
+from labsuite.util import exceptions as x
+
+
+class CompiledGCodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'tiprack.p200')
+        self.protocol.add_container('C1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('B1', x=10, y=20, top=30)
+        self.protocol.calibrate('C1', x=50, y=60, top=70)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.transfer('A1:A1', 'A1:A2', ul=100)
+        self.protocol.transfer('A1:A2', 'A1:A3', ul=80)
+        fd, self.path = tempfile.mkstemp(suffix='.gcode')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_compile(self):
+        self.assertTrue(self.protocol.compile_gcode(self.path))
+        header = gcode.read_header(self.path)
+        self.assertEqual(header['protocol'], self.protocol.hash)
+        self.assertEqual(
+            header['calibration'], self.protocol.calibration_hash
+        )
+        self.assertEqual(header['commands'], '2')
+        lines = list(gcode.read_lines(self.path, chunk_size=7))
+        self.assertEqual(lines[4:7], ['; command 0', 'G90', 'G0 X10 Y20'])
+        self.assertIn('; command 1', lines)
+
+    def test_skip_when_up_to_date(self):
+        self.assertTrue(self.protocol.compile_gcode(self.path))
+        self.assertFalse(self.protocol.compile_gcode(self.path))
+        self.assertTrue(self.protocol.compile_gcode(self.path, force=True))
+        self.protocol.calibrate('C1', x=55, y=60, top=70)
+        self.assertTrue(self.protocol.compile_gcode(self.path))
+
+    def test_run_matches_handlers(self):
+        """ Running compiled G-code moves the robot the same way. """
+        sim = FirmwareSimulator()
+        self.protocol.attach_motor().simulate(sim)
+        self.protocol.run_all()
+        expected = (sim.position, sim.clock)
+
+        self.protocol.compile_gcode(self.path)
+        sim = FirmwareSimulator()
+        self.protocol.attach_motor().simulate(sim)
+        progress = list(self.protocol.run_gcode(self.path))
+        self.assertEqual(progress, [(0, 2), (1, 2), (2, 2)])
+        self.assertEqual(sim.position, expected[0])
+        # One extra line to set absolute positioning up front.
+        self.assertAlmostEqual(sim.clock, expected[1] + sim.model.latency)
+
+    def test_resume(self):
+        """ Resume from the start of a command. """
+        self.protocol.compile_gcode(self.path)
+        sim = FirmwareSimulator(record=True)
+        self.protocol.attach_motor().simulate(sim)
+        progress = list(self.protocol.run_gcode(self.path, start=1))
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+        sent = [h[0] for h in sim.history]
+        self.assertEqual(sent[:4], ['G28', 'G90', 'G90', 'G0 X10 Y29'])
+
+    def test_resume_kept_tip(self):
+        """
+        A command that reuses a tip kept from an earlier one can't be
+        resumed from, since homing leaves the robot without it.
+        """
+        self.protocol.set_tip_policy('per-source')
+        self.protocol.transfer('A1:A2', 'A1:A4', ul=20)
+        self.protocol.compile_gcode(self.path)
+        self.assertEqual(gcode.resume_point(self.path, 2), 1)
+        self.assertEqual(gcode.resume_point(self.path, 1), 1)
+        sim = FirmwareSimulator(record=True)
+        self.protocol.attach_motor().simulate(sim)
+        with self.assertRaises(x.ResumeUnsafe):
+            next(self.protocol.run_gcode(self.path, start=2))
+        self.assertEqual(sim.history, [])
+        progress = list(self.protocol.run_gcode(self.path, start=1))
+        self.assertEqual(progress, [(1, 3), (2, 3), (3, 3)])
+        # Under 'always', every command takes its own tip.
+        self.protocol.set_tip_policy('always')
+        self.protocol.compile_gcode(self.path)
+        self.assertEqual(gcode.resume_point(self.path, 2), 2)
+
+    def test_mismatch(self):
+        self.protocol.compile_gcode(self.path)
+        self.protocol.attach_motor()
+        self.protocol.calibrate('C1', x=55, y=60, top=70)
+        with self.assertRaises(x.CompiledGCodeMismatch):
+            list(self.protocol.run_gcode(self.path))
+
+    def test_not_compiled(self):
+        with open(self.path, 'w') as f:
+            f.write("G28\n")
+        self.assertEqual(gcode.read_header(self.path), None)
+        self.assertTrue(self.protocol.compile_gcode(self.path))
@@ -0,0 +1,160 @@
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol import ir
+from labsuite.drivers.simulator import FirmwareSimulator
+from labsuite.util import exceptions as x
+
+
+class MotionIRTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'tiprack.p200')
+        self.protocol.add_container('C1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('B1', x=10, y=20, top=30)
+        self.protocol.calibrate('C1', x=50, y=60, top=70)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.transfer('A1:A1', 'A1:A2', ul=100)
+        self.protocol.distribute(
+            'A1:A1', 'A1:B1', 'A1:B2', 'A1:B3', ul=50, multi=True
+        )
+        self.protocol.mix('A1:A2', ul=50, repetitions=2)
+
+    def handler_moves(self):
+        motor = self.protocol.attach_motor()
+        self.protocol.run_all()
+        self.protocol._handlers.remove(motor)
+        return motor._driver.movements
+
+    def test_compile(self):
+        program = self.protocol.compile_ir()
+        self.assertEqual(program.commands, 3)
+        self.assertEqual(program.tips_used(), {'B': 3})
+        op, command, tool, move = program[0]
+        self.assertEqual((op, command, tool), (ir.PICKUP, 0, 'B'))
+        self.assertEqual(move, {'x': 10, 'y': 20})
+        ops = [program[i][0] for i in program.command_rows(1)]
+        self.assertEqual(ops.count(ir.ASPIRATE), 1)
+        self.assertEqual(ops.count(ir.DISPENSE), 2)
+        self.assertEqual(ops.count(ir.BLOWOUT), 1)
+
+    def test_cached(self):
+        program = self.protocol.compile_ir()
+        self.assertIs(self.protocol.compile_ir(), program)
+        self.protocol.calibrate('C1', x=55, y=60, top=70)
+        self.assertIsNot(self.protocol.compile_ir(), program)
+
+    def test_same_moves(self):
+        """ Replaying the program moves the robot like the handlers. """
+        expected = self.handler_moves()
+        self.protocol.attach_motor()
+        progress = list(self.protocol.run_ir())
+        self.assertEqual(progress, [(0, 3), (1, 3), (2, 3), (3, 3)])
+        self.assertEqual(self.protocol._motor_handler._driver.movements,
+                         expected)
+
+    def test_resume(self):
+        program = self.protocol.compile_ir()
+        sim = FirmwareSimulator(record=True)
+        self.protocol.attach_motor().simulate(sim)
+        progress = list(self.protocol.run_ir(start=2))
+        self.assertEqual(progress, [(2, 3), (3, 3)])
+        self.assertEqual(sim.history[0][0], 'G28')
+        moves = self.protocol._motor_handler._driver.movements
+        self.assertEqual(len(moves), len(program.command_rows(2)))
+
+    def test_resume_kept_tip(self):
+        self.protocol.set_tip_policy('per-source')
+        self.protocol.mix('A1:A2', ul=50, repetitions=2)
+        program = self.protocol.compile_ir()
+        self.assertEqual(program.reused(3), ['B'])
+        self.assertEqual(program.resume_point(3), 2)
+        self.assertEqual(
+            self.protocol.compile_ir(optimize=True).resume_point(3), 2
+        )
+        self.protocol.attach_motor()
+        with self.assertRaises(x.ResumeUnsafe):
+            next(self.protocol.run_ir(start=3))
+        progress = list(self.protocol.run_ir(start=2))
+        self.assertEqual(progress, [(2, 4), (3, 4), (4, 4)])
+
+    def test_estimate(self):
+        """ Timing the program agrees with the handler-based estimate. """
+        expected = self.protocol.estimate_duration()
+        estimate = self.protocol.compile_ir().estimate()
+        self.assertEqual(estimate.moves, expected.moves)
+        for a, b in zip(estimate.commands, expected.commands):
+            self.assertAlmostEqual(a, b)
+
+class RelinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('A2', 'microplate.96')
+        self.protocol.add_container('B1', 'tiprack.p200')
+        self.protocol.add_container('C1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('A2', x=1, y=120, top=3, bottom=13)
+        self.protocol.calibrate('B1', x=10, y=20, top=30)
+        self.protocol.calibrate('C1', x=50, y=60, top=70)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.transfer('A1:A1', 'A2:A2', ul=100)
+        self.protocol.distribute(
+            'A1:A1', 'A2:B1', 'A2:B2', 'A2:B3', ul=50, multi=True
+        )
+        self.protocol.mix('A2:A2', ul=50, repetitions=2)
+
+    def recompiled(self):
+        self.protocol._compiled = None
+        program = self.protocol.compile_ir()
+        return [program[i] for i in range(len(program))]
+
+    def assertSameRows(self, program, expected):
+        self.assertEqual(len(program), len(expected))
+        for i, (op, command, tool, move) in enumerate(expected):
+            row = program[i]
+            self.assertEqual(row[:3], (op, command, tool))
+            self.assertEqual(sorted(row[3]), sorted(move))
+            for axis, value in move.items():
+                self.assertAlmostEqual(row[3][axis], value)
+
+    def test_relink(self):
+        program = self.protocol.compile_ir()
+        self.protocol.calibrate('A2', x=4, y=125, top=2, bottom=11)
+        self.protocol._handler_runthrough = None  # No compiling.
+        relinked = self.protocol.compile_ir()
+        del self.protocol._handler_runthrough
+        self.assertIsNot(relinked, program)
+        self.assertEqual(
+            relinked.calibration_hash, self.protocol.calibration_hash
+        )
+        self.assertSameRows(relinked, self.recompiled())
+        # The original is left as it was.
+        self.assertEqual(program[0][3], {'x': 10, 'y': 20})
+
+    def test_only_affected_moves(self):
+        program = self.protocol.compile_ir()
+        self.protocol.calibrate('C1', x=55)
+        relinked = self.protocol.compile_ir()
+        changed = [
+            i for i in range(len(program)) if program[i] != relinked[i]
+        ]
+        self.assertEqual(len(changed), program.tips_used()['B'])
+        self.assertTrue(all(relinked[i][0] == ir.DROP for i in changed))
+
+    def test_recompile(self):
+        """ Instrument and well calibration need a full compile. """
+        program = self.protocol.compile_ir()
+        cal = self.protocol._calibration
+        self.protocol.calibrate_instrument('B', blowout=12)
+        self.assertIsNone(program.relink(cal))
+        self.assertSameRows(self.protocol.compile_ir(), self.recompiled())
+        program = self.protocol.compile_ir()
+        self.protocol.calibrate('A2:A2', x=3)
+        self.assertIsNone(program.relink(cal))
+        self.assertSameRows(self.protocol.compile_ir(), self.recompiled())
@@ -0,0 +1,52 @@
+import unittest
+from labsuite.protocol import Protocol
+
+
+class LayoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96', label='Source')
+        self.protocol.add_container('E3', 'microplate.96', label='Output')
+        self.protocol.add_container('A3', 'tiprack.p200')
+        self.protocol.add_container('E1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('E3', x=400, y=270, top=3, bottom=13)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        for n in range(1, 9):
+            self.protocol.transfer(
+                'Source:A{}'.format(n), 'Output:B{}'.format(n), ul=20
+            )
+
+    def test_optimize(self):
+        report = self.protocol.optimize_layout()
+        self.assertTrue(report.after < report.before)
+        self.assertEqual(report.saved, report.before - report.after)
+        out = report.protocol
+        self.assertEqual(len(out.commands), 8)
+        # Same wells, by label, wherever the plates ended up.
+        source = out._container_labels['source']
+        self.assertEqual(out.commands[0]['start'], (source, (0, 0)))
+        self.assertEqual(out._containers[source], 'microplate.96')
+        # The original protocol is left alone.
+        self.assertEqual(self.protocol._containers[(0, 0)], 'microplate.96')
+
+    def test_fixed(self):
+        report = self.protocol.optimize_layout(fixed=['A1', 'E3'])
+        self.assertNotIn((0, 0), report.moved)
+        self.assertNotIn((4, 2), report.moved)
+        self.assertTrue(report.after < report.before)
+        # Calibration is kept for the plates that didn't move.
+        cal = report.protocol._calibration['B']
+        self.assertEqual(cal[(0, 0)]['x'], 1)
+        self.assertEqual(cal['_instrument']['blowout'], 10)
+        self.assertNotIn((0, 2), cal)
+
+    def test_already_optimal(self):
+        report = self.protocol.optimize_layout(
+            fixed=['A1', 'E3', 'A3', 'E1']
+        )
+        self.assertEqual(report.moved, {})
+        self.assertEqual(report.after, report.before)
+        self.assertEqual(report.protocol.commands, self.protocol.commands)
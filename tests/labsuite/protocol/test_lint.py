@@ -0,0 +1,107 @@
+import json
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol.formatters import JSONFormatter
+from labsuite.protocol.lint import lint_json
+
+
+class LintTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('A', 'p200')
+        self.protocol.add_instrument('B', 'p10.8')
+        self.protocol.add_container('A1', 'microplate.96', label='Samples')
+        self.protocol.add_container('B1', 'microplate.96')
+        self.protocol.add_container('C1', 'tiprack.p200')
+        self.protocol.add_container('D1', 'point.trash')
+        self.protocol.add_container('E1', 'tuberack.2000ul')
+
+    def export(self):
+        return json.loads(self.protocol.export(JSONFormatter))
+
+    def lint(self, data):
+        return [str(p) for p in lint_json(json.dumps(data))]
+
+    def test_clean(self):
+        self.protocol.transfer('Samples:A1', 'B1:A1', ul=20)
+        self.protocol.distribute('A1:A1', ('B1:A2', {'ul': 30}), ul=20)
+        self.protocol.mix('B1:A2', ul=50, repetitions=2)
+        self.protocol.stamp('Samples', 'B1', ul=20, region=('A1', 'H2'))
+        self.protocol.replicate('Samples:B', 'B1', ul=20)
+        self.assertEqual(self.protocol.lint(), [])
+        self.assertEqual(self.lint(self.export()), [])
+
+    def test_all_problems(self):
+        """ Every problem is reported, with the index of its command. """
+        self.protocol.transfer('Samples:A1', 'B1:A1', ul=20)
+        self.protocol.transfer('Samples:A2', 'B1:A2', ul=20)
+        self.protocol.transfer('Samples:A3', 'B1:A3', ul=20)
+        self.protocol.mix('B1:A2', ul=50, repetitions=2)
+        data = self.export()
+        data['instructions'][0]['start'] = 'Nothing:A1'
+        data['instructions'][1]['end'] = 'B1:I1'
+        data['instructions'][1]['volume'] = 500
+        data['instructions'][2]['tool'] = 'p1000'
+        data['instructions'][3]['command'] = 'shake'
+        self.assertEqual(self.lint(data), [
+            "Command 0: Container not found: Nothing",
+            "Command 1: microplate.96: Column I out of range (max is H).",
+            "Command 1: Volume of 500 is out of range for p200 (20 to 200).",
+            "Command 2: No instrument on the head named p1000.",
+            "Command 3: Unknown command: shake"
+        ])
+
+    def test_deck(self):
+        self.protocol.transfer('Samples:A1', 'B1:A1', ul=20)
+        data = self.export()
+        data['containers'] = [
+            c for c in data['containers'] if c['slot'] not in ('C1', 'D1')
+        ]
+        data['containers'].append({'name': 'microplate.7', 'slot': 'B2'})
+        data['instruments']['p10_a'] = {'axis': 'C', 'name': 'p7'}
+        self.assertEqual(self.lint(data), [
+            "Unknown container in slot B2: microplate.7",
+            "Unknown instrument on axis C: p7",
+            "Command 0: No tiprack.p200 on the deck for p200.",
+            "Command 0: No point.trash on the deck for p200."
+        ])
+
+    def test_multichannel_square(self):
+        self.protocol.add_custom_container(
+            {'type': 'microplate', 'rows': 4, 'cols': 4}, 'microplate.square'
+        )
+        self.protocol.add_container('A2', 'microplate.square')
+        self.protocol.transfer('B1:A1', 'B1:A2', ul=5, tool='p10.8')
+        problems = [str(p) for p in self.protocol.lint()]
+        self.assertEqual(problems, [
+            "Command 0: No tiprack.p10 on the deck for p10.8."
+        ])
+        data = self.export()
+        data['instructions'][0]['start'] = 'A2:A1'
+        problems = lint_json(json.dumps(data), self.protocol._registry)
+        self.assertIn(
+            "Command 0: Ambiguous multichannel transfer; plate is square.",
+            [str(p) for p in problems]
+        )
+
+    def test_plate_commands(self):
+        self.protocol.stamp('Samples', 'B1', ul=20)
+        self.protocol.replicate('Samples:A', 'B1', ul=20)
+        data = self.export()
+        data['instructions'][0]['destination'] = 'E1'
+        data['instructions'][1]['to_column'] = 'J'
+        data['instructions'][1]['plates'] = ['B1', 'F3']
+        problems = self.lint(data)
+        self.assertIn("Command 1: Container not found: F3", problems)
+        self.assertIn(
+            "Command 1: microplate.96: Column J out of range (max is H).",
+            problems
+        )
+        self.assertTrue(problems[0].startswith("Command 0: tuberack.2000ul"))
+
+    def test_invalid_json(self):
+        problems = lint_json("{")
+        self.assertEqual(len(problems), 1)
+        self.assertIsNone(problems[0].index)
+        self.assertTrue(problems[0].message.startswith("Invalid JSON"))
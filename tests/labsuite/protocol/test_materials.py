@@ -0,0 +1,139 @@
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol.handlers.tips import POLICIES
+
+
+class BillOfMaterialsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('A', 'p200')
+        self.protocol.add_instrument('B', 'p200.8')
+        self.protocol.add_container('A1', 'microplate.96', label='Samples')
+        self.protocol.add_container('B1', 'microplate.96')
+        self.protocol.add_container('C1', 'tiprack.p200')
+        self.protocol.add_container('C2', 'tiprack.p200')
+        self.protocol.add_container('D1', 'point.trash')
+        for axis in 'AB':
+            for n, slot in enumerate(['A1', 'B1', 'C1', 'C2', 'D1']):
+                self.protocol.calibrate(
+                    slot, axis=axis, x=n * 100, y=0, top=10, bottom=20
+                )
+            self.protocol.calibrate_instrument(
+                axis, top=0, blowout=10, droptip=25
+            )
+        self.protocol.add_ingredient('A1:A1', 'water', ul=1000)
+        self.protocol.add_ingredient('A1:B1', 'water', ul=1000)
+        self.protocol.add_ingredient('A1:C1', 'buffer', ul=1000)
+        for well in ('E1', 'F1', 'G1'):
+            # Drawn dry before a consolidate.
+            self.protocol.add_ingredient('A1:' + well, 'water', ul=100)
+
+    def add_commands(self):
+        self.protocol.transfer('Samples:A1', 'B1:A1', ul=50)
+        self.protocol.transfer('Samples:A1', 'B1:A2', ul=50)
+        self.protocol.transfer('Samples:B1', 'B1:A3', ul=50)
+        self.protocol.transfer('Samples:C1', 'B1:A4', ul=50)
+        self.protocol.mix('B1:A4', ul=50, repetitions=2)
+        self.protocol.distribute(
+            'Samples:A1', 'B1:B1', 'B1:B2', 'B1:B3', ul=80, multi=True
+        )
+        self.protocol.consolidate(
+            'B1:C1', 'Samples:A1', 'Samples:B1', ul=120, multi=True
+        )
+        self.protocol.consolidate(
+            'B1:C2', 'Samples:A1', 'Samples:C1', ul=120, multi=True
+        )
+        self.protocol.transfer_group(
+            ('Samples:D1', 'B1:D1'), ('Samples:D1', 'B1:D2'), ul=20
+        )
+        self.protocol.transfer('B1:A1', 'B1:A12', ul=20, tool='p200.8')
+        self.protocol.consolidate(
+            'B1:E2', 'Samples:E1', 'Samples:F1', 'Samples:G1', ul=100,
+            multi=True
+        )
+        self.protocol.stamp('Samples', 'B1', ul=20, region=('A5', 'H6'),
+                            multichannel=True)
+
+    def test_matches_run(self):
+        """ The bill agrees with the tips and volumes of a real run. """
+        self.add_commands()
+        for policy in POLICIES:
+            self.protocol.set_tip_policy(policy)
+            bill = self.protocol.bill_of_materials()
+            program = self.protocol.compile_ir()
+            self.assertEqual(
+                bill.pickups,
+                {'p200': program.tips_used()['A'],
+                 'p200.8': program.tips_used()['B']},
+                policy
+            )
+        context = self.protocol._context_handler
+        for (slot, well), ul in bill.volumes.items():
+            address = (slot, well)
+            start = self.protocol._ingredients.get(address, (None, 0))[1]
+            self.assertEqual(
+                context._deck.slot(slot).get_child(well).get_volume(),
+                start - ul
+            )
+
+    def test_tips(self):
+        self.add_commands()
+        bill = self.protocol.bill_of_materials()
+        # A tip for each transfer and the mix, one for the distribute and
+        # each consolidate from a single liquid, and one per pipette-full
+        # for water and buffer.  Multichannel pickups (the transfer and
+        # two rows of the stamp) take eight tips each.
+        self.assertEqual(bill.pickups, {'p200': 11, 'p200.8': 3})
+        self.assertEqual(bill.tips, {'P200': 11 + 3 * 8})
+
+    def test_volumes(self):
+        self.add_commands()
+        bill = self.protocol.bill_of_materials()
+        volumes = bill.volumes
+        self.assertEqual(volumes[((0, 0), (0, 0))], 50 + 50 + 240 + 120 * 2)
+        self.assertEqual(volumes[((0, 0), (7, 4))], 20)
+        self.assertNotIn(((1, 0), (0, 0)), volumes)  # Net gain.
+        self.assertEqual(bill.liquids, {
+            'water': 580 + 50 + 120 + 300,
+            'buffer': 50 + 120
+        })
+
+    def test_refilled(self):
+        """ A well that's refilled only has to hold its largest deficit. """
+        self.protocol.transfer('Samples:A1', 'B1:A1', ul=100)
+        self.protocol.transfer('B1:B1', 'Samples:A1', ul=100)
+        self.protocol.transfer('Samples:A1', 'B1:A2', ul=50)
+        bill = self.protocol.bill_of_materials()
+        self.assertEqual(bill.volumes, {
+            ((0, 0), (0, 0)): 100,
+            ((1, 0), (1, 0)): 100
+        })
+
+    def test_drained_mixture(self):
+        """ A mixture drawn dry is unspecified, as in a real run. """
+        self.protocol.set_tip_policy('per-liquid')
+        self.protocol.add_ingredient('A1:H1', 'water', ul=50)
+        self.protocol.transfer('Samples:C1', 'Samples:H1', ul=50)
+        self.protocol.transfer('Samples:H1', 'B1:H1', ul=100)
+        self.protocol.transfer('Samples:H1', 'B1:H2', ul=20)
+        self.protocol.transfer('Samples:H1', 'B1:H3', ul=20)
+        bill = self.protocol.bill_of_materials()
+        program = self.protocol.compile_ir()
+        self.assertEqual(bill.pickups['p200'], program.tips_used()['A'])
+
+    def test_occupancy(self):
+        self.add_commands()
+        bill = self.protocol.bill_of_materials()
+        self.assertIn((0, 11), bill.wells[(1, 0)])
+        # A1-G1 and the stamped rows of the samples.
+        self.assertEqual(bill.occupancy[(0, 0)], 7 + 16)
+        # Rows 1 and 12 from the multichannel transfer, A2-E2, A3-B3, A4
+        # and the stamped rows.
+        self.assertEqual(bill.occupancy[(1, 0)], 8 * 2 + 5 + 2 + 1 + 16)
+
+    def test_empty(self):
+        bill = self.protocol.bill_of_materials()
+        self.assertEqual(bill.tips, {})
+        self.assertEqual(bill.volumes, {})
+        self.assertEqual(bill.occupancy, {})
@@ -0,0 +1,113 @@
+import unittest
+from labsuite.protocol import Protocol
+
+
+class MultiTransferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'tiprack.p200')
+        self.protocol.add_container('C1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('B1', x=100, y=100, top=50)
+        self.protocol.calibrate('C1', x=200, y=250, top=15)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+
+    def run_moves(self):
+        motor = self.protocol.attach_motor()
+        self.protocol.run_all()
+        return motor._driver.movements
+
+    def tips_used(self, moves):
+        return len([m for m in moves if m.get('x') == 100])
+
+    def test_plan_chunks(self):
+        context = self.protocol._context_handler
+        transfers = [{'volume': v} for v in [80, 80, 80, 200, 10]]
+        tips = context.plan_multi('p200', transfers)
+        self.assertEqual(len(tips), 1)
+        sizes = [[t['volume'] for t in c] for c in tips[0]]
+        self.assertEqual(sizes, [[80, 80], [80], [200], [10]])
+
+    def test_distribute(self):
+        self.protocol.distribute(
+            'A1:A1', 'A1:B1', 'A1:C1', 'A1:D1', ul=60, multi=True
+        )
+        moves = self.run_moves()
+        # One tip, one aspirate of 180ul, two partial dispenses.
+        self.assertEqual(self.tips_used(moves), 1)
+        self.assertEqual(moves[5], {'b': 9})
+        self.assertIn({'b': 3}, moves)
+        self.assertIn({'b': 6}, moves)
+        self.assertEqual(moves.count({'b': 10}), 1)  # Blowout.
+        context = self.protocol._context_handler
+        self.assertEqual(context.get_volume('A1:A1'), -180)
+        self.assertEqual(context.get_volume('A1:D1'), 60)
+
+    def test_distribute_chunks(self):
+        self.protocol.distribute(
+            'A1:A1', 'A1:B1', 'A1:C1', 'A1:D1', ul=100, multi=True
+        )
+        moves = self.run_moves()
+        self.assertEqual(self.tips_used(moves), 1)
+        # Two trips to the source, in and out of the well.
+        self.assertEqual(moves.count({'x': 1, 'y': 2}), 4)
+
+    def test_consolidate_mixed_liquids(self):
+        """ Sources with unknown liquids get a fresh tip per chunk. """
+        self.protocol.consolidate(
+            'A1:A1', 'A1:B1', 'A1:C1', 'A1:D1', ul=100, multi=True
+        )
+        moves = self.run_moves()
+        self.assertEqual(self.tips_used(moves), 2)
+        # Two trips to the destination, in and out of the well.
+        self.assertEqual(moves.count({'x': 1, 'y': 2}), 4)
+        self.assertEqual(moves[5], {'b': 10})  # Room for 200ul.
+        self.assertIn({'b': 5}, moves)  # 100ul still to aspirate.
+        context = self.protocol._context_handler
+        self.assertEqual(context.get_volume('A1:A1'), 300)
+
+    def test_consolidate_same_liquid(self):
+        plate = self.protocol._context_handler._deck.slot('A1')
+        context = self.protocol._context_handler
+        for well in [(1, 0), (2, 0), (3, 0)]:
+            plate.get_child(well).add_named_liquid(150, 'water')
+        sources = [((0, 0), (1, 0)), ((0, 0), (2, 0))]
+        self.assertTrue(context.share_liquid(sources))
+        plate.get_child((3, 0)).add_named_liquid(10, 'buffer')
+        self.assertFalse(context.share_liquid(sources + [((0, 0), (3, 0))]))
+
+    def test_consolidate_drained_sources(self):
+        """ Sources drawn dry still count as holding their liquid. """
+        for ul in [100, 150]:
+            self.setUp()
+            for well in ['A1:B1', 'A1:C1', 'A1:D1']:
+                self.protocol.add_ingredient(well, 'water', ul=ul)
+            self.protocol.consolidate(
+                'A1:A1', 'A1:B1', 'A1:C1', 'A1:D1', ul=100, multi=True
+            )
+            self.protocol.run_requirements
+            rack = self.protocol._context_handler._deck.slot('B1')
+            self.assertEqual(rack.tips_used, 1, ul)
+            self.assertEqual(self.tips_used(self.run_moves()), 1, ul)
+
+    def test_requirements_tips(self):
+        """ Requirements count the same tips the motors use. """
+        self.protocol.consolidate(
+            'A1:A1', 'A1:B1', 'A1:C1', 'A1:D1', ul=100, multi=True
+        )
+        self.protocol.distribute(
+            'A1:A1', 'A1:B1', 'A1:C1', 'A1:D1', ul=100, multi=True
+        )
+        self.protocol.run_requirements
+        rack = self.protocol._context_handler._deck.slot('B1')
+        self.assertEqual(rack.tips_used, 3)
+        self.assertEqual(self.tips_used(self.run_moves()), 3)
+
+    def test_default_command(self):
+        self.protocol.distribute('A1:A1', 'A1:B1', ul=60)
+        self.assertNotIn('multi', self.protocol.commands[0])
+        self.protocol.consolidate('A1:A1', 'A1:B1', ul=60, multi=True)
+        self.assertTrue(self.protocol.commands[1]['multi'])
@@ -0,0 +1,83 @@
+import unittest
+from labsuite.protocol import Protocol
+
+LETTERS = 'ABCDEFGH'
+
+
+class MultichannelLoweringTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('A', 'p200')
+        self.protocol.add_instrument('B', 'p200.8')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'microplate.96')
+        self.protocol.add_container('C1', 'tiprack.p200')
+        self.protocol.add_container('D1', 'point.trash')
+
+    def stamp_row(self, src, dst, ul=20, order=LETTERS, tool='p200'):
+        for col in order:
+            self.protocol.transfer(
+                'A1:{}{}'.format(col, src),
+                'B1:{}{}'.format(col, dst),
+                ul=ul, tool=tool
+            )
+
+    def test_lower_row(self):
+        self.stamp_row(1, 3)
+        self.stamp_row(2, 4, order='HGFEDCBA')
+        report = self.protocol.lower_multichannel()
+        self.assertEqual(report.before, 16)
+        self.assertEqual(report.after, 2)
+        self.assertEqual(report.saved, 14)
+        self.assertEqual(self.protocol.commands[0], {
+            'command': 'transfer',
+            'tool': 'p200.8',
+            'volume': 20,
+            'start': ((0, 0), (0, 0)),
+            'end': ((1, 0), (0, 2)),
+            'blowout': True,
+            'touchtip': True
+        })
+        self.assertEqual(len(self.protocol.commands), 2)
+        context = self.protocol._context_handler
+        self.assertEqual(context.get_volume('B1:H4'), 20)
+        self.assertEqual(context.get_volume('A1:D2'), -20)
+
+    def test_partial_row(self):
+        """ Seven wells aren't enough to fill the pipette. """
+        self.stamp_row(1, 3, order=LETTERS[:7])
+        self.stamp_row(2, 4)
+        report = self.protocol.lower_multichannel()
+        self.assertEqual(report.groups, [(7, 8, 'p200.8')])
+        self.assertEqual(len(self.protocol.commands), 8)
+
+    def test_mismatches(self):
+        # Different volumes.
+        for i, col in enumerate(LETTERS):
+            self.protocol.transfer(
+                'A1:{}1'.format(col), 'B1:{}1'.format(col), ul=20 + i
+            )
+        # Channels crossing over.
+        for col, other in zip(LETTERS, reversed(LETTERS)):
+            self.protocol.transfer(
+                'A1:{}1'.format(col), 'B1:{}1'.format(other), ul=20
+            )
+        # Split over two rows.
+        for i, col in enumerate(LETTERS):
+            self.protocol.transfer(
+                'A1:{}{}'.format(col, 1 + i % 2), 'B1:{}2'.format(col), ul=20
+            )
+        report = self.protocol.lower_multichannel()
+        self.assertEqual(report.groups, [])
+        self.assertEqual(len(self.protocol.commands), 24)
+
+    def test_no_multichannel(self):
+        protocol = Protocol()
+        protocol.add_instrument('A', 'p200')
+        protocol.add_container('A1', 'microplate.96')
+        for col in LETTERS:
+            protocol.transfer(
+                'A1:{}1'.format(col), 'A1:{}2'.format(col), ul=20
+            )
+        self.assertEqual(protocol.lower_multichannel().groups, [])
@@ -0,0 +1,178 @@
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol import ir
+from labsuite.protocol.optimizers import peephole
+from labsuite.drivers.simulator import FirmwareSimulator
+
+
+def program(*rows):
+    out = ir.MotionIR()
+    for row in rows:
+        out.append(*row)
+    return out
+
+
+def rows(program):
+    return [program[i] for i in range(len(program))]
+
+
+class PassTest(unittest.TestCase):
+
+    def test_drop_stationary(self):
+        before = [
+            (ir.MOVE, 0, 'B', {'z': 0}),
+            (ir.MOVE, 0, 'B', {'x': 1, 'y': 2}),
+            (ir.MOVE, 0, 'B', {'z': 3}),
+            (ir.MOVE, 0, 'B', {'x': 1, 'y': 5}),
+            (ir.MOVE, 0, 'B', {'z': 3}),
+            (ir.MOVE, 1, 'B', {'z': 3}),  # Position unknown again.
+        ]
+        self.assertEqual(peephole.drop_stationary(before), [
+            (ir.MOVE, 0, 'B', {'z': 0}),
+            (ir.MOVE, 0, 'B', {'x': 1, 'y': 2}),
+            (ir.MOVE, 0, 'B', {'z': 3}),
+            (ir.MOVE, 0, 'B', {'y': 5}),
+            (ir.MOVE, 1, 'B', {'z': 3}),
+        ])
+
+    def test_drop_stationary_references(self):
+        """ Equal values that follow different calibration are kept. """
+        top = ir.Reference(3, ('B', (0, 0), 'top'))
+        bottom = ir.Reference(3, ('B', (0, 0), 'bottom'))
+        before = [
+            (ir.MOVE, 0, 'B', {'z': top}),
+            (ir.MOVE, 0, 'B', {'z': bottom}),
+            (ir.MOVE, 0, 'B', {'z': 3}),
+            (ir.MOVE, 0, 'B', {'z': 3}),
+        ]
+        self.assertEqual(peephole.drop_stationary(before), before[:3])
+
+    def test_collapse_moves(self):
+        before = [
+            (ir.MOVE, 0, 'B', {'z': 0}),
+            (ir.MOVE, 0, 'B', {'z': 3}),
+            (ir.PICKUP, 0, 'B', {'z': 5}),
+            (ir.MOVE, 0, 'B', {'z': 0}),  # Tagged moves are kept.
+            (ir.MOVE, 0, 'B', {'x': 1}),
+            (ir.MOVE, 0, 'B', {'b': 5}),  # Plunge...
+            (ir.ASPIRATE, 0, 'B', {'b': 0}),  # ...and draw.
+        ]
+        self.assertEqual(peephole.collapse_moves(before), [
+            (ir.MOVE, 0, 'B', {'z': 3}),
+            (ir.PICKUP, 0, 'B', {'z': 5}),
+            (ir.MOVE, 0, 'B', {'z': 0}),
+            (ir.MOVE, 0, 'B', {'x': 1}),
+            (ir.MOVE, 0, 'B', {'b': 5}),
+            (ir.ASPIRATE, 0, 'B', {'b': 0}),
+        ])
+
+    def test_fold_plunger(self):
+        before = [
+            (ir.BLOWOUT, 0, 'B', {'b': 10}),
+            (ir.MOVE, 0, 'B', {'z': 0}),
+            (ir.MOVE, 0, 'B', {'b': 0}),  # Reset...
+            (ir.MOVE, 0, 'B', {'z': 3}),
+            (ir.MOVE, 0, 'B', {'b': 5}),  # ...then plunge.
+            (ir.MOVE, 0, 'B', {'z': 13}),
+            (ir.ASPIRATE, 0, 'B', {'b': 0}),
+        ]
+        after = peephole.fold_plunger(before)
+        self.assertEqual(len(after), 6)
+        self.assertNotIn((ir.MOVE, 0, 'B', {'b': 0}), after)
+        # Nothing folds into a tagged operation.
+        self.assertEqual(peephole.fold_plunger(after), after)
+
+
+class OptimizeIRTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'tiprack.p200')
+        self.protocol.add_container('C1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('B1', x=10, y=20, top=30)
+        self.protocol.calibrate('C1', x=50, y=60, top=70)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.transfer('A1:A1', 'A1:A2', ul=100)
+        self.protocol.distribute(
+            'A1:A1', 'A1:B1', 'A1:B2', 'A1:B3', ul=50, multi=True
+        )
+        self.protocol.mix('A1:A2', ul=50, repetitions=2)
+
+    def test_report(self):
+        original = self.protocol.compile_ir()
+        report = peephole.optimize_ir(original)
+        names = [s.name for s in report.passes]
+        self.assertEqual(names, [p.__name__ for p in peephole.PASSES])
+        self.assertTrue(all(s.removed > 0 for s in report.passes))
+        self.assertEqual(report.before, len(original))
+        self.assertEqual(report.after, len(report.program))
+        self.assertEqual(report.program.commands, original.commands)
+        self.assertEqual(report.program.tips_used(), original.tips_used())
+
+    def test_same_final_state(self):
+        original = self.protocol.compile_ir()
+        optimized = self.protocol.compile_ir(optimize=True)
+        self.assertLess(len(optimized), len(original))
+        self.assertTrue(peephole.verify(original, optimized))
+        broken = program(*rows(optimized)[:-1])
+        broken.set_commands(optimized.commands)
+        self.assertFalse(peephole.verify(original, broken))
+
+    def test_flat_well(self):
+        """ A plunge right before its aspiration isn't merged away. """
+        self.protocol.calibrate('A1', x=1, y=2, top=0, bottom=0)
+        original = self.protocol.compile_ir()
+        optimized = self.protocol.compile_ir(optimize=True)
+        self.assertEqual(
+            peephole.strokes(original), peephole.strokes(optimized)
+        )
+        self.assertTrue(peephole.verify(original, optimized))
+        # Without the plunges, every command still ends in the same place
+        # but no liquid is drawn.
+        plunger = [row for row in rows(optimized) if 'b' in row[3]]
+        plunges = [
+            row for i, row in enumerate(plunger[:-1])
+            if row[0] == ir.MOVE and plunger[i + 1][0] == ir.ASPIRATE
+        ]
+        self.assertTrue(plunges)
+        broken = [row for row in rows(optimized) if row not in plunges]
+        broken = program(*broken)
+        broken.set_commands(optimized.commands)
+        self.assertEqual(
+            peephole.simulate(original), peephole.simulate(broken)
+        )
+        self.assertFalse(peephole.verify(original, broken))
+
+    def test_relink(self):
+        """ An optimised program relinks like the one it came from. """
+        optimized = self.protocol.compile_ir(optimize=True)
+        self.protocol.calibrate('A1', x=5, y=7, top=4, bottom=14)
+        self.protocol.calibrate('C1', x=50, y=60, top=75)
+        calibration = self.protocol._calibration
+        self.assertTrue(optimized.can_relink(calibration))
+        relinked = optimized.relink(calibration)
+        self.protocol._compiled = None
+        expected = peephole.optimize_ir(self.protocol.compile_ir()).program
+        self.assertEqual(rows(relinked), rows(expected))
+        self.assertNotEqual(rows(relinked), rows(optimized))
+
+    def test_cached(self):
+        optimized = self.protocol.compile_ir(optimize=True)
+        self.assertIs(self.protocol.compile_ir(optimize=True), optimized)
+        self.assertIsNot(self.protocol.compile_ir(), optimized)
+
+    def test_faster(self):
+        original = self.protocol.compile_ir().estimate()
+        optimized = self.protocol.compile_ir(optimize=True).estimate()
+        self.assertLess(optimized.total, original.total)
+
+    def test_resume(self):
+        """ Resuming after homing still reaches the same place. """
+        sim = FirmwareSimulator()
+        self.protocol.attach_motor().simulate(sim)
+        list(self.protocol.run_ir(start=1, optimize=True))
+        expected = peephole.simulate(self.protocol.compile_ir())[-1]
+        self.assertEqual(sim.position, expected)
@@ -0,0 +1,194 @@
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol import plates
+from labsuite.protocol.formatters import JSONFormatter
+from labsuite.protocol.formatters.json import JSONLoader
+from labsuite.labware.grid import humanize_position
+from labsuite.util import exceptions as x
+
+
+class PlateCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = self.make_protocol()
+
+    def make_protocol(self):
+        protocol = Protocol()
+        protocol.add_instrument('A', 'p200')
+        protocol.add_instrument('B', 'p200.8')
+        protocol.add_container('A1', 'microplate.96', label='Samples')
+        protocol.add_container('B1', 'microplate.96')
+        protocol.add_container('C1', 'microplate.96')
+        protocol.add_container('D1', 'tiprack.p200')
+        protocol.add_container('E1', 'point.trash')
+        for axis in 'AB':
+            protocol.calibrate('A1', axis=axis, x=1, y=2, top=3, bottom=13)
+            protocol.calibrate('B1', axis=axis, x=100, y=2, top=3, bottom=13)
+            protocol.calibrate('C1', axis=axis, x=200, y=2, top=3, bottom=13)
+            protocol.calibrate('D1', axis=axis, x=300, y=20, top=30)
+            protocol.calibrate('E1', axis=axis, x=400, y=60, top=70)
+            protocol.calibrate_instrument(
+                axis, top=0, blowout=10, droptip=25
+            )
+        return protocol
+
+    def handler_moves(self, protocol):
+        motor = protocol.attach_motor()
+        protocol.run_all()
+        protocol._handlers.remove(motor)
+        return motor._driver.movements
+
+    def expanded(self, protocol=None):
+        protocol = protocol or self.protocol
+        context = protocol._context_handler
+        return [plates.expand(c, context) for c in protocol.commands]
+
+    def test_compact(self):
+        self.protocol.stamp('Samples', 'B1', ul=20)
+        self.assertEqual(self.protocol.commands, [{
+            'command': 'stamp',
+            'tool': 'p200',
+            'volume': 20,
+            'source': (0, 0),
+            'destination': (1, 0),
+            'blowout': True,
+            'touchtip': True
+        }])
+        transfers = self.expanded()[0]
+        self.assertEqual(len(transfers), 96)
+        self.assertEqual(transfers[1]['start'], ((0, 0), (1, 0)))
+        self.assertEqual(transfers[1]['end'], ((1, 0), (1, 0)))
+
+    def test_same_as_transfers(self):
+        """ A stamp moves the robot like a transfer for each well. """
+        self.protocol.stamp('Samples', 'B1', ul=20)
+        wells = [transfer for transfer in self.expanded()[0]]
+        expected = self.make_protocol()
+        for t in wells:
+            expected.transfer(
+                'A1:' + humanize_position(t['start'][1]),
+                'B1:' + humanize_position(t['end'][1]),
+                ul=20
+            )
+        self.assertEqual(
+            self.handler_moves(self.protocol),
+            self.handler_moves(expected)
+        )
+        context = self.protocol._context_handler
+        self.assertEqual(context.get_volume('B1:H12'), 20)
+        self.assertEqual(context.get_volume('A1:A1'), -20)
+
+    def test_same_tips_as_transfers(self):
+        """ Tip policies see each well of a stamp as its own transfer. """
+        tips = []
+        for stamp in (True, False):
+            protocol = self.make_protocol()
+            protocol.set_tip_policy('per-liquid')
+            wells = [
+                humanize_position(w) for w in plates.region_wells(
+                    protocol._context_handler._deck.slot('A1')
+                )
+            ]
+            for well in wells:
+                # Every source is drawn dry.
+                protocol.add_ingredient('Samples:' + well, 'water', ul=20)
+            if stamp:
+                protocol.stamp('Samples', 'B1', ul=20)
+            else:
+                for well in wells:
+                    protocol.transfer('A1:' + well, 'B1:' + well, ul=20)
+            tips.append(protocol.compile_ir().tips_used())
+        self.assertEqual(tips[0], {'A': 1})
+        self.assertEqual(tips[0], tips[1])
+
+    def test_one_ir_command(self):
+        self.protocol.stamp('Samples', 'B1', ul=20, region=('A1', 'H11'))
+        self.protocol.transfer('B1:A1', 'C1:A1', ul=20)
+        program = self.protocol.compile_ir()
+        self.assertEqual(program.commands, 2)
+        self.assertEqual(program.tips_used(), {'A': 89})
+
+    def test_multichannel(self):
+        self.protocol.stamp('Samples', 'B1', ul=20, multichannel=True)
+        transfers = self.expanded()[0]
+        self.assertEqual(len(transfers), 12)
+        self.assertEqual({t['tool'] for t in transfers}, {'p200.8'})
+        self.protocol.run_all()
+        context = self.protocol._context_handler
+        self.assertEqual(context.get_volume('B1:H12'), 20)
+        self.assertEqual(context.get_volume('B1:A1'), 20)
+
+    def test_partial_multichannel(self):
+        """ Wells that don't fill the pipette stay single-channel. """
+        self.protocol.stamp(
+            'A1', 'B1', ul=20, region=('A1', 'H2'), multichannel=True
+        )
+        self.protocol.stamp(
+            'A1', 'C1', ul=20, region=('A1', 'C1'), multichannel=True
+        )
+        stamped, partial = self.expanded()
+        self.assertEqual([t['tool'] for t in stamped], ['p200.8'] * 2)
+        self.assertEqual([t['tool'] for t in partial], ['p200'] * 3)
+
+    def test_region(self):
+        self.protocol.stamp('Samples', 'B1', ul=20, region=('B2', 'A1'))
+        self.assertEqual(self.protocol.commands[0]['region'],
+                         ((1, 1), (0, 0)))
+        starts = [t['start'][1] for t in self.expanded()[0]]
+        self.assertEqual(starts, [(0, 0), (1, 0), (0, 1), (1, 1)])
+        with self.assertRaises(x.SlotMissing):
+            self.protocol.stamp('Samples', 'B1', ul=20, region=('A1', 'I1'))
+        with self.assertRaises(ValueError):
+            self.protocol.stamp('Samples', 'B1', ul=20, region=('A1',))
+        self.assertEqual(len(self.protocol.commands), 1)
+
+    def test_missing_container(self):
+        with self.assertRaises(x.ContainerMissing):
+            self.protocol.stamp('Samples', 'Nothing', ul=20)
+        with self.assertRaises(x.ContainerMissing):
+            self.protocol.stamp('Samples', 'A3', ul=20)
+        self.assertEqual(self.protocol.commands, [])
+
+    def test_replicate(self):
+        self.protocol.replicate('Samples:C', 'B1', 'C1', ul=20, to_column='D')
+        command = self.protocol.commands[0]
+        self.assertEqual(command['source'], (0, 0))
+        self.assertEqual(command['column'], 2)
+        self.assertEqual(command['plates'], [(1, 0), (2, 0)])
+        self.assertEqual(command['to_column'], 3)
+        self.assertEqual(len(self.expanded()[0]), 24)
+        self.protocol.run_all()
+        context = self.protocol._context_handler
+        self.assertEqual(context.get_volume('B1:D12'), 20)
+        self.assertEqual(context.get_volume('C1:D1'), 20)
+        self.assertEqual(context.get_volume('A1:C1'), -40)
+
+    def test_replicate_errors(self):
+        with self.assertRaises(ValueError):
+            self.protocol.replicate('Samples', 'B1', ul=20)
+        with self.assertRaises(x.SlotMissing):
+            self.protocol.replicate('Samples:I', 'B1', ul=20)
+        with self.assertRaises(x.SlotMissing):
+            self.protocol.replicate('Samples:A', 'B1', ul=20, to_column='I')
+        with self.assertRaises(x.ContainerMissing):
+            self.protocol.replicate('Samples:A', ul=20)
+
+    def test_json(self):
+        self.protocol.stamp('Samples', 'B1', ul=20, region=('A1', 'H6'))
+        self.protocol.replicate('Samples:A', 'B1', 'C1', ul=20,
+                                multichannel=True)
+        out = self.protocol.export(JSONFormatter)
+        self.assertIn('"region": [\n                "A1",\n', out)
+        loaded = JSONLoader(out).protocol
+        self.assertEqual(loaded.commands, self.protocol.commands)
+
+    def test_optimize_layout(self):
+        self.protocol.stamp('Samples', 'C1', ul=20)
+        self.protocol.replicate('Samples:A', 'B1', ul=20)
+        report = self.protocol.optimize_layout(fixed=['A1'])
+        moved = report.protocol.commands
+        self.assertEqual(moved[0]['source'], (0, 0))
+        self.assertEqual(
+            moved[0]['destination'], report.mapping[(2, 0)]
+        )
+        self.assertEqual(moved[1]['plates'], [report.mapping[(1, 0)]])
@@ -1,8 +1,39 @@
+import asyncio
 import unittest
 from labsuite.protocol import Protocol
 from labsuite.protocol.formatters import JSONFormatter
+from labsuite.protocol.handlers import ProtocolHandler
 from labsuite.util import exceptions as x
 
+
+class Recorder(ProtocolHandler):
+
+    calls = None  # Shared by every Recorder a test attaches.
+
+    def record(self, call):
+        self.calls.append('{}.{}'.format(type(self).__name__, call))
+
+    def before_each(self):
+        self.record('before_each')
+
+    def after_each(self):
+        self.record('after_each')
+
+    def teardown(self):
+        self.record('teardown')
+
+    def transfer(self, **kwargs):
+        self.record('transfer')
+
+
+class First(Recorder):
+    pass
+
+
+class Second(Recorder):
+    pass
+
+
 class ProtocolTest(unittest.TestCase):
 
     def setUp(self):
@@ -41,6 +72,10 @@ class ProtocolTest(unittest.TestCase):
         sA1 = self.protocol.humanize_address(('STUFF', 'A1'))
         self.assertEqual(lA1, 'LaBeL:A1')
         self.assertEqual(sA1, 'stuff:A1')
+        self.protocol.add_container("B1", 'microplate.96')
+        self.assertEqual(
+            self.protocol.humanize_address(((1, 0), (1, 2))), 'B1:B3'
+        )
 
     def test_transfer(self):
         """ Basic transfer. """
@@ -663,3 +698,109 @@ class ProtocolTest(unittest.TestCase):
 
         with self.assertRaises(x.ContainerConflict):
             p1 + p2
+
+
+class CustomContainerTest(unittest.TestCase):
+
+    def build(self, spacing):
+        protocol = Protocol()
+        protocol.add_custom_container(
+            {'type': 'microplate', 'rows': 6, 'cols': 4, 'spacing': spacing},
+            name='spaced'
+        )
+        protocol.add_instrument('B', 'p200')
+        protocol.add_container('A1', 'microplate.spaced')
+        protocol.add_container('B1', 'tiprack.p200')
+        protocol.add_container('C1', 'point.trash')
+        protocol.calibrate('A1', x=0, y=0, top=0, bottom=10)
+        protocol.calibrate('B1', x=100, y=0, top=0)
+        protocol.calibrate('C1', x=200, y=0, top=0)
+        protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        for n in range(1, 4):
+            protocol.transfer('A1:A1', 'A1:B{}'.format(n), ul=100)
+        return protocol
+
+    def moves(self, spacing):
+        program = self.build(spacing).compile_ir()
+        return [program[i] for i in range(len(program))]
+
+    def test_per_protocol(self):
+        self.assertNotEqual(self.moves(5), self.moves(20))
+        with self.assertRaises(KeyError):
+            Protocol().add_container('A1', 'microplate.spaced')
+
+    def test_threads(self):
+        """ Protocols can be compiled concurrently. """
+        from concurrent.futures import ThreadPoolExecutor
+        spacings = [5, 10, 20, 40] * 4
+        expected = [self.moves(s) for s in spacings]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            found = list(pool.map(self.moves, spacings))
+        self.assertEqual(found, expected)
+
+
+class RunTest(unittest.TestCase):
+
+    def setUp(self):
+        Recorder.calls = []
+        self.calls = Recorder.calls
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'microplate.96')
+
+    def test_handler_order(self):
+        """ Each handler runs a whole command before the next does. """
+        self.protocol.attach_handler(First)
+        self.protocol.attach_handler(Second)
+        self.protocol.transfer('A1:A1', 'B1:A1', ul=50)
+        self.protocol.run_all()
+        self.assertEqual(self.calls, [
+            'First.before_each', 'First.transfer', 'First.after_each',
+            'Second.before_each', 'Second.transfer', 'Second.after_each',
+            'First.teardown', 'Second.teardown'
+        ])
+
+    def test_plate_command_order(self):
+        """
+        A plate command is one command to each handler, so before_each and
+        after_each wrap each handler's transfers.
+        """
+        self.protocol.attach_handler(First)
+        self.protocol.attach_handler(Second)
+        self.protocol.stamp('A1', 'B1', ul=50, region=['A1', 'B1'])
+        self.protocol.run_all()
+        self.assertEqual(self.calls, [
+            'First.before_each', 'First.transfer',
+            'Second.before_each', 'Second.transfer',
+            'First.transfer', 'First.after_each',
+            'Second.transfer', 'Second.after_each',
+            'First.teardown', 'Second.teardown'
+        ])
+
+    def test_empty_teardown(self):
+        """ Handlers tear down after a run with no commands. """
+        self.protocol.attach_handler(First)
+        self.assertEqual(list(self.protocol.run()), [(0, 0)])
+        self.assertEqual(self.calls, ['First.teardown'])
+        del self.calls[:]
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.protocol.run_all_async())
+        finally:
+            loop.close()
+        self.assertEqual(self.calls, ['First.teardown'])
+
+    def test_failure_teardown(self):
+        """ Handlers tear down when a command fails. """
+        class Failing(First):
+            def transfer(self, **kwargs):
+                raise ValueError("Stalled.")
+        self.protocol.attach_handler(Failing)
+        self.protocol.transfer('A1:A1', 'B1:A1', ul=50)
+        self.protocol.transfer('A1:A2', 'B1:A2', ul=50)
+        with self.assertRaises(ValueError):
+            self.protocol.run_all()
+        self.assertEqual(
+            self.calls, ['Failing.before_each', 'Failing.teardown']
+        )
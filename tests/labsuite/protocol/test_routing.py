@@ -0,0 +1,177 @@
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol.optimizers.routing import Tour, distance
+
+
+class TourTest(unittest.TestCase):
+
+    def test_nearest_neighbour(self):
+        stops = [((0, 0), (0, 0)), ((10, 0), (10, 0)), ((1, 0), (1, 0))]
+        tour = Tour(stops, [set(), set(), set()])
+        self.assertEqual(tour.nearest_neighbour(), [0, 2, 1])
+        self.assertEqual(tour.cost([0, 1, 2]), 19)
+        self.assertEqual(tour.cost([0, 2, 1]), 10)
+
+    def test_dependencies(self):
+        """ Stops with dependencies keep their relative order. """
+        stops = [((0, 0), (0, 0)), ((10, 0), (10, 0)), ((1, 0), (1, 0))]
+        tour = Tour(stops, [set(), {2}, set()])
+        order = tour.two_opt(tour.nearest_neighbour())
+        self.assertTrue(order.index(1) < order.index(2))
+
+    def test_two_opt(self):
+        """ 2-opt uncrosses a path. """
+        points = [(0, 0), (10, 10), (10, 0), (0, 10)]
+        stops = [(p, p) for p in points]
+        tour = Tour(stops, [set()] * 4)
+        order = tour.two_opt([0, 1, 2, 3])
+        self.assertTrue(tour.cost(order) < tour.cost([0, 1, 2, 3]))
+
+    def test_capacity(self):
+        """ The path goes back to the first point for each refill. """
+        stops = [((10, 0), (10, 0)), ((20, 0), (20, 0)), ((30, 0), (30, 0))]
+        tour = Tour(stops, [set()] * 3, first=(0, 0), trash=(100, 0))
+        tour.volumes = [100, 100, 100]
+        tour.capacity = 200
+        self.assertEqual(tour.fills([0, 1, 2]), [[0, 1], [2]])
+        self.assertEqual(tour.cost([0, 1, 2]), 20 + 20 + 30 + 70)
+        tour.new_tips = True
+        self.assertEqual(tour.cost([0, 1, 2]), 100 + 100)
+
+    def test_capacity_scales(self):
+        """
+        A 2-opt pass with a capacity only looks within each pipette-full,
+        so its work grows with the number of stops, not their cube.
+        """
+        for n in (100, 1000):
+            stops = [((i * 7 % 100, i * 13 % 100),) * 2 for i in range(n)]
+            tour = Tour(stops, [set()] * n, first=(0, 0), trash=(500, 0))
+            tour.volumes = [20] * n
+            tour.capacity = 200
+            links = []
+            link = tour.link
+            tour.link = lambda a, b: links.append((a, b)) or link(a, b)
+            order = tour.two_opt(list(range(n)), max_passes=1)
+            self.assertLess(len(links), 30 * n)
+            self.assertEqual(
+                [set(f) for f in tour.fills(order)],
+                [set(range(i, i + 10)) for i in range(0, n, 10)]
+            )
+
+
+class RoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'microplate.96')
+        self.protocol.add_container('C1', 'tiprack.p200')
+        self.protocol.add_container('D1', 'point.trash')
+        self.protocol.calibrate('A1', x=10, y=10, top=40, bottom=50)
+        self.protocol.calibrate('B1', x=150, y=10, top=40, bottom=50)
+        self.protocol.calibrate('C1', x=10, y=200, top=40)
+        self.protocol.calibrate('D1', x=300, y=300, top=20)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+
+    def travel(self, protocol):
+        """
+        Returns the x/y distance moved in a run, leaving out trips to the
+        tiprack.
+        """
+        motor = protocol.attach_motor()
+        protocol.run_all()
+        protocol._handlers.remove(motor)
+        context = protocol._context_handler
+        rack = context._deck.slot((2, 0))
+        tips = set()
+        for col in range(rack.cols):
+            for row in range(rack.rows):
+                coords = context.get_coordinates(
+                    ((2, 0), (col, row)), axis='B'
+                )
+                tips.add((coords['x'], coords['y']))
+        total = 0.0
+        here = None
+        for move in motor._driver.movements:
+            if 'x' not in move:
+                continue
+            point = (move['x'], move['y'])
+            if point in tips:
+                here = None
+                continue
+            if here is not None:
+                total += distance(here, point)
+            here = point
+        return total
+
+    def test_distribute(self):
+        wells = ['B1:A1', 'B1:H12', 'B1:A2', 'B1:H11', 'B1:A3']
+        self.protocol.distribute('A1:A1', *wells, ul=20, multi=True)
+        report = self.protocol.optimize_routes()
+        self.assertTrue(report.after < report.before)
+        self.assertEqual(report.saved, report.before - report.after)
+        transfers = self.protocol._commands[0]['transfers']
+        order = [t['end'] for t in transfers]
+        expected = ['B1:A1', 'B1:A2', 'B1:A3', 'B1:H11', 'B1:H12']
+        self.assertEqual(
+            order,
+            [self.protocol._normalize_address(w) for w in expected]
+        )
+
+    def test_liquid_dependency(self):
+        """ A well that's written to is only read from afterwards. """
+        self.protocol.transfer_group(
+            ('A1:A1', 'B1:H12'),
+            ('A1:A2', 'A1:H1'),
+            ('B1:H12', 'A1:A3'),
+            ul=20
+        )
+        self.protocol.optimize_routes()
+        transfers = self.protocol._commands[0]['transfers']
+        starts = [t['start'] for t in transfers]
+        ends = [t['end'] for t in transfers]
+        well = self.protocol._normalize_address('B1:H12')
+        self.assertTrue(ends.index(well) < starts.index(well))
+
+    def test_nothing_to_route(self):
+        """ Transfers that each make their own trip are left alone. """
+        self.protocol.transfer('A1:A1', 'B1:A1', ul=20)
+        wells = ['B1:A1', 'B1:H12', 'B1:A2', 'B1:H11', 'B1:A3']
+        self.protocol.distribute('A1:A1', *wells, ul=20)
+        self.protocol.consolidate('A1:A1', *wells, ul=20)
+        commands = self.protocol.commands
+        report = self.protocol.optimize_routes()
+        self.assertEqual(report.commands, [])
+        self.assertEqual(self.protocol.commands, commands)
+
+    def test_liquids_retracked(self):
+        """ The context is rebuilt for the new order. """
+        wells = ['B1:A1', 'B1:H12', 'B1:A2']
+        self.protocol.distribute('A1:A1', *wells, ul=20, multi=True)
+        self.protocol.optimize_routes()
+        context = self.protocol._context_handler
+        self.assertEqual(context.get_volume('B1:H12'), 20)
+        self.assertEqual(context.get_volume('A1:A1'), -60)
+
+    def test_matches_movement(self):
+        """ The reported travel is what the robot moves. """
+        wells = ['B1:A1', 'B1:H12', 'B1:A2', 'B1:H11', 'B1:A3', 'B1:H10']
+        self.protocol.add_ingredient('A1:A1', 'water', ul=1000)
+        self.protocol.add_ingredient('A1:B1', 'buffer', ul=1000)
+        self.protocol.distribute('A1:A1', *wells, ul=80, multi=True)
+        self.protocol.consolidate('A1:B1', *wells, ul=70, multi=True)
+        self.protocol.transfer_group(
+            ('A1:A1', 'B1:H9'), ('A1:H1', 'B1:A9'), ('A1:A2', 'B1:H8'),
+            ul=20
+        )
+        # The wells hold water and buffer, so each pipette-full of the
+        # consolidate takes a new tip.
+        self.protocol.consolidate('A1:A12', 'B1:H12', 'B1:A1', 'A1:B1',
+                                  ul=150, multi=True)
+        before = self.travel(self.protocol)
+        report = self.protocol.optimize_routes()
+        after = self.travel(self.protocol)
+        self.assertTrue(report.saved > 0)
+        self.assertAlmostEqual(report.before, before)
+        self.assertAlmostEqual(report.after, after)
@@ -0,0 +1,137 @@
+import json
+import unittest
+from labsuite.protocol import Protocol
+from labsuite.protocol.handlers.tips import TipTracker
+from labsuite.protocol.formatters import JSONFormatter
+from labsuite.protocol.formatters.json import JSONLoader
+
+
+class TipTrackerTest(unittest.TestCase):
+
+    def test_always(self):
+        tips = TipTracker()
+        self.assertEqual(tips.use('B', 'src', None), (False, True))
+        self.assertTrue(tips.release('B'))
+        self.assertEqual(tips.use('B', 'src', None), (False, True))
+
+    def test_per_source(self):
+        tips = TipTracker('per-source')
+        self.assertEqual(tips.use('B', 'a', None), (False, True))
+        self.assertFalse(tips.release('B'))
+        self.assertEqual(tips.use('B', 'a', None), (False, False))
+        self.assertEqual(tips.use('B', 'b', None), (True, True))
+
+    def test_per_liquid(self):
+        tips = TipTracker('per-liquid')
+        water = frozenset(['water'])
+        tips.use('B', 'a', water)
+        tips.touch('B', water)
+        self.assertTrue(tips.can_reuse('B', 'b', water))
+        self.assertFalse(tips.can_reuse('B', 'b', frozenset(['buffer'])))
+        self.assertFalse(tips.can_reuse('B', 'b', None))
+        tips.touch('B', None)  # Went into something unknown.
+        self.assertFalse(tips.can_reuse('B', 'b', water))
+
+    def test_never(self):
+        tips = TipTracker('never')
+        tips.use('B', 'a', None)
+        self.assertEqual(tips.use('B', 'b', None), (False, False))
+        self.assertEqual(tips.held(), ['B'])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            TipTracker('sometimes')
+
+
+class TipPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = Protocol()
+        self.protocol.add_instrument('B', 'p200')
+        self.protocol.add_container('A1', 'microplate.96')
+        self.protocol.add_container('B1', 'tiprack.p200')
+        self.protocol.add_container('C1', 'point.trash')
+        self.protocol.calibrate('A1', x=1, y=2, top=3, bottom=13)
+        self.protocol.calibrate('B1', x=100, y=100, top=50)
+        self.protocol.calibrate('C1', x=200, y=250, top=15)
+        self.protocol.calibrate_instrument('B', top=0, blowout=10, droptip=25)
+        self.protocol.add_ingredient('A1:A1', 'water', ul=100)
+        self.protocol.add_ingredient('A1:B1', 'water')
+        self.protocol.add_ingredient('A1:C1', 'buffer')
+        self.protocol.transfer('A1:A1', 'A1:A2', ul=20)
+        self.protocol.transfer('A1:A1', 'A1:A3', ul=20)
+        self.protocol.transfer('A1:B1', 'A1:A4', ul=20)
+        self.protocol.transfer('A1:C1', 'A1:A5', ul=20)
+
+    def count_tips(self, policy):
+        """
+        Returns the tips picked up and dropped by a run, and the tips the
+        requirements counted.
+        """
+        self.protocol.set_tip_policy(policy)
+        motor = self.protocol.attach_motor()
+        self.protocol.run_all()
+        self.protocol._handlers.remove(motor)
+        moves = motor._driver.movements
+        picked = len([m for m in moves if m.get('x') == 100])
+        dropped = moves.count({'x': 200, 'y': 250})
+        self.protocol.run_requirements
+        rack = self.protocol._context_handler._deck.slot('B1')
+        return picked, dropped, rack.tips_used
+
+    def test_policies(self):
+        self.assertEqual(self.count_tips('always'), (4, 4, 4))
+        self.assertEqual(self.count_tips('per-source'), (3, 3, 3))
+        self.assertEqual(self.count_tips('never'), (1, 1, 1))
+
+    def test_per_liquid(self):
+        self.assertEqual(self.count_tips('per-liquid'), (2, 2, 2))
+
+    def test_drained_source(self):
+        """ Drawing a well dry doesn't change the tips used. """
+        for ul in [60, 50]:
+            self.setUp()
+            self.protocol.transfer('A1:A1', 'A1:A6', ul=ul)
+            self.protocol.transfer('A1:B1', 'A1:A7', ul=20)
+            self.assertEqual(self.count_tips('per-liquid'), (3, 3, 3), ul)
+
+    def test_unnamed_liquids(self):
+        """ Tips are never reused for liquids that weren't named. """
+        self.protocol._ingredients = {}
+        self.assertEqual(self.count_tips('per-liquid'), (4, 4, 4))
+
+    def test_ingredients(self):
+        context = self.protocol._context_handler
+        self.assertEqual(context.get_volume('A1:A1'), 60)
+        self.assertEqual(context.get_volume('A1:B1'), -20)
+        b1 = self.protocol._normalize_address('A1:B1')
+        self.assertEqual(context.get_liquids(b1), frozenset(['water']))
+
+    def test_hash_and_export(self):
+        before = self.protocol.hash
+        self.protocol.set_tip_policy('always')
+        self.assertEqual(self.protocol.hash, before)
+        self.protocol.set_tip_policy('per-source')
+        self.assertNotEqual(self.protocol.hash, before)
+        out = json.loads(JSONFormatter(self.protocol).export())
+        self.assertEqual(out['tip_policy'], 'per-source')
+        out['instructions'] = []
+        loaded = JSONLoader(json.dumps(out)).protocol
+        self.assertEqual(loaded.tip_policy, 'per-source')
+
+    def test_ingredients_round_trip(self):
+        """ Ingredients survive export and combining protocols. """
+        self.protocol.set_tip_policy('per-liquid')
+        tips = self.protocol.bill_of_materials().pickups
+        out = JSONFormatter(self.protocol).export()
+        self.assertEqual(json.loads(out)['ingredients'][0], {
+            'address': 'A1:A1', 'name': 'water', 'volume': 100
+        })
+        loaded = JSONLoader(out).protocol
+        self.assertEqual(loaded._ingredients, self.protocol._ingredients)
+        self.assertEqual(loaded.hash, self.protocol.hash)
+        self.assertEqual(loaded.bill_of_materials().pickups, tips)
+        combined = Protocol() + self.protocol
+        self.assertEqual(combined._ingredients, self.protocol._ingredients)
+        self.assertEqual(combined.hash, self.protocol.hash)
+        self.assertEqual(combined.bill_of_materials().pickups, tips)
@@ -0,0 +1,40 @@
+import unittest
+from labsuite.util import profiling
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:        85 |        205 | labsuite
+import time:       310 |        310 |       labsuite.util.log
+import time:       602 |        912 |     labsuite.util
+Traceback lines and other noise are skipped.
+"""
+
+
+class ImportTimeParsingTest(unittest.TestCase):
+
+    def test_parse(self):
+        times = profiling.parse_importtime(SAMPLE)
+        self.assertEqual(
+            [t.module for t in times],
+            ['_io', 'labsuite', 'labsuite.util.log', 'labsuite.util']
+        )
+        log = times[2]
+        self.assertEqual((log.self_us, log.cumulative_us), (310, 310))
+        self.assertEqual([t.depth for t in times], [1, 0, 3, 2])
+
+
+class StartupTest(unittest.TestCase):
+
+    """ Guards against heavy modules creeping back into startup. """
+
+    def test_lazy_imports(self):
+        _, modules = profiling.run_startup()
+        self.assertIn('labsuite.protocol.protocol', modules)
+        for name in ['asyncio', 'serial', 'yaml', 'logging', 'pickle']:
+            self.assertNotIn(name, modules)
+
+    def test_import_times(self):
+        times = profiling.import_times('labsuite.util.log', repeat=1)
+        self.assertIn('labsuite.util.log', times)
+        self.assertGreater(times['labsuite.util.log'].cumulative_us, 0)